@@ -0,0 +1,7 @@
+# gunicorn.conf.py - подхватывается gunicorn автоматически из рабочей директории (/app/rbdnti)
+
+
+def worker_exit(server, worker):
+    """Сбросить буфер статистики просмотров перед завершением воркера"""
+    from news_site.tracking import tracker
+    tracker.shutdown()
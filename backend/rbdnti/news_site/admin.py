@@ -1,17 +1,29 @@
+import os
+import re
+
 from django import forms
 from django.contrib import admin, messages
-from django.urls import path
+from django.contrib.admin.views.main import ChangeList
+from django.urls import path, reverse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils.html import format_html
 from django.http import JsonResponse
+from django.db.models import Count
+
+from .models import ChunkedUpload, News, NewsFile, Section, Category, DownloadStatistic, Subdivision, TickerQuote
+from .bulkimport import import_quotes
+from .quotes import invalidate_quotes
+from . import ingest, uploads
 
-from .models import News, NewsFile, Section, Category, DownloadStatistic, Subdivision, TickerQuote
+# Content-Range части при загрузке частями: bytes <начало>-<конец>/<размер>
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
 
 @admin.register(Subdivision)
 class SubdivisionAdmin(admin.ModelAdmin):
     list_display = ('name', 'order')
     list_editable = ('order',)
-    search_fields = ('name',)
+    # ncontains - поиск по нормализованной копии, находит кириллицу без учета регистра
+    search_fields = ('name_normalized__ncontains',)
 
 class NewsFileInline(admin.TabularInline):
     model = NewsFile
@@ -21,16 +33,29 @@ class NewsFileInline(admin.TabularInline):
     
     def download_link(self, obj):
         if obj.file:
-            return format_html('<a href="{}" download>📥 Скачать</a>', obj.file.url)
+            return format_html('<a href="{}" download>📥 Скачать</a>', admin_download_url(obj))
         return "-"
     
     download_link.short_description = "Скачать"
 
+def admin_download_url(news_file):
+    # /media/news_files/ закрыт в nginx: файл отдает tracked_download, без учета скачивания
+    return reverse('news_site:tracked_download', args=[news_file.id]) + '?untracked=1'
+
+
+class NewsChangeList(ChangeList):
+    def get_queryset(self, request, exclude_parameters=None):
+        # Число файлов считается в том же запросе, а не по запросу на строку.
+        # Только в списке: форме и удалению GROUP BY не нужен
+        return super().get_queryset(request, exclude_parameters).annotate(files_total=Count('files'))
+
+
 @admin.register(News)
 class NewsAdmin(admin.ModelAdmin):
     list_display = ('title', 'section', 'category', 'subdivision', 'author', 'order', 'created_at', 'files_count')
+    list_select_related = ('section', 'category', 'subdivision', 'author')
     list_filter = ('section', 'category', 'subdivision', 'author', 'created_at')
-    search_fields = ('title', 'content')
+    search_fields = ('title_normalized__ncontains', 'content')
     list_editable = ('order',)
     inlines = [NewsFileInline]
     
@@ -43,10 +68,14 @@ class NewsAdmin(admin.ModelAdmin):
             obj.author = request.user
         super().save_model(request, obj, form, change)
 
+    def get_changelist(self, request, **kwargs):
+        return NewsChangeList
+
     def files_count(self, obj):
-        return obj.files.count()
+        return obj.files_total
     
     files_count.short_description = "Файлов"
+    files_count.admin_order_field = 'files_total'
 
     def get_urls(self):
         urls = super().get_urls()
@@ -56,6 +85,16 @@ class NewsAdmin(admin.ModelAdmin):
                 self.admin_site.admin_view(self.upload_files_view),
                 name='news_upload_files',
             ),
+            path(
+                '<int:news_id>/upload-chunked/',
+                self.admin_site.admin_view(self.chunked_upload_start),
+                name='news_chunked_upload_start',
+            ),
+            path(
+                'chunked-upload/<uuid:upload_id>/',
+                self.admin_site.admin_view(self.chunked_upload_view),
+                name='news_chunked_upload',
+            ),
             path(
                 'get-categories/',
                 self.admin_site.admin_view(self.get_categories),
@@ -66,50 +105,151 @@ class NewsAdmin(admin.ModelAdmin):
 
     def upload_files_view(self, request, news_id):
         news = get_object_or_404(News, id=news_id)
+        report = None
 
         if request.method == 'POST':
             files = request.FILES.getlist('files')
-            if files:
-                uploaded_count = 0
-                for f in files:
-                    NewsFile.objects.create(news=news, file=f, filename=f.name)
-                    uploaded_count += 1
-                
+            archive = request.FILES.get('archive')
+            staging_dir = request.POST.get('staging_dir', '').strip()
+            try:
+                if archive:
+                    entries = ingest.zip_entries(archive)
+                elif staging_dir:
+                    entries = ingest.directory_entries(ingest.resolve_staging_dir(staging_dir))
+                elif files:
+                    entries = ingest.uploaded_entries(files)
+                else:
+                    self.message_user(request, "Файлы не были выбраны", messages.WARNING)
+                    return redirect(f'/admin/news_site/news/{news_id}/change/')
+                report = ingest.ingest(news, entries)
+            except ingest.IngestError as e:
+                self.message_user(request, str(e), messages.ERROR)
+                return redirect(request.path)
+
+            uploaded_count = sum(result.imported for result in report)
+            skipped_count = len(report) - uploaded_count
+            if skipped_count:
+                self.message_user(
+                    request,
+                    f"Загружено файлов: {uploaded_count}, пропущено: {skipped_count}",
+                    messages.WARNING
+                )
+            else:
                 self.message_user(
                     request, 
                     f"Успешно загружено файлов: {uploaded_count}", 
                     messages.SUCCESS
                 )
-            else:
-                self.message_user(request, "Файлы не были выбраны", messages.WARNING)
-                
-            return redirect(f'/admin/news_site/news/{news_id}/change/')
+            # Отчет показываем для архива и каталога или если что-то пропущено
+            if files and not skipped_count:
+                return redirect(f'/admin/news_site/news/{news_id}/change/')
 
         context = {
             'opts': self.model._meta,
             'news': news,
             'title': f"Массовая загрузка файлов для: {news.title}",
+            'report': report,
+            'staging_root': ingest.get_staging_root(),
+            'staging_dirs': self._staging_dirs(),
         }
         return render(request, 'admin/news_site/multi_upload.html', context)
 
+    def _staging_dirs(self):
+        """Подкаталоги UPLOAD_STAGING_DIR для выбора в форме"""
+        try:
+            with os.scandir(ingest.get_staging_root()) as it:
+                return sorted(entry.name for entry in it if entry.is_dir() and not entry.name.startswith('.'))
+        except OSError:
+            return []
+
+    def chunked_upload_start(self, request, news_id):
+        """POST filename, size -> загрузка частями (новая или для докачки)"""
+        news = get_object_or_404(News, id=news_id)
+        if request.method != 'POST':
+            return JsonResponse({'error': "Метод не поддерживается"}, status=405)
+        if not self.has_change_permission(request, news):
+            return JsonResponse({'error': "Нет прав на изменение новости"}, status=403)
+        try:
+            size = int(request.POST.get('size', ''))
+            upload = uploads.start(news, request.POST.get('filename'), size, request.user)
+        except ValueError:
+            return JsonResponse({'error': "Некорректный размер файла"}, status=400)
+        except uploads.UploadError as e:
+            return JsonResponse({'error': str(e)}, status=e.status)
+
+        data = self._chunked_upload_state(upload)
+        if upload.size == 0:
+            # Пустому файлу нечего докачивать
+            uploads.finish(upload)
+            data['complete'] = True
+        return JsonResponse(data)
+
+    def chunked_upload_view(self, request, upload_id):
+        """GET - принятый offset, PUT - очередная часть, DELETE - отмена"""
+        upload = get_object_or_404(ChunkedUpload, upload_id=upload_id, user=request.user)
+
+        if request.method == 'GET':
+            return JsonResponse(self._chunked_upload_state(upload))
+        if request.method == 'DELETE':
+            uploads.cancel(upload)
+            return JsonResponse({'cancelled': True})
+        if request.method != 'PUT':
+            return JsonResponse({'error': "Метод не поддерживается"}, status=405)
+
+        match = CONTENT_RANGE_RE.match(request.headers.get('Content-Range', ''))
+        if not match:
+            return JsonResponse({'error': "Нужен заголовок Content-Range"}, status=400)
+        start, end, total = map(int, match.groups())
+        length = end - start + 1
+        if total != upload.size or request.headers.get('Content-Length') != str(length):
+            return JsonResponse({'error': "Content-Range не совпадает с загрузкой"}, status=400)
+        chunk_crc = request.headers.get('X-Chunk-CRC32')
+        if chunk_crc is not None:
+            if not chunk_crc.isdigit():
+                return JsonResponse({'error': "Некорректный X-Chunk-CRC32"}, status=400)
+            chunk_crc = int(chunk_crc)
+
+        try:
+            news_file = uploads.write_chunk(upload, request, start, length, chunk_crc=chunk_crc)
+        except uploads.UploadError as e:
+            return JsonResponse({'error': str(e), 'offset': e.offset}, status=e.status)
+
+        data = self._chunked_upload_state(upload)
+        if news_file is not None:
+            data.update(complete=True, file_id=news_file.id)
+        return JsonResponse(data)
+
+    def _chunked_upload_state(self, upload):
+        return {
+            'upload_id': str(upload.upload_id),
+            'url': reverse('admin:news_chunked_upload', args=[upload.upload_id]),
+            'offset': upload.offset,
+            'size': upload.size,
+            'checksum': upload.checksum,
+            'chunk_size': uploads.get_chunk_size(),
+            'complete': False,
+        }
+
     def get_categories(self, request):
         section_id = request.GET.get('section_id')
         if section_id:
             # ✅ ИСПРАВЛЕНО: Фильтруем категории по выбранному разделу
-            categories = Category.objects.filter(section_id=section_id)
-            results = [{'id': cat.id, 'title': cat.get_full_path()} for cat in categories]
+            categories = Category.objects.filter(section_id=section_id).values_list('id', 'full_path')
+            results = [{'id': cat_id, 'title': full_path} for cat_id, full_path in categories]
             return JsonResponse({'results': results})
         return JsonResponse({'results': []})
 
 @admin.register(Section)
 class SectionAdmin(admin.ModelAdmin):
     list_display = ('title', 'slug', 'subdivision', 'order')
+    list_select_related = ('subdivision',)
     list_editable = ('order',)
     prepopulated_fields = {'slug': ('title',)}
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ('title', 'section', 'parent', 'subdivision', 'order', 'get_full_path')
+    list_select_related = ('section', 'parent', 'subdivision')
     list_filter = ('section', 'parent', 'subdivision')
     list_editable = ('order',)
     prepopulated_fields = {'slug': ('title',)}
@@ -142,20 +282,21 @@ class CategoryAdmin(admin.ModelAdmin):
             if exclude_id:
                 categories = categories.exclude(id=exclude_id)
             
-            results = [{'id': cat.id, 'title': cat.get_full_path()} for cat in categories]
+            results = [{'id': cat_id, 'title': full_path} for cat_id, full_path in categories.values_list('id', 'full_path')]
             return JsonResponse({'results': results})
         return JsonResponse({'results': []})
 
 @admin.register(NewsFile)
 class NewsFileAdmin(admin.ModelAdmin):
     list_display = ('filename', 'news', 'file', 'download_link', 'created_at')
+    list_select_related = ('news',)
     list_filter = ('news__section', 'created_at')
-    search_fields = ('filename', 'news__title')
+    search_fields = ('filename_normalized__ncontains', 'news__title_normalized__ncontains')
     readonly_fields = ('download_link', 'created_at')
     
     def download_link(self, obj):
         if obj.file:
-            return format_html('<a href="{}" download>📥 Скачать</a>', obj.file.url)
+            return format_html('<a href="{}" download>📥 Скачать</a>', admin_download_url(obj))
         return "-"
     
     download_link.short_description = "Скачать"
@@ -163,8 +304,9 @@ class NewsFileAdmin(admin.ModelAdmin):
 @admin.register(DownloadStatistic)
 class DownloadStatisticAdmin(admin.ModelAdmin):
     list_display = ['news_file', 'ip_address', 'downloaded_at']
+    list_select_related = ['news_file']
     list_filter = ['downloaded_at']
-    search_fields = ['news_file__filename', 'ip_address']
+    search_fields = ['news_file__filename_normalized__ncontains', 'ip_address']
 
 
 
@@ -194,24 +336,32 @@ class TickerQuoteAdmin(admin.ModelAdmin):
         txt_file = form.cleaned_data.get('txt_file')
         
         if txt_file:
-            # Удаляем все существующие цитаты
-            TickerQuote.objects.all().delete()
+            # Существующие цитаты заменяются строками файла: файл читается
+            # построчно, вставка пачками в одной транзакции (bulkimport.py)
+            try:
+                total = import_quotes(txt_file)
+            except UnicodeDecodeError:
+                messages.error(request, "Файл должен быть в кодировке UTF-8")
+                return
             
-            # Читаем и парсим файл
-            content = txt_file.read().decode('utf-8').strip()
-            quotes = [line.strip() for line in content.split('\n') if line.strip()]
-            
-            # Создаем новые цитаты
-            for quote in quotes:
-                TickerQuote.objects.create(text=quote)
-            
-            messages.success(request, f"Успешно загружено {len(quotes)} цитат")
+            messages.success(request, f"Успешно загружено {total} цитат")
         else:
             super().save_model(request, obj, form, change)
+        # ⬇️ Воркеры перечитают цитаты для бегущей строки
+        invalidate_quotes()
+    
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        invalidate_quotes()
+    
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        invalidate_quotes()
     
     def delete_all_quotes(self, request, queryset):
         count = TickerQuote.objects.count()
         TickerQuote.objects.all().delete()
+        invalidate_quotes()
         messages.success(request, f"Удалено {count} цитат")
     delete_all_quotes.short_description = "Удалить все цитаты"
     
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class NewsSiteConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'news_site'
+
+    def ready(self):
+        from . import signals  # noqa: F401
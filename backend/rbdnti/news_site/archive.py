@@ -0,0 +1,195 @@
+# archive.py
+"""
+Архив сырой статистики просмотров и скачиваний.
+
+Строки старше окна хранения (STATISTICS_RETENTION_DAYS) выгружаются в
+сжатые CSV по месяцам - data/archive/<источник>/<ГГГГ-ММ>.csv.gz - и
+удаляются из SQLite порциями. Архивируются только строки, уже учтенные
+в агрегатах (DailyStatistic, VisitorSketch), поэтому отчеты по числу
+просмотров/скачиваний и оценка уникальных от архива не зависят; архив
+читается только для точного подсчета уникальных за старые периоды.
+
+Порция сначала дописывается в файл (новым gzip-членом со своей строкой
+заголовка), затем удаляется из базы. Если процесс прервался между этими
+шагами, порция будет записана повторно - следующей в том же файле. При
+чтении повторы отбрасываются по id предыдущей порции: в памяти - id
+одной-двух порций, а не всего файла. Порядок id по всему файлу не гарантирован - запуски
+дописывают файл, а id просмотров не совпадает с порядком их дат.
+"""
+import csv
+import gzip
+import io
+import os
+from datetime import datetime, time as dt_time, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import DownloadStatistic, ViewStatistic
+
+# Источник -> (модель, поле даты, колонки CSV)
+ARCHIVE_SOURCES = {
+    'views': (ViewStatistic, 'created_at', (
+        'id', 'created_at', 'ip_address', 'user_agent', 'path', 'section_id', 'category_id', 'news_id',
+    )),
+    'downloads': (DownloadStatistic, 'downloaded_at', (
+        'id', 'downloaded_at', 'ip_address', 'user_agent', 'news_file_id',
+    )),
+}
+
+
+def get_archive_dir():
+    return getattr(settings, 'STATISTICS_ARCHIVE_DIR', settings.BASE_DIR / 'data' / 'archive')
+
+
+def get_retention_days():
+    return getattr(settings, 'STATISTICS_RETENTION_DAYS', 365)
+
+
+def _partition_path(name, month):
+    return os.path.join(get_archive_dir(), name, f'{month}.csv.gz')
+
+
+def archivable_max_id(name):
+    """Последний id, уже учтенный во всех агрегатах источника"""
+    from .statistics import UNIQUE_SOURCE, get_watermark
+
+    if name == 'views':
+        return min(get_watermark('views'), get_watermark(UNIQUE_SOURCE))
+    return get_watermark(name)
+
+
+def _write_rows(name, columns, rows):
+    """Дописать строки в месячные файлы; rows - словари с ключами columns"""
+    by_month = {}
+    date_field = columns[1]
+    for row in rows:
+        month = timezone.localtime(row[date_field]).strftime('%Y-%m')
+        by_month.setdefault(month, []).append(row)
+
+    for month, month_rows in by_month.items():
+        path = _partition_path(name, month)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='ab') as gz:
+                with io.TextIOWrapper(gz, encoding='utf-8', newline='') as out:
+                    writer = csv.writer(out)
+                    # Заголовок в начале каждой порции - граница для iter_archived
+                    writer.writerow(columns)
+                    for row in month_rows:
+                        writer.writerow([
+                            row[column].isoformat() if column == date_field else
+                            ('' if row[column] is None else row[column])
+                            for column in columns
+                        ])
+            raw.flush()
+            os.fsync(raw.fileno())
+
+
+def archive_source(name, days=None, chunk_size=5000, dry_run=False):
+    """
+    Выгрузить в архив и удалить строки источника name старше days дней.
+    Возвращает (архивировано строк, пропущено старых, но еще не агрегированных).
+    """
+    model, date_field, columns = ARCHIVE_SOURCES[name]
+    days = get_retention_days() if days is None else days
+    cutoff = timezone.make_aware(datetime.combine(timezone.localdate() - timedelta(days=days), dt_time.min))
+    max_id = archivable_max_id(name)
+    old = model.objects.filter(**{f'{date_field}__lt': cutoff})
+
+    pending = old.filter(id__gt=max_id).count()
+    if dry_run:
+        return old.filter(id__lte=max_id).count(), pending
+
+    archived = 0
+    last_id = 0
+    while True:
+        rows = list(
+            old.filter(id__gt=last_id, id__lte=max_id).order_by('id').values(*columns)[:chunk_size]
+        )
+        if not rows:
+            break
+        _write_rows(name, columns, rows)
+        first, last_id = rows[0]['id'], rows[-1]['id']
+        with transaction.atomic():
+            # Тот же фильтр в диапазоне id порции - ровно записанные строки.
+            # Ни сигналов, ни ссылок на модель: delete() - один DELETE без выборки
+            old.filter(id__gte=first, id__lte=last_id).delete()
+        archived += len(rows)
+    return archived, pending
+
+
+def vacuum(mode):
+    """'full' - VACUUM (переписывает файл БД), 'incremental' - PRAGMA incremental_vacuum"""
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        if mode == 'incremental':
+            cursor.execute('PRAGMA auto_vacuum')
+            if cursor.fetchone()[0] != 2:
+                return False
+            cursor.execute('PRAGMA incremental_vacuum')
+        else:
+            cursor.execute('VACUUM')
+    return True
+
+
+def _partition_months(start_date, end_date):
+    directory = get_archive_dir()
+    names = []
+    for source in ARCHIVE_SOURCES:
+        source_dir = os.path.join(directory, source)
+        if os.path.isdir(source_dir):
+            names.extend(
+                (source, entry.name[:7]) for entry in os.scandir(source_dir) if entry.name.endswith('.csv.gz')
+            )
+    lo = start_date.strftime('%Y-%m') if start_date else None
+    hi = end_date.strftime('%Y-%m') if end_date else None
+    return [(source, month) for source, month in sorted(names)
+            if (lo is None or month >= lo) and (hi is None or month <= hi)]
+
+
+def has_partitions(name, start_date=None, end_date=None):
+    return any(source == name for source, _ in _partition_months(start_date, end_date))
+
+
+def iter_archived(name, start_date=None, end_date=None):
+    """
+    Потоково читать архивные строки источника за период [start_date, end_date]
+    (даты включительно, как в statistics.py). Строки - словари строк CSV.
+    """
+    date_field = ARCHIVE_SOURCES[name][1]
+    start = _aware(start_date)
+    end = _aware(end_date + timedelta(days=1)) if end_date else None
+    for source, month in _partition_months(start_date, end_date):
+        if source != name:
+            continue
+        # Повтор прерванной выгрузки - всегда следующая порция после исходной,
+        # поэтому сверяем id только с предыдущей порцией (и с текущей)
+        previous, current, is_retry = set(), set(), False
+        with gzip.open(_partition_path(name, month), 'rt', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                if row['id'] == 'id':
+                    # Заголовок следующей порции. Повтор мог быть короче исходной
+                    # порции (другой --chunk-size) - тогда помним обе
+                    previous = previous | current if is_retry else current
+                    current, is_retry = set(), False
+                    continue
+                row_id = int(row['id'])
+                if row_id in previous or row_id in current:
+                    is_retry = True
+                    continue
+                current.add(row_id)
+                moment = datetime.fromisoformat(row[date_field])
+                if (start and moment < start) or (end and moment >= end):
+                    continue
+                yield row
+
+
+def _aware(value):
+    if value is None:
+        return None
+    if timezone.is_naive(value):
+        return timezone.make_aware(value)
+    return value
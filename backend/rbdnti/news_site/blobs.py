@@ -0,0 +1,144 @@
+# blobs.py
+"""
+Хранение вложений по содержимому (content-addressed).
+
+Одинаковые файлы, прикрепленные к разным новостям, хранятся один раз:
+news_files/blobs/<sha[:2]>/<sha256><расширение>. NewsFile.file указывает
+на этот путь (отдача файлов и X-Accel-Redirect не меняются), NewsFile.blob -
+на строку FileBlob со счетчиком ссылок.
+
+acquire() / acquire_local() увеличивают ref_count (создают FileBlob и файл,
+если такого содержимого еще нет), release() уменьшает; файл удаляется после
+коммита, когда ссылок не осталось. Ссылки берет NewsFile.save(), а
+отпускает сигнал post_delete (signals.py). Старые файлы переносит
+команда dedupe_files.
+"""
+import hashlib
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils.text import get_valid_filename
+
+from .models import FileBlob
+
+BLOBS_DIR = 'news_files/blobs'
+READ_SIZE = 1024 * 1024
+
+
+def hash_file(fileobj):
+    """(sha256, размер) содержимого открытого файла"""
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        data = fileobj.read(READ_SIZE)
+        if not data:
+            break
+        digest.update(data)
+        size += len(data)
+    return digest.hexdigest(), size
+
+
+def hash_path(path):
+    with open(path, 'rb') as f:
+        return hash_file(f)
+
+
+def blob_name(sha256, filename):
+    # Расширение оставляем: по нему nginx выбирает Content-Type для /media/
+    ext = os.path.splitext(get_valid_filename(os.path.basename(filename or '')))[1].lower()
+    return f'{BLOBS_DIR}/{sha256[:2]}/{sha256}{ext[:16]}'
+
+
+def _stored(name, size):
+    """Файл с таким именем уже есть и целый (имя задано содержимым)"""
+    try:
+        return default_storage.size(name) == size
+    except OSError:
+        return False
+
+
+def _acquire(sha256, size, filename, write, count=1):
+    with transaction.atomic():
+        blob = FileBlob.objects.filter(sha256=sha256).first()
+        if blob is None:
+            name = blob_name(sha256, filename)
+            if not _stored(name, size):
+                if default_storage.exists(name):
+                    # Недописанный файл (прерванная загрузка) - пишем заново
+                    default_storage.delete(name)
+                name = write(name)
+            blob, _ = FileBlob.objects.get_or_create(sha256=sha256, defaults={'path': name, 'size': size})
+        FileBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + count)
+        blob.ref_count += count
+    return blob
+
+
+def acquire(content, filename, count=1):
+    """
+    Ссылка на содержимое загруженного файла (UploadedFile, File).
+    Файл пишется в хранилище, только если такого содержимого еще нет.
+    """
+    content.seek(0)
+    sha256, size = hash_file(content)
+
+    def write(name):
+        content.seek(0)
+        return default_storage.save(name, content)
+
+    return _acquire(sha256, size, filename, write, count)
+
+
+def acquire_local(path, filename, sha256=None, size=None, count=1):
+    """
+    То же для файла на диске в MEDIA_ROOT: вместо копирования - жесткая
+    ссылка. Исходный файл не удаляется, это делает вызывающий.
+    """
+    if sha256 is None:
+        sha256, size = hash_path(path)
+
+    def write(name):
+        target = default_storage.path(name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.link(path, target)
+        if settings.FILE_UPLOAD_PERMISSIONS is not None:
+            os.chmod(target, settings.FILE_UPLOAD_PERMISSIONS)
+        return name
+
+    return _acquire(sha256, size, filename, write, count)
+
+
+def release(blob_id, count=1):
+    """Отпустить ссылку; последняя удаляет FileBlob и (после коммита) файл"""
+    if not blob_id:
+        return
+    with transaction.atomic():
+        if FileBlob.objects.filter(pk=blob_id, ref_count__gt=count).update(ref_count=F('ref_count') - count):
+            return
+        blob = FileBlob.objects.filter(pk=blob_id).first()
+        if blob is None:
+            return
+        remaining = blob.news_files.count()
+        if remaining:
+            # Счетчик разошелся (массовые операции в обход сигналов) - чиним, не удаляем
+            FileBlob.objects.filter(pk=blob_id).update(ref_count=remaining)
+            return
+        blob.delete()
+        transaction.on_commit(lambda: _delete_file(blob.path))
+
+
+def _delete_file(path):
+    # Пока шел коммит, то же содержимое могли загрузить заново
+    if not FileBlob.objects.filter(path=path).exists():
+        default_storage.delete(path)
+
+
+def recount():
+    """Пересчитать ref_count по NewsFile. Возвращает число исправленных строк"""
+    fixed = 0
+    rows = FileBlob.objects.annotate(n=Count('news_files')).exclude(ref_count=F('n'))
+    for blob_id, n in rows.values_list('id', 'n'):
+        fixed += FileBlob.objects.filter(pk=blob_id).update(ref_count=n)
+    return fixed
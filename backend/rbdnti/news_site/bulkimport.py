@@ -0,0 +1,267 @@
+# bulkimport.py
+"""
+Массовый импорт новостей с вложениями и цитат бегущей строки.
+
+Манифест (CSV с заголовком или JSONL, строка - новость) читается потоком
+и обрабатывается порциями: файлы порции копируются параллельно
+(ingest.staged_files), затем одна транзакция - bulk_create новостей и
+их файлов. Разделы, подразделения и категории ищутся по словарям в памяти
+(недостающие создаются обычным save()), порядок новостей выдается
+счетчиком от Max('order') - без запросов на каждую строку.
+
+bulk_create обходит save() и сигналы, поэтому нормализованные поля,
+счетчики (counters.py), полнотекстовый индекс и версия кэша страниц
+обновляются здесь же. Число обработанных строк манифеста (ImportProgress)
+пишется в той же транзакции, что и порция: прерванный import_content
+продолжается с первой незакоммиченной строки без дублей.
+
+Поля манифеста: section (slug, обязательно), section_title, category
+(путь slug: "otchety/2020"), category_title ("Отчеты / 2020"), subdivision
+(название), title (обязательно), content, created_at (ISO 8601), order,
+files (пути относительно каталога файлов: в CSV через ";", в JSONL - список).
+"""
+import csv
+import json
+import os
+from collections import Counter
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import counters, ingest, search
+from .lookups import normalize_text
+from .models import Category, ImportProgress, News, NewsFile, Section, Subdivision, TickerQuote
+from .pagecache import invalidate_content
+
+CHUNK_SIZE = 1000
+QUOTES_BATCH_SIZE = 1000
+
+
+def read_manifest(path, fmt=None):
+    """(номер строки в файле, dict) по строкам манифеста, потоком"""
+    fmt = fmt or ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for number, line in enumerate(f, 1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except ValueError as e:
+                    # Строка пропускается импортером с сообщением об ошибке
+                    yield number, {'_error': f"неверный JSON: {e}"}
+
+
+def _value(row, key):
+    value = row.get(key)
+    return value.strip() if isinstance(value, str) else value
+
+
+def _file_list(value):
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(';')
+    return [path.strip() for path in value if path and path.strip()]
+
+
+def _parse_created_at(value):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"неверная дата {value!r}")
+        moment = datetime(day.year, day.month, day.day)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class ManifestImporter:
+    def __init__(self, files_dir, workers=ingest.WORKERS, log=None):
+        self.files_dir = os.path.realpath(files_dir)
+        self.workers = workers
+        self.log = log or (lambda message: None)
+        self.stats = Counter()
+
+        self.sections = {section.slug: section for section in Section.objects.all()}
+        self.subdivisions = {subdivision.name: subdivision for subdivision in Subdivision.objects.all()}
+        self.categories = {(category.section_id, category.path): category for category in Category.objects.all()}
+        self.next_order = (News.objects.aggregate(Max('order'))['order__max'] or 0) + 1
+
+    # --- справочники -------------------------------------------------
+
+    def _section(self, row):
+        slug = _value(row, 'section')
+        if not slug:
+            raise ValueError("не указан раздел (section)")
+        section = self.sections.get(slug)
+        if section is None:
+            section = Section(slug=slug, title=_value(row, 'section_title') or slug)
+            section.save()
+            self.sections[slug] = section
+            self.stats['sections'] += 1
+        return section
+
+    def _subdivision(self, row):
+        name = _value(row, 'subdivision')
+        if not name:
+            return None
+        subdivision = self.subdivisions.get(name)
+        if subdivision is None:
+            subdivision = Subdivision(name=name)
+            subdivision.save()
+            self.subdivisions[name] = subdivision
+            self.stats['subdivisions'] += 1
+        return subdivision
+
+    def _category(self, section, row):
+        path = _value(row, 'category')
+        if not path:
+            return None
+        slugs = [slug for slug in path.strip('/').split('/') if slug]
+        titles = [title.strip() for title in (_value(row, 'category_title') or '').split(' / ')]
+        if len(titles) != len(slugs):
+            titles = slugs
+
+        parent = None
+        for depth, (slug, title) in enumerate(zip(slugs, titles), 1):
+            key = (section.id, '/'.join(slugs[:depth]))
+            category = self.categories.get(key)
+            if category is None:
+                category = Category(section=section, parent=parent, slug=slug, title=title)
+                category.save()
+                self.categories[key] = category
+                self.stats['categories'] += 1
+            parent = category
+        return parent
+
+    def _file_entry(self, relative):
+        full = os.path.realpath(os.path.join(self.files_dir, relative))
+        reason = None
+        if os.path.commonpath([self.files_dir, full]) != self.files_dir:
+            reason = "вне каталога файлов"
+        elif not os.path.isfile(full):
+            reason = "нет файла"
+        return os.path.basename(relative), (lambda: open(full, 'rb')), reason
+
+    # --- импорт ------------------------------------------------------
+
+    def build(self, row):
+        """(News без сохранения, created_at или None, entries файлов); ValueError - строка пропускается"""
+        if not isinstance(row, dict):
+            raise ValueError("строка манифеста - не объект")
+        if '_error' in row:
+            raise ValueError(row['_error'])
+        title = _value(row, 'title')
+        if not title:
+            raise ValueError("нет заголовка (title)")
+        created_at = _parse_created_at(_value(row, 'created_at')) if _value(row, 'created_at') else None
+        order = _value(row, 'order')
+        if order in (None, ''):
+            order = self.next_order
+            self.next_order += 1
+        else:
+            order = int(order)
+
+        section = self._section(row)
+        news = News(
+            section=section, category=self._category(section, row), subdivision=self._subdivision(row),
+            title=title[:255], title_normalized=normalize_text(title[:255]),
+            content=_value(row, 'content') or '', order=order,
+        )
+        return news, created_at, [self._file_entry(path) for path in _file_list(row.get('files'))]
+
+    def import_chunk(self, rows, progress=None):
+        """
+        Импортировать порцию [(номер строки, dict)] одной транзакцией.
+        progress (ImportProgress) увеличивается на len(rows) в той же транзакции.
+        """
+        items = []
+        for number, row in rows:
+            try:
+                items.append(self.build(row))
+            except (ValueError, TypeError) as e:
+                self.stats['skipped'] += 1
+                self.log(f"строка {number}: {e}")
+        if not items:
+            if progress is not None:
+                with transaction.atomic():
+                    self._advance(progress, len(rows))
+                progress.rows += len(rows)
+            return
+
+        entries = [entry for _, _, news_entries in items for entry in news_entries]
+        with ingest.staged_files(entries, self.workers) as staged:
+            with transaction.atomic():
+                news_list = News.objects.bulk_create([news for news, _, _ in items], batch_size=500)
+                # auto_now_add перезаписал created_at при вставке. Один UPDATE на дату:
+                # bulk_update строил бы CASE по всем id порции
+                dated = {}
+                for news, (_, created_at, _) in zip(news_list, items):
+                    if created_at is not None:
+                        news.created_at = created_at
+                        dated.setdefault(created_at, []).append(news.id)
+                for created_at, ids in dated.items():
+                    News.objects.filter(id__in=ids).update(created_at=created_at)
+
+                files = []
+                position = 0
+                for news, (_, _, news_entries) in zip(news_list, items):
+                    own = staged[position:position + len(news_entries)]
+                    position += len(news_entries)
+                    files += ingest.attach(news, own, attached=set())
+                    for result in own:
+                        if not result.imported:
+                            self.stats['files_skipped'] += 1
+                            self.log(f"{news.title}: файл {result.name} пропущен ({result.detail})")
+                NewsFile.objects.bulk_create(files, batch_size=500)
+
+                # То, что для одиночных объектов делают сигналы
+                placed = Counter((news.section_id, news.category_id) for news in news_list)
+                for (section_id, category_id), n in placed.items():
+                    counters.change_news_count(section_id, category_id, n)
+                search.index_news([news.id for news in news_list])
+                invalidate_content()
+                if progress is not None:
+                    self._advance(progress, len(rows))
+
+        if progress is not None:
+            progress.rows += len(rows)
+        self.stats['news'] += len(news_list)
+        self.stats['files'] += len(files)
+
+    @staticmethod
+    def _advance(progress, n):
+        # Вызывается внутри транзакции порции; в памяти - только после ее успеха
+        ImportProgress.objects.filter(pk=progress.pk).update(rows=progress.rows + n, updated_at=timezone.now())
+
+
+def import_quotes(lines, batch_size=QUOTES_BATCH_SIZE):
+    """
+    Заменить цитаты бегущей строки строками из lines (байтовые строки файла,
+    читаются потоком). Одна транзакция, вставка пачками. Возвращает число цитат.
+    Кэш цитат воркеров сбрасывает вызывающий (quotes.invalidate_quotes).
+    """
+    total = 0
+    batch = []
+    with transaction.atomic():
+        TickerQuote.objects.all().delete()
+        for raw in lines:
+            text = (raw.decode('utf-8-sig') if isinstance(raw, bytes) else raw).strip()
+            if not text:
+                continue
+            batch.append(TickerQuote(text=text))
+            if len(batch) >= batch_size:
+                TickerQuote.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        TickerQuote.objects.bulk_create(batch)
+        total += len(batch)
+    return total
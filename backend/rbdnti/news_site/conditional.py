@@ -0,0 +1,123 @@
+# conditional.py
+"""
+Валидаторы для условных GET (ETag / Last-Modified) страниц с новостями.
+
+Валидатор считает штамп страницы одним агрегатным запросом, не рендеря
+ее: число и максимальная дата изменения показанных новостей и их файлов
+плюс версия 'content' (см. pagecache.py), которая меняется при правке
+разделов, категорий и подразделений. Даты изменения ловят и записи в обход
+сигналов (queryset.update() и т.п.). Совпал штамп - ответ 304.
+
+Валидатор также заполняет request.statistics_target, чтобы
+StatisticsMiddleware учла просмотр и при ответе 304.
+"""
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+from django.db.models import Count, Max, Q, Sum
+from django.views.decorators.http import condition
+
+from .models import News, NewsFile, Section
+from .pagecache import CONTENT_VERSION
+from .resolver import resolver
+from .versions import get_version
+
+
+class PageStamp:
+    def __init__(self, parts, last_modified):
+        self.etag = hashlib.md5(':'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+        self.last_modified = last_modified
+
+
+def _stamp(news_qs, files_qs, news=None):
+    version = get_version(CONTENT_VERSION)
+    if news is None:
+        news = news_qs.order_by().aggregate(n=Count('id'), last=Max('updated_at'))
+    files = files_qs.order_by().aggregate(n=Count('id'), last=Max('updated_at'))
+    # Правка раздела/категории не меняет updated_at новостей - учитываем время версии
+    changed = [
+        datetime.fromtimestamp(version / 1e9, tz=dt_timezone.utc),
+        news['last'], files['last'],
+    ]
+    return PageStamp(
+        (version, news['n'], news['last'], files['n'], files['last']),
+        max(d for d in changed if d is not None),
+    )
+
+
+def news_detail_stamp(request, news_id):
+    row = News.objects.filter(id=news_id).values_list('section_id', 'category_id', 'updated_at').first()
+    if row is None:
+        return None
+    section_id, category_id, updated_at = row
+    request.statistics_target = (section_id, category_id, news_id)
+    return _stamp(None, NewsFile.objects.filter(news_id=news_id), news={'n': 1, 'last': updated_at})
+
+
+def section_stamp(request, section_slug):
+    section_id = resolver.section_id(section_slug)
+    if section_id is None:
+        return None
+    request.statistics_target = (section_id, None, None)
+    # Страница показывает и число новостей в категориях раздела
+    return _stamp(News.objects.filter(section_id=section_id),
+                  NewsFile.objects.filter(news__section_id=section_id))
+
+
+def category_stamp(request, section_slug, category_path):
+    section_id, category_id = resolver.resolve(section_slug, category_path)
+    if section_id is None or (category_id is None and any(category_path.split('/'))):
+        return None
+    request.statistics_target = (section_id, category_id, None)
+    if category_id is None:
+        news_q = Q(category__isnull=True)
+    else:
+        # Новости категории и счетчики новостей подкатегорий
+        news_q = Q(category_id=category_id) | Q(category__parent_id=category_id)
+    return _stamp(News.objects.filter(news_q),
+                  NewsFile.objects.filter(news__in=News.objects.filter(news_q).values('id')))
+
+
+def news_archive_stamp(request):
+    """
+    Без Count по всем новостям и файлам: число новостей - сумма счетчиков
+    разделов (counters.py), даты - Max(updated_at) по индексу. Удаления и
+    правки в обход updated_at меняют версию 'content'.
+    """
+    request.statistics_target = (None, None, None)
+    version = get_version(CONTENT_VERSION)
+    news_count = Section.objects.aggregate(n=Sum('news_count'))['n'] or 0
+    news_last = News.objects.order_by().aggregate(last=Max('updated_at'))['last']
+    files_last = NewsFile.objects.order_by().aggregate(last=Max('updated_at'))['last']
+    changed = [datetime.fromtimestamp(version / 1e9, tz=dt_timezone.utc), news_last, files_last]
+    return PageStamp(
+        (version, news_count, news_last, files_last),
+        max(d for d in changed if d is not None),
+    )
+
+
+def _cached_stamp(stamp_func):
+    """condition() вызывает etag_func и last_modified_func отдельно - считаем штамп один раз"""
+    @wraps(stamp_func)
+    def get(request, *args, **kwargs):
+        cache = request.__dict__.setdefault('_page_stamps', {})
+        if stamp_func not in cache:
+            cache[stamp_func] = stamp_func(request, *args, **kwargs)
+        return cache[stamp_func]
+    return get
+
+
+def conditional_page(stamp_func):
+    """Декоратор представления: ETag и Last-Modified из stamp_func"""
+    get_stamp = _cached_stamp(stamp_func)
+
+    def etag(request, *args, **kwargs):
+        stamp = get_stamp(request, *args, **kwargs)
+        return stamp.etag if stamp else None
+
+    def last_modified(request, *args, **kwargs):
+        stamp = get_stamp(request, *args, **kwargs)
+        return stamp.last_modified if stamp else None
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
@@ -0,0 +1,9 @@
+# context_processors.py
+"""Переменные, общие для всех шаблонов сайта"""
+from .quotes import quote_pool
+
+
+def ticker_quotes(request):
+    # Передаем функцию, а не список: шаблон вызовет ее только там,
+    # где выводится бегущая строка (админка цитаты не запрашивает)
+    return {'ticker_quotes': quote_pool.sample}
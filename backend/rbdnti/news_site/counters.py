@@ -0,0 +1,112 @@
+# counters.py
+"""
+Счетчики новостей и категорий на Section и Category.
+
+Section.categories_count, Section.news_count, Category.news_count (новости
+самой категории) и Category.subtree_news_count (вместе с подкатегориями)
+обновляются сигналами (signals.py) атомарными UPDATE ... SET x = x + 1.
+Предки категории берутся из tree_path. Расхождения (массовые операции в
+обход сигналов) исправляет команда recount_counters.
+"""
+from django.db import transaction
+from django.db.models import Count, F
+
+from .models import Category, News, Section
+
+
+def ancestor_ids(tree_path):
+    """id категории и всех ее предков из tree_path "/1/5/9/" """
+    return [int(part) for part in (tree_path or '').split('/') if part]
+
+
+def category_tree_path(category_id):
+    if not category_id:
+        return None
+    return Category.objects.filter(id=category_id).values_list('tree_path', flat=True).first()
+
+
+def change_news_count(section_id, category_id, delta, tree_path=None):
+    """
+    Учесть добавление (delta > 0) или удаление (delta < 0) новостей.
+    tree_path категории можно передать заранее: при каскадном удалении
+    категория может исчезнуть раньше своих новостей.
+    """
+    with transaction.atomic():
+        if section_id:
+            Section.objects.filter(id=section_id).update(news_count=F('news_count') + delta)
+        if category_id:
+            if tree_path is None:
+                tree_path = category_tree_path(category_id)
+            Category.objects.filter(id=category_id).update(news_count=F('news_count') + delta)
+            Category.objects.filter(id__in=ancestor_ids(tree_path)).update(
+                subtree_news_count=F('subtree_news_count') + delta
+            )
+
+
+def move_news(old_section_id, old_category_id, section_id, category_id):
+    if (old_section_id, old_category_id) == (section_id, category_id):
+        return
+    with transaction.atomic():
+        change_news_count(old_section_id, old_category_id, -1)
+        change_news_count(section_id, category_id, 1)
+
+
+def change_categories_count(section_id, delta):
+    if section_id:
+        Section.objects.filter(id=section_id).update(categories_count=F('categories_count') + delta)
+
+
+def move_subtree(old_tree_path, new_tree_path, subtree_news_count):
+    """Категория перенесена: новости поддерева переходят от старых предков к новым"""
+    old_ancestors = set(ancestor_ids(old_tree_path)[:-1])
+    new_ancestors = set(ancestor_ids(new_tree_path)[:-1])
+    if old_ancestors == new_ancestors or not subtree_news_count:
+        return
+    with transaction.atomic():
+        Category.objects.filter(id__in=old_ancestors - new_ancestors).update(
+            subtree_news_count=F('subtree_news_count') - subtree_news_count
+        )
+        Category.objects.filter(id__in=new_ancestors - old_ancestors).update(
+            subtree_news_count=F('subtree_news_count') + subtree_news_count
+        )
+
+
+def recount():
+    """
+    Пересчитать все счетчики по фактическим данным.
+    Возвращает {'sections': исправлено разделов, 'categories': исправлено категорий}.
+    """
+    with transaction.atomic():
+        categories_by_section = dict(
+            Category.objects.order_by().values_list('section_id').annotate(n=Count('id'))
+        )
+        news_by_section = dict(News.objects.order_by().values_list('section_id').annotate(n=Count('id')))
+        news_by_category = dict(
+            News.objects.filter(category__isnull=False).order_by()
+            .values_list('category_id').annotate(n=Count('id'))
+        )
+
+        sections = []
+        for section in Section.objects.only('id', 'categories_count', 'news_count'):
+            counts = (categories_by_section.get(section.id, 0), news_by_section.get(section.id, 0))
+            if (section.categories_count, section.news_count) != counts:
+                section.categories_count, section.news_count = counts
+                sections.append(section)
+        Section.objects.bulk_update(sections, ['categories_count', 'news_count'], batch_size=500)
+
+        categories = list(Category.objects.only('id', 'tree_path', 'news_count', 'subtree_news_count'))
+        subtree = {}
+        for category in categories:
+            direct = news_by_category.get(category.id, 0)
+            for ancestor_id in ancestor_ids(category.tree_path):
+                subtree[ancestor_id] = subtree.get(ancestor_id, 0) + direct
+
+        changed = []
+        for category in categories:
+            counts = (news_by_category.get(category.id, 0), subtree.get(category.id, 0))
+            if (category.news_count, category.subtree_news_count) != counts:
+                category.news_count, category.subtree_news_count = counts
+                changed.append(category)
+        Category.objects.bulk_update(changed, ['news_count', 'subtree_news_count'], batch_size=500)
+
+    return {'sections': len(sections), 'categories': len(changed)}
@@ -0,0 +1,221 @@
+# derivatives.py
+"""
+Уменьшенные копии картинок, загруженных через CKEditor.
+
+Фотографии с камер загружаются как есть (несколько мегабайт, 4000+ px), а
+колонка текста новости - около 1000 px. Для каждой картинки строятся копии
+шириной не больше get_widths() - пережатые в формате оригинала (JPEG, у
+PNG/GIF - PNG) и в WebP:
+
+    news_files/ckeditor_derivatives/<путь в ckeditor_uploads без расширения>-<ширина>w.<jpg|png|webp>
+
+Строит их команда build_image_derivatives (по cron и для уже загруженных
+файлов) в пуле процессов, вне запроса. Готовые ширины записываются в
+EditorUpload.derivative_widths; responsive_images() переписывает <img> в
+тексте новости в <picture> с WebP и srcset по этим копиям. Картинки без
+копий остаются как были.
+"""
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from html import escape, unescape
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections
+
+from . import editor_files
+from .models import EditorUpload
+
+DERIVATIVES_DIR = 'news_files/ckeditor_derivatives'
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+# Ширина картинки на странице, если в теге она не указана (колонка текста новости)
+DEFAULT_SIZES = '(max-width: 1000px) 100vw, 1000px'
+
+IMG_RE = re.compile(r'<img\b[^>]*>', re.IGNORECASE)
+ATTR_RE = re.compile(r'''([\w:-]+)\s*=\s*("[^"]*"|'[^']*'|[^\s>"']+)''')
+STYLE_WIDTH_RE = re.compile(r'(?:^|;)\s*width\s*:\s*(\d+)px', re.IGNORECASE)
+
+
+def get_widths():
+    return tuple(sorted(getattr(settings, 'CKEDITOR_DERIVATIVE_WIDTHS', (480, 960, 1600))))
+
+
+def fallback_format(path):
+    """Формат копии для браузеров без WebP: PNG сохраняет прозрачность"""
+    return 'png' if os.path.splitext(path)[1].lower() in ('.png', '.gif') else 'jpg'
+
+
+def derivative_name(path, width, fmt):
+    root = editor_files.get_upload_root()
+    relative = path[len(root) + 1:] if path.startswith(root + '/') else path
+    return f'{DERIVATIVES_DIR}/{os.path.splitext(relative)[0]}-{width}w.{fmt}'
+
+
+def derivative_names(path, widths):
+    return [derivative_name(path, width, fmt) for width in widths for fmt in (fallback_format(path), 'webp')]
+
+
+def _save(image, target, fmt):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp = f'{target}.tmp'
+    if fmt == 'jpg':
+        image.convert('RGB').save(tmp, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    elif fmt == 'png':
+        image.save(tmp, 'PNG', optimize=True)
+    else:
+        image.save(tmp, 'WEBP', quality=WEBP_QUALITY, method=4)
+    # Страница не увидит недописанный файл
+    os.replace(tmp, target)
+    if settings.FILE_UPLOAD_PERMISSIONS is not None:
+        os.chmod(target, settings.FILE_UPLOAD_PERMISSIONS)
+
+
+def generate(path, media_root, widths):
+    """
+    Построить копии одной картинки (path относительно media_root). Выполняется
+    в процессе пула: без базы, только файлы. Возвращает (path, ширина
+    оригинала, ширины копий); ([] - копии не нужны или картинку не открыть)
+    """
+    from PIL import Image, ImageOps
+
+    fallback = fallback_format(path)
+    try:
+        with Image.open(os.path.join(media_root, path)) as image:
+            if getattr(image, 'is_animated', False):
+                # Анимацию пережатие в один кадр испортит
+                return path, image.width, []
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+                image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+            original_width = image.width
+            built = []
+            for width in sorted({min(limit, original_width) for limit in widths}, reverse=True):
+                if width != image.width:
+                    height = max(round(image.height * width / image.width), 1)
+                    image = image.resize((width, height), Image.LANCZOS)
+                for fmt in (fallback, 'webp'):
+                    _save(image, os.path.join(media_root, derivative_name(path, width, fmt)), fmt)
+                built.append(width)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return path, None, []
+    return path, original_width, sorted(built)
+
+
+def remove(path):
+    """Удалить копии картинки path (перед удалением самой картинки)"""
+    widths = EditorUpload.objects.filter(path=path).values_list('derivative_widths', flat=True).first()
+    for name in derivative_names(path, widths or []):
+        try:
+            default_storage.delete(name)
+        except OSError:
+            pass
+
+
+def pending(force=False):
+    uploads = EditorUpload.objects.filter(is_image=True)
+    if not force:
+        uploads = uploads.filter(derivative_widths__isnull=True)
+    return uploads
+
+
+def build(uploads, workers=1):
+    """
+    Построить копии для EditorUpload из uploads; workers > 1 - в пуле
+    процессов. Выдает (path, ширины копий) по мере готовности.
+    """
+    paths = list(uploads.values_list('path', flat=True).iterator())
+    if not paths:
+        return
+    media_root = str(settings.MEDIA_ROOT)
+    widths = get_widths()
+    args = (paths, [media_root] * len(paths), [widths] * len(paths))
+    if workers > 1:
+        # Дочерние процессы не должны унаследовать открытое соединение с базой
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            yield from _store(pool.map(generate, *args, chunksize=8))
+    else:
+        yield from _store(map(generate, *args))
+
+
+def _store(results):
+    for path, width, widths in results:
+        EditorUpload.objects.filter(path=path).update(width=width, derivative_widths=widths)
+        yield path, widths
+
+
+def _attributes(tag):
+    return {name.lower(): unescape(value.strip('"\'')) for name, value in ATTR_RE.findall(tag)}
+
+
+def _media_path(src):
+    """Путь относительно MEDIA_ROOT для адреса src или None"""
+    url_path = urlsplit(src).path
+    if not url_path.startswith(settings.MEDIA_URL):
+        return None
+    return unquote(url_path[len(settings.MEDIA_URL):])
+
+
+def _sizes(attributes):
+    width = attributes.get('width', '')
+    if not width.isdigit():
+        match = STYLE_WIDTH_RE.search(attributes.get('style', ''))
+        width = match.group(1) if match else ''
+    return f'{width}px' if width else DEFAULT_SIZES
+
+
+def _srcset(path, widths, fmt):
+    return ', '.join(f'{default_storage.url(derivative_name(path, width, fmt))} {width}w' for width in widths)
+
+
+def responsive_images(content):
+    """
+    HTML новости с <picture> (WebP + srcset) вместо <img> картинок CKEditor,
+    для которых построены копии. Один запрос, и только если в тексте есть
+    картинки из MEDIA_ROOT.
+    """
+    if not content or '<img' not in content.lower():
+        return content
+    tags = {}
+    for match in IMG_RE.finditer(content):
+        attributes = _attributes(match.group(0))
+        if 'srcset' in attributes:
+            continue
+        path = _media_path(attributes.get('src', ''))
+        if path:
+            tags[match.group(0)] = (attributes, path)
+    if not tags:
+        return content
+
+    ready = dict(
+        EditorUpload.objects.filter(path__in={path for _, path in tags.values()})
+        .exclude(derivative_widths__isnull=True).values_list('path', 'derivative_widths')
+    )
+
+    def replace(match):
+        tag = match.group(0)
+        attributes, path = tags.get(tag, (None, None))
+        widths = ready.get(path)
+        if not widths:
+            return tag
+        sizes = escape(_sizes(attributes))
+        fallback = fallback_format(path)
+        # src - самая большая копия: старые браузеры тоже не тянут оригинал
+        src = default_storage.url(derivative_name(path, widths[-1], fallback))
+        rest = ''.join(
+            f' {name}="{escape(value)}"' for name, value in attributes.items()
+            if name not in ('src', 'srcset', 'sizes')
+        )
+        if 'loading' not in attributes:
+            rest += ' loading="lazy"'
+        if 'decoding' not in attributes:
+            rest += ' decoding="async"'
+        return (
+            f'<picture><source type="image/webp" srcset="{escape(_srcset(path, widths, "webp"))}" sizes="{sizes}">'
+            f'<img src="{escape(src)}" srcset="{escape(_srcset(path, widths, fallback))}" sizes="{sizes}"{rest}></picture>'
+        )
+
+    return IMG_RE.sub(replace, content)
@@ -0,0 +1,146 @@
+# downloads.py
+"""
+Отдача вложений новостей (views.tracked_download).
+
+Режимы (settings.DOWNLOAD_SERVE_MODE):
+  'accel'    - ответ с X-Accel-Redirect, файл отдает nginx из internal-локации
+               DOWNLOAD_ACCEL_PREFIX (Range и докачку nginx поддерживает сам);
+  'django'   - FileResponse с поддержкой Range; через wsgi.file_wrapper
+               gunicorn отдает файл sendfile(), не читая его в воркере;
+  'redirect' - прежнее поведение: редирект на /media/ URL (не для работы
+               за nginx: /media/news_files/ там закрыт, см. nginx/nginx.conf).
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse
+from django.shortcuts import redirect
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def get_serve_mode():
+    return getattr(settings, 'DOWNLOAD_SERVE_MODE', 'redirect')
+
+
+def parse_range(header, size):
+    """
+    Один диапазон "bytes=start-end" / "bytes=start-" / "bytes=-suffix"
+    -> (start, end) включительно; None - заголовка нет или он не разобран
+    (отдаем файл целиком); ValueError - диапазон за концом файла (416).
+    """
+    match = _RANGE_RE.match((header or '').strip())
+    if not match or match.group(0) == 'bytes=-':
+        return None
+    start, end = match.groups()
+    if start == '':
+        suffix = int(end)
+        if suffix == 0:
+            raise ValueError(header)
+        return max(size - suffix, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, end
+
+
+def is_continuation(request):
+    """Запрос продолжает уже начатое скачивание (Range не с нулевого байта)"""
+    match = _RANGE_RE.match(request.META.get('HTTP_RANGE', '').strip())
+    return bool(match) and match.group(1) not in ('', '0')
+
+
+class FileRange:
+    """Часть открытого файла [start, start + length) для FileResponse"""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self._file = file
+        self._remaining = length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def fileno(self):
+        # file_wrapper gunicorn отдаст sendfile() с текущей позиции
+        # ровно Content-Length байт
+        return self._file.fileno()
+
+    def close(self):
+        self._file.close()
+
+
+def _validators(stat):
+    etag = f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+    return etag, http_date(stat.st_mtime)
+
+
+def _if_range_matches(request, etag, last_modified, mtime):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(mtime) <= since
+
+
+def serve_file(request, news_file):
+    mode = get_serve_mode()
+    if mode == 'redirect':
+        return redirect(news_file.file.url)
+
+    try:
+        path = news_file.file.path
+        stat = os.stat(path)
+    except (ValueError, OSError):
+        raise Http404("Файл не найден")
+
+    filename = os.path.basename(news_file.filename or news_file.file.name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    if mode == 'accel':
+        response = HttpResponse(content_type=content_type)
+        prefix = getattr(settings, 'DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix + quote(news_file.file.name)
+        response['Content-Disposition'] = content_disposition_header(True, filename)
+        return response
+
+    etag, last_modified = _validators(stat)
+    size = stat.st_size
+    try:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range and not _if_range_matches(request, etag, last_modified, stat.st_mtime):
+        # Файл изменился с начала скачивания - отдаем заново целиком
+        byte_range = None
+
+    file = open(path, 'rb')
+    if byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(FileRange(file, start, length), content_type=content_type,
+                                as_attachment=True, filename=filename, status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    else:
+        length = size
+        response = FileResponse(file, content_type=content_type, as_attachment=True, filename=filename)
+    response['Content-Length'] = str(length)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    return response
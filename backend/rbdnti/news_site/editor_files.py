@@ -0,0 +1,170 @@
+# editor_files.py
+"""
+Индекс файлов, загруженных через CKEditor.
+
+Страница "Файлы CKEditor" (views.ckeditor_files_view) читает таблицу
+EditorUpload - с поиском, сортировкой и страницами - вместо обхода
+CKEDITOR_UPLOAD_PATH и stat() каждого файла на каждый запрос.
+
+Индекс пополняется при загрузке (EditorStorage - хранилище
+django-ckeditor, CKEDITOR_STORAGE_BACKEND) и при удалении со страницы.
+Файлы, появившиеся или пропавшие в обход (копирование, ручная чистка),
+находит scan(): каталоги обходятся os.scandir, и файлы каталога
+перечитываются, только если изменился его mtime (создание, удаление или
+переименование файла в нем). Содержимое файлов на месте не меняется,
+поэтому неизмененный каталог пропускается целиком.
+"""
+import os
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+
+from .lookups import normalize_text
+from .models import EditorUpload, EditorUploadDirectory
+
+BATCH_SIZE = 500
+
+
+def get_upload_root():
+    """Каталог загрузок CKEditor относительно MEDIA_ROOT ("news_files/ckeditor_uploads")"""
+    return settings.CKEDITOR_UPLOAD_PATH.strip('/')
+
+
+def _full_path(path):
+    return os.path.join(settings.MEDIA_ROOT, *path.split('/'))
+
+
+def _row(path, stat):
+    # Не на уровне модуля: ckeditor_uploader.utils при импорте создает EditorStorage
+    from ckeditor_uploader.utils import is_valid_image_extension
+
+    directory, name = path.rsplit('/', 1)
+    return EditorUpload(
+        path=path, directory=directory, name=name, name_normalized=normalize_text(name),
+        size=stat.st_size,
+        modified_at=datetime.fromtimestamp(stat.st_mtime, tz=dt_timezone.utc),
+        is_image=is_valid_image_extension(name),
+    )
+
+
+def record(path):
+    """Добавить (обновить) файл path (относительно MEDIA_ROOT) в индекс"""
+    path = path.replace(os.sep, '/')
+    try:
+        row = _row(path, os.stat(_full_path(path)))
+    except OSError:
+        return
+    EditorUpload.objects.update_or_create(path=path, defaults={
+        'directory': row.directory, 'name': row.name, 'size': row.size,
+        'modified_at': row.modified_at, 'is_image': row.is_image,
+        'width': None, 'derivative_widths': None,
+    })
+
+
+def forget(path):
+    EditorUpload.objects.filter(path=path.replace(os.sep, '/')).delete()
+
+
+class EditorStorage(FileSystemStorage):
+    """
+    Хранилище загрузок CKEditor, записывающее файл в индекс.
+    Не бэкенд (CKEDITOR_IMAGE_BACKEND): с ним окно "Обзор сервера" ссылается
+    на миниатюры *_thumb.*, которых DummyBackend не создает.
+    """
+
+    def _save(self, name, content):
+        saved = super()._save(name, content)
+        if saved.replace(os.sep, '/').startswith(get_upload_root() + '/'):
+            record(saved)
+        return saved
+
+
+def _sync_directory(directory, files):
+    """Привести строки каталога к files {путь: stat}. (добавлено, изменено, удалено)"""
+    existing = {
+        path: (size, modified_at)
+        for path, size, modified_at in EditorUpload.objects.filter(directory=directory)
+        .values_list('path', 'size', 'modified_at')
+    }
+    to_create = []
+    to_update = []
+    for path, stat in files.items():
+        row = _row(path, stat)
+        if path not in existing:
+            to_create.append(row)
+        elif existing[path] != (row.size, row.modified_at):
+            to_update.append(row)
+    removed = [path for path in existing if path not in files]
+
+    EditorUpload.objects.bulk_create(to_create, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    for row in to_update:
+        # Файл заменен - уменьшенные копии строятся заново
+        EditorUpload.objects.filter(path=row.path).update(
+            size=row.size, modified_at=row.modified_at, width=None, derivative_widths=None,
+        )
+    for start in range(0, len(removed), BATCH_SIZE):
+        EditorUpload.objects.filter(path__in=removed[start:start + BATCH_SIZE]).delete()
+    return len(to_create), len(to_update), len(removed)
+
+
+def scan(full=False):
+    """
+    Сверить индекс с диском. full=True - перечитать все каталоги, не глядя
+    на mtime. Возвращает счетчики: added, updated, removed, scanned, skipped.
+    """
+    root = get_upload_root()
+    known = dict(EditorUploadDirectory.objects.values_list('path', 'mtime_ns'))
+    children = defaultdict(list)
+    for path in known:
+        if '/' in path:
+            children[path.rsplit('/', 1)[0]].append(path)
+
+    stats = dict.fromkeys(('added', 'updated', 'removed', 'scanned', 'skipped'), 0)
+    seen = set()
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            mtime_ns = os.stat(_full_path(directory)).st_mtime_ns
+        except OSError:
+            continue
+        seen.add(directory)
+
+        if not full and known.get(directory) == mtime_ns:
+            # Список файлов не менялся; подкаталоги проверяем по индексу
+            stats['skipped'] += 1
+            stack.extend(children[directory])
+            continue
+
+        files = {}
+        with os.scandir(_full_path(directory)) as entries:
+            for entry in entries:
+                path = f'{directory}/{entry.name}'
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(path)
+                elif entry.is_file(follow_symlinks=False):
+                    try:
+                        files[path] = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        # Удален между scandir и stat
+                        continue
+
+        with transaction.atomic():
+            added, updated, removed = _sync_directory(directory, files)
+            EditorUploadDirectory.objects.update_or_create(path=directory, defaults={'mtime_ns': mtime_ns})
+        stats['scanned'] += 1
+        stats['added'] += added
+        stats['updated'] += updated
+        stats['removed'] += removed
+
+    # Каталоги, пропавшие с диска, вместе с их файлами
+    gone = [path for path in known if path not in seen]
+    for start in range(0, len(gone), BATCH_SIZE):
+        chunk = gone[start:start + BATCH_SIZE]
+        with transaction.atomic():
+            stats['removed'] += EditorUpload.objects.filter(directory__in=chunk).delete()[0]
+            EditorUploadDirectory.objects.filter(path__in=chunk).delete()
+    return stats
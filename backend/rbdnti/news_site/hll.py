@@ -0,0 +1,103 @@
+# hll.py
+"""
+HyperLogLog - оценка числа уникальных значений (IP посетителей).
+
+Скетч - 2**P регистров по байту. Относительная стандартная ошибка
+1.04 / sqrt(2**P): при P = 12 (4096 регистров) - около 1.6%, т.е. в ~95%
+случаев оценка отличается от точного числа не более чем на 3.3%. Малые
+множества (до ~10 000) считаются линейным подсчетом и почти точны.
+
+Скетчи объединяются поразрядным максимумом без потери точности, поэтому
+уникальных за любой период = объединение суточных скетчей. Регистры
+хранятся как одно большое целое, и объединение выполняется целочисленными
+операциями над всеми регистрами сразу (SWAR), без цикла по регистрам.
+"""
+import hashlib
+import math
+import zlib
+
+P = 12
+M = 1 << P
+
+# Старший бит каждого байта: регистры < 128, он служит флагом при сравнении
+_HIGH_BITS = int.from_bytes(b'\x80' * M, 'big')
+_ALL_BITS = (1 << (8 * M)) - 1
+
+# Поправка alpha_m для m >= 128
+_ALPHA = 0.7213 / (1 + 1.079 / M)
+
+STANDARD_ERROR = 1.04 / M ** 0.5
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    __slots__ = ('_registers', '_pending')
+
+    def __init__(self, registers=0):
+        # Регистр i - байт i (от старшего) целого _registers
+        self._registers = registers
+        # Значения, добавленные с последнего объединения: {индекс: ранг}
+        self._pending = {}
+
+    @classmethod
+    def from_values(cls, values):
+        sketch = cls()
+        sketch.update(values)
+        return sketch
+
+    def add(self, value):
+        h = _hash(value)
+        index = h >> (64 - P)
+        rest = h & ((1 << (64 - P)) - 1)
+        rank = (64 - P) - rest.bit_length() + 1
+        if rank > self._pending.get(index, 0):
+            self._pending[index] = rank
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def _flush(self):
+        if not self._pending:
+            return
+        registers = bytearray(self._registers.to_bytes(M, 'big'))
+        for index, rank in self._pending.items():
+            if rank > registers[index]:
+                registers[index] = rank
+        self._registers = int.from_bytes(registers, 'big')
+        self._pending = {}
+
+    def merge(self, other):
+        """Объединить с другим скетчем (на месте)"""
+        self._flush()
+        other._flush()
+        a, b = self._registers, other._registers
+        # В байтах, где a >= b, после вычитания остается старший бит
+        ge = (((a | _HIGH_BITS) - b) & _HIGH_BITS) >> 7
+        mask = ge * 0xFF
+        self._registers = (a & mask) | (b & (_ALL_BITS ^ mask))
+        return self
+
+    def count(self):
+        self._flush()
+        registers = self._registers.to_bytes(M, 'big')
+        estimate = _ALPHA * M * M / sum(2.0 ** -r for r in registers)
+        zeros = registers.count(0)
+        if estimate <= 2.5 * M and zeros:
+            # Линейный подсчет для малых множеств
+            return round(M * math.log(M / zeros))
+        return round(estimate)
+
+    def to_bytes(self):
+        """Компактное представление для БД (пустые регистры хорошо сжимаются)"""
+        self._flush()
+        return zlib.compress(self._registers.to_bytes(M, 'big'))
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data:
+            return cls()
+        return cls(int.from_bytes(zlib.decompress(bytes(data)), 'big'))
@@ -0,0 +1,227 @@
+# ingest.py
+"""
+Массовое прикрепление файлов к новости: выбранные файлы, ZIP-архив или
+каталог на сервере (UPLOAD_STAGING_DIR).
+
+Файлы копируются во временные файлы параллельно (потоки: zlib и hashlib
+отпускают GIL), SHA-256 считается в том же проходе. ZIP читается потоком
+по одному члену, целиком в память не попадает. Затем в одной транзакции
+берутся ссылки на общее содержимое (blobs.py) и все NewsFile вставляются
+одним bulk_create. bulk_create обходит save() и сигналы, поэтому
+filename_normalized, ссылки FileBlob, полнотекстовый индекс и версия кэша
+страниц обновляются здесь же.
+
+Результат - отчет по каждому файлу: импортирован или пропущен и почему.
+"""
+import hashlib
+import os
+import tempfile
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+
+from . import blobs, search
+from .lookups import normalize_text
+from .models import NewsFile
+from .pagecache import invalidate_content
+
+STAGING_DIR = os.path.join('news_files', '.ingest')
+READ_SIZE = 1024 * 1024
+WORKERS = min(4, os.cpu_count() or 1)
+
+# Служебные файлы архиваторов и файловых менеджеров
+IGNORED_NAMES = {'thumbs.db', 'desktop.ini', '.ds_store'}
+
+# Ошибки чтения отдельного файла: файл пропускается, остальные импортируются
+READ_ERRORS = (OSError, EOFError, RuntimeError, zipfile.BadZipFile, zlib.error)
+
+IMPORTED = 'imported'
+SKIPPED = 'skipped'
+
+
+class IngestError(Exception):
+    pass
+
+
+class IngestResult:
+    def __init__(self, name, status, detail=''):
+        self.name = name
+        self.status = status
+        self.detail = detail
+
+    @property
+    def imported(self):
+        return self.status == IMPORTED
+
+
+def _skip_reason(path):
+    name = os.path.basename(path)
+    if not name:
+        return "пустое имя"
+    if '__MACOSX' in path.split('/') or name.startswith('.') or name.lower() in IGNORED_NAMES:
+        return "служебный файл"
+    return None
+
+
+def _zip_name(info):
+    # Без флага UTF-8 имя записано в кодировке DOS: у русских архивов это cp866
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        return info.filename.encode('cp437').decode('cp866')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return info.filename
+
+
+def uploaded_entries(files):
+    """(имя, открыть(), причина пропуска) для файлов из request.FILES"""
+    for f in files:
+        yield f.name, f.open, None
+
+
+def zip_entries(fileobj):
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile:
+        raise IngestError("Файл не является ZIP-архивом")
+    for info in archive.infolist():
+        if info.is_dir():
+            continue
+        path = _zip_name(info).replace('\\', '/')
+        yield os.path.basename(path), (lambda info=info: archive.open(info)), _skip_reason(path)
+
+
+def get_staging_root():
+    return os.path.realpath(getattr(settings, 'UPLOAD_STAGING_DIR', settings.BASE_DIR / 'data' / 'staging'))
+
+
+def resolve_staging_dir(relative):
+    """Каталог внутри UPLOAD_STAGING_DIR; выход за его пределы запрещен"""
+    root = get_staging_root()
+    path = os.path.realpath(os.path.join(root, (relative or '').strip().lstrip('/')))
+    if os.path.commonpath([root, path]) != root or not os.path.isdir(path):
+        raise IngestError(f"Каталог не найден в {root}")
+    return path
+
+
+def directory_entries(path):
+    for current, dirs, files in os.walk(path):
+        dirs.sort()
+        relative = os.path.relpath(current, path).replace(os.sep, '/')
+        for name in sorted(files):
+            full = os.path.join(current, name)
+            reason = _skip_reason(f'{relative}/{name}')
+            if reason is None and not os.path.isfile(full):
+                reason = "не обычный файл"
+            yield name, (lambda full=full: open(full, 'rb')), reason
+
+
+def _stage(open_entry, tmp_dir):
+    """Скопировать файл во временный, посчитав SHA-256: (путь, sha256, размер)"""
+    fd, tmp = tempfile.mkstemp(dir=tmp_dir, suffix='.part')
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as out, open_entry() as src:
+            while True:
+                data = src.read(READ_SIZE)
+                if not data:
+                    break
+                out.write(data)
+                digest.update(data)
+                size += len(data)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return tmp, digest.hexdigest(), size
+
+
+class staged_files:
+    """
+    Скопировать файлы entries во временные параллельно. Контекстный менеджер:
+    results - список в порядке entries, элемент - IngestResult (пропущен) или
+    (имя, временный файл, sha256, размер); временные файлы удаляются на выходе.
+    """
+
+    def __init__(self, entries, workers=WORKERS):
+        self.entries = entries
+        self.workers = workers
+        self.results = []
+        self.temp_paths = []
+
+    def __enter__(self):
+        tmp_dir = os.path.join(settings.MEDIA_ROOT, STAGING_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as pool:
+            jobs = []
+            try:
+                for name, open_entry, reason in self.entries:
+                    future = None if reason else pool.submit(_stage, open_entry, tmp_dir)
+                    jobs.append((name, future, reason))
+            finally:
+                # Даже при ошибке в entries дожидаемся запущенных копий, чтобы их удалить
+                for name, future, reason in jobs:
+                    if future is None:
+                        self.results.append(IngestResult(name, SKIPPED, reason))
+                        continue
+                    try:
+                        tmp, sha256, size = future.result()
+                    except READ_ERRORS as e:
+                        self.results.append(IngestResult(name, SKIPPED, f"ошибка чтения: {e}"))
+                        continue
+                    self.temp_paths.append(tmp)
+                    self.results.append((name, tmp, sha256, size))
+        return self.results
+
+    def __exit__(self, *exc_info):
+        for tmp in self.temp_paths:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+
+
+def attach(news, staged, attached=None):
+    """
+    NewsFile (без сохранения) для скопированных файлов staged: ссылки на
+    общее содержимое берутся сразу, вставка - общим bulk_create вызывающего.
+    attached - sha256 уже прикрепленных к новости файлов (дубликаты пропускаются).
+    Заменяет элементы staged на IngestResult; вызывать внутри транзакции.
+    """
+    if attached is None:
+        attached = set(NewsFile.objects.filter(news=news, blob__isnull=False).values_list('blob__sha256', flat=True))
+    rows = []
+    for i, result in enumerate(staged):
+        if isinstance(result, IngestResult):
+            continue
+        name, tmp, sha256, size = result
+        if sha256 in attached:
+            staged[i] = IngestResult(name, SKIPPED, "такой файл уже прикреплен")
+            continue
+        attached.add(sha256)
+        blob = blobs.acquire_local(tmp, name, sha256=sha256, size=size)
+        rows.append(NewsFile(
+            news=news, file=blob.path, blob=blob,
+            filename=name, filename_normalized=normalize_text(name),
+        ))
+        staged[i] = IngestResult(name, IMPORTED, f"{size} байт")
+    return rows
+
+
+def ingest(news, entries, workers=WORKERS):
+    """
+    Прикрепить к новости файлы из entries (см. *_entries).
+    Возвращает список IngestResult в порядке entries.
+    """
+    with staged_files(entries, workers) as results:
+        with transaction.atomic():
+            rows = attach(news, results)
+            NewsFile.objects.bulk_create(rows, batch_size=500)
+            # То, что для одиночного NewsFile делают сигналы
+            if rows:
+                search.index_news([news.id])
+                invalidate_content()
+    return results
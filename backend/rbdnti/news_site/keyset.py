@@ -0,0 +1,110 @@
+# keyset.py
+"""
+Постраничный вывод новостей без OFFSET (keyset / seek).
+
+Порядок - ORDER BY order, created_at DESC, id DESC (как News.Meta.ordering
+плюс id для однозначности) совпадает с индексами news_*_listing_idx.
+Курсор - ключ последней (или первой) показанной новости; следующая
+страница выбирается условием "после курсора" поиском по индексу, поэтому
+дальняя страница архива стоит столько же, сколько первая, а добавление
+новостей не сдвигает уже открытые страницы.
+
+Курсор в URL: ?after=<курсор> - следующая страница, ?before=<курсор> -
+предыдущая. Формат "order.created_at_мкс.id"; неразборчивый курсор
+означает первую страницу.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db.models import Q
+
+from .pagecache import CONTENT_VERSION
+from .versions import get_version
+
+ORDERING = ('order', '-created_at', '-id')
+REVERSE_ORDERING = ('-order', 'created_at', 'id')
+
+# Сколько хранить число новостей в списке (версия 'content' сбрасывает раньше)
+COUNT_TIMEOUT = 3600
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_cursor(news):
+    # Целые микросекунды: через float курсор мог бы разойтись с базой на 1 мкс
+    return f'{news.order}.{(news.created_at - _EPOCH) // _MICROSECOND}.{news.id}'
+
+
+def decode_cursor(value):
+    """(order, created_at, id) или None"""
+    try:
+        order, micros, news_id = value.split('.')
+        return int(order), _EPOCH + int(micros) * _MICROSECOND, int(news_id)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def _after(key):
+    """Строки после key в порядке ORDERING"""
+    order, created_at, news_id = key
+    # Избыточное order >= дает SQLite границу для поиска по индексу
+    return Q(order__gte=order) & (
+        Q(order__gt=order)
+        | Q(order=order, created_at__lt=created_at)
+        | Q(order=order, created_at=created_at, id__lt=news_id)
+    )
+
+
+def _before(key):
+    order, created_at, news_id = key
+    return Q(order__lte=order) & (
+        Q(order__lt=order)
+        | Q(order=order, created_at__gt=created_at)
+        | Q(order=order, created_at=created_at, id__gt=news_id)
+    )
+
+
+class KeysetPage:
+    def __init__(self, items, has_next, has_previous):
+        self.items = items
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = encode_cursor(items[-1]) if items and has_next else None
+        self.previous_cursor = encode_cursor(items[0]) if items and has_previous else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def paginate(queryset, request, per_page):
+    """Страница queryset по курсору из request.GET (after / before)"""
+    after = decode_cursor(request.GET.get('after'))
+    before = decode_cursor(request.GET.get('before')) if after is None else None
+
+    if before is not None:
+        rows = list(queryset.filter(_before(before)).order_by(*REVERSE_ORDERING)[:per_page + 1])
+        if rows:
+            has_previous = len(rows) > per_page
+            return KeysetPage(rows[:per_page][::-1], has_next=True, has_previous=has_previous)
+
+    if after is not None:
+        queryset = queryset.filter(_after(after))
+    rows = list(queryset.order_by(*ORDERING)[:per_page + 1])
+    return KeysetPage(rows[:per_page], has_next=len(rows) > per_page, has_previous=after is not None)
+
+
+def cached_count(name, queryset):
+    """COUNT(*) queryset, запомненный до следующего изменения контента"""
+    key = f'news_site:count:{get_version(CONTENT_VERSION)}:{name}'
+    total = cache.get(key)
+    if total is None:
+        total = queryset.count()
+        cache.set(key, total, COUNT_TIMEOUT)
+    return total
@@ -0,0 +1,37 @@
+# lookups.py
+"""
+Регистронезависимый поиск по кириллице в SQLite.
+
+LIKE в SQLite не различает регистр только для ASCII, поэтому для полей,
+по которым ищут, хранятся нормализованные копии (*_normalized), а запрос
+нормализуется так же: field_normalized__ncontains='Отчёт'.
+
+Индекс на *_normalized не нужен: ncontains - это LIKE '%...%', B-дерево
+такой поиск не ускоряет (быстрый поиск по тексту - search.py, FTS5).
+"""
+from django.db.models import CharField
+from django.db.models.lookups import Contains
+
+
+def normalize_text(value):
+    """casefold, неразрывные и повторные пробелы -> один пробел"""
+    if not value:
+        return ''
+    # split() без аргументов режет и по неразрывному пробелу
+    return ' '.join(str(value).split()).casefold()
+
+
+@CharField.register_lookup
+class NormalizedContains(Contains):
+    lookup_name = 'ncontains'
+
+    def get_prep_lookup(self):
+        if isinstance(self.rhs, str):
+            self.rhs = normalize_text(self.rhs)
+        return super().get_prep_lookup()
+
+    def get_rhs_op(self, connection, rhs):
+        # Оператор у backend'ов зарегистрирован под именем contains
+        if self.rhs_is_direct_value():
+            return connection.operators['contains'] % rhs
+        return connection.pattern_ops['contains'].format(rhs)
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+
+from news_site.archive import ARCHIVE_SOURCES, archive_source, get_archive_dir, get_retention_days, vacuum
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит сырые ViewStatistic/DownloadStatistic старше срока хранения в сжатые "
+        "месячные CSV (data/archive) и удаляет их из базы. Архивируются только строки, "
+        "уже учтенные rollup_statistics; запускать после нее."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help="Срок хранения в базе, дней (по умолчанию STATISTICS_RETENTION_DAYS)",
+        )
+        parser.add_argument(
+            '--source', choices=sorted(ARCHIVE_SOURCES), action='append',
+            help="Источник для архивации (по умолчанию все)",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=5000,
+            help="Сколько строк переносить в одной транзакции",
+        )
+        parser.add_argument(
+            '--vacuum', choices=['none', 'full', 'incremental'], default='none',
+            help="Вернуть освободившееся место: full - VACUUM (блокирует базу), "
+                 "incremental - PRAGMA incremental_vacuum (нужен auto_vacuum=INCREMENTAL)",
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Только показать, сколько строк будет перенесено")
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else get_retention_days()
+        total = 0
+        for name in options['source'] or sorted(ARCHIVE_SOURCES):
+            archived, pending = archive_source(
+                name, days=days, chunk_size=options['chunk_size'], dry_run=options['dry_run'],
+            )
+            total += archived
+            verb = "будет перенесено" if options['dry_run'] else "перенесено"
+            self.stdout.write(self.style.SUCCESS(f"{name}: {verb} строк {archived} (старше {days} дн.)"))
+            if pending:
+                self.stdout.write(self.style.WARNING(
+                    f"{name}: {pending} старых строк еще не учтены rollup_statistics и оставлены в базе"
+                ))
+
+        if options['dry_run']:
+            return
+        self.stdout.write(f"Архив: {get_archive_dir()}")
+        if options['vacuum'] != 'none' and total:
+            if vacuum(options['vacuum']):
+                self.stdout.write(self.style.SUCCESS(f"VACUUM ({options['vacuum']}) выполнен"))
+            else:
+                self.stdout.write(self.style.WARNING(
+                    "incremental_vacuum недоступен: включите PRAGMA auto_vacuum = INCREMENTAL "
+                    "и выполните VACUUM один раз"
+                ))
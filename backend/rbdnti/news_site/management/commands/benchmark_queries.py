@@ -0,0 +1,268 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from news_site import keyset, views
+from news_site.statistics import SOURCES, rollup, rollup_unique
+from news_site.models import (
+    Category, DailyStatistic, DownloadStatistic, News, NewsFile, Section, Subdivision, ViewStatistic,
+)
+
+# Модели, чьи Meta.indexes сравниваются (состояние "до" - без этих индексов)
+INDEXED_MODELS = (News, ViewStatistic, DailyStatistic)
+
+
+class _Restore(Exception):
+    """Откат точки сохранения с удаленными индексами"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет SQL-запросы страниц news_archive, section_view, category_view и "
+        "statistics_view с составными индексами из Meta.indexes и без них: печатает "
+        "EXPLAIN QUERY PLAN и время. Все изменения (удаление индексов, --seed) "
+        "выполняются в транзакции и откатываются; на время замера база заблокирована "
+        "на запись - запускать на копии базы или локально."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', action='store_true', help="Добавить синтетические данные (будут откачены)")
+        parser.add_argument('--news', type=int, default=20000, help="Новостей для --seed")
+        parser.add_argument('--views', type=int, default=300000, help="Просмотров для --seed")
+        parser.add_argument('--downloads', type=int, default=50000, help="Скачиваний для --seed")
+        parser.add_argument('--repeat', type=int, default=5, help="Повторов замера (берется лучшее время)")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("EXPLAIN QUERY PLAN поддерживается только для SQLite")
+
+        self.repeat = max(options['repeat'], 1)
+        cache = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=cache, PAGE_CACHE_TIMEOUT=0), transaction.atomic():
+            if options['seed']:
+                started = time.perf_counter()
+                self.seed(options['news'], options['views'], options['downloads'])
+                self.stdout.write(f"Данные добавлены за {time.perf_counter() - started:.1f} с")
+
+            scenarios = self.scenarios()
+            if not scenarios:
+                raise CommandError("Нет разделов с новостями: запустите с --seed")
+
+            after = {name: self.measure(*scenario) for name, *scenario in scenarios}
+            try:
+                with transaction.atomic():
+                    dropped = self.drop_indexes()
+                    before = {name: self.measure(*scenario) for name, *scenario in scenarios}
+                    raise _Restore
+            except _Restore:
+                pass
+            transaction.set_rollback(True)
+
+        if not dropped:
+            self.stdout.write(self.style.WARNING(
+                "Индексы из Meta.indexes не найдены в базе (migrate не выполнен?) - "
+                "замеры до и после совпадают"
+            ))
+        for name, *_ in scenarios:
+            self.report(name, before[name], after[name], options['verbosity'])
+
+    # ------------------------------------------------------------------
+
+    def seed(self, news_total, views_total, downloads_total):
+        rng = random.Random(1)
+        now = timezone.now()
+        period = timedelta(days=730)
+
+        subdivisions = Subdivision.objects.bulk_create(
+            Subdivision(name=f'Бенчмарк {i}', order=1000 + i) for i in range(8)
+        )
+        sections = Section.objects.bulk_create(
+            Section(title=f'Бенчмарк {i}', slug=f'benchmark-{i}', order=1000 + i) for i in range(10)
+        )
+        categories = {section.id: [] for section in sections}
+        for section in sections:
+            for r in range(5):
+                root = Category(section=section, title=f'Категория {r}', slug=f'cat-{r}')
+                root.save()
+                categories[section.id].append(root)
+                for c in range(4):
+                    child = Category(section=section, parent=root, title=f'Подкатегория {c}', slug=f'sub-{c}')
+                    child.save()
+                    categories[section.id].append(child)
+
+        order_start = (News.objects.order_by('-order').values_list('order', flat=True).first() or 0) + 1
+        news = []
+        for i in range(news_total):
+            section = rng.choice(sections)
+            category = rng.choice(categories[section.id]) if rng.random() > 0.3 else None
+            title = f'Бенчмарк: новость {i}'
+            news.append(News(
+                section=section, category=category, subdivision=rng.choice(subdivisions),
+                title=title, title_normalized=title.casefold(), order=order_start + i,
+            ))
+        news = News.objects.bulk_create(news, batch_size=1000)
+        self._spread_dates(News, 'created_at', news[0].id, now - period, period / max(news_total, 1))
+
+        files = NewsFile.objects.bulk_create((
+            NewsFile(news=item, filename=f'benchmark_{item.id}.pdf', file=f'news_files/benchmark_{item.id}.pdf',
+                     filename_normalized=f'benchmark_{item.id}.pdf', created_at=now)
+            for item in news[::2]
+        ), batch_size=1000)
+        self._spread_dates(NewsFile, 'created_at', files[0].id, now - period, period / max(len(files), 1))
+
+        # Сырые просмотры свернуты в агрегаты, кроме последнего процента (как после cron)
+        step = period / max(views_total, 1)
+        tail = views_total // 100
+        self._seed_views(rng, news, range(views_total - tail), now - period, step)
+
+        first_download = None
+        for start in range(0, downloads_total, 5000):
+            created = DownloadStatistic.objects.bulk_create(
+                DownloadStatistic(news_file=rng.choice(files), ip_address=f'10.9.{rng.randrange(256)}.{i % 256}')
+                for i in range(start, min(start + 5000, downloads_total))
+            )
+            first_download = first_download or created[0].id
+        if first_download:
+            self._spread_dates(DownloadStatistic, 'downloaded_at', first_download,
+                               now - period, period / max(downloads_total, 1))
+
+        for name in sorted(SOURCES):
+            rollup(name)
+        rollup_unique()
+        self._seed_views(rng, news, range(views_total - tail, views_total), now - period, step)
+
+    def _seed_views(self, rng, news, numbers, start, step):
+        for offset in range(0, len(numbers), 5000):
+            ViewStatistic.objects.bulk_create(
+                ViewStatistic(
+                    ip_address=f'10.{rng.randrange(4)}.{rng.randrange(256)}.{rng.randrange(256)}',
+                    path=f'/news/{item.id}/', section_id=item.section_id, category_id=item.category_id,
+                    news_id=item.id, created_at=start + step * i,
+                )
+                for i, item in ((i, rng.choice(news)) for i in numbers[offset:offset + 5000])
+            )
+
+    def _spread_dates(self, model, field, first_id, start, step):
+        """auto_now_add не дает задать дату в bulk_create: равномерно по id"""
+        table = model._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE "{table}" SET "{field}" = '
+                f"strftime('%%Y-%%m-%%d %%H:%%M:%%f', %s, '+' || ((id - %s) * %s) || ' seconds') "
+                f'WHERE id >= %s',
+                [start.strftime('%Y-%m-%d %H:%M:%S'), first_id, step.total_seconds(), first_id],
+            )
+
+    def scenarios(self):
+        section = (Section.objects.annotate(n=Count('news')).filter(n__gt=0).order_by('-n').first())
+        if section is None:
+            return []
+        category = (Category.objects.filter(section=section).annotate(n=Count('news'))
+                    .order_by('-n').first())
+        # Курсор последней страницы архива (см. keyset.py)
+        total = News.objects.count()
+        deep = News.objects.order_by(*keyset.ORDERING)[max(total - views.ARCHIVE_PAGE_SIZE - 1, 0)]
+        today = timezone.localdate()
+        period = {'start_date': (today - timedelta(days=90)).isoformat(), 'end_date': today.isoformat()}
+
+        section_kwargs = {'section_slug': section.slug}
+        result = [
+            ('news_archive, стр. 1', views.news_archive, reverse('news_site:news_archive'), {}, {}),
+            ('news_archive, последняя стр.', views.news_archive, reverse('news_site:news_archive'),
+             {'after': keyset.encode_cursor(deep)}, {}),
+            ('section_view', views.section_view, reverse('news_site:section', kwargs=section_kwargs),
+             {}, section_kwargs),
+        ]
+        if category is not None:
+            category_kwargs = {'section_slug': section.slug, 'category_path': category.path}
+            result.append(('category_view', views.category_view,
+                           reverse('news_site:category', kwargs=category_kwargs), {}, category_kwargs))
+        statistics = reverse('news_site:statistics')
+        result += [
+            ('statistics_view, 90 дней', views.statistics_view, statistics, period, {}),
+            ('statistics_view, раздел', views.statistics_view, statistics,
+             {**period, 'section_id': section.id, 'analyze_type': 'section'}, {}),
+            ('statistics_view, точные уникальные', views.statistics_view, statistics,
+             {**period, 'exact_unique': 1}, {}),
+        ]
+        return result
+
+    def measure(self, view, path, params, kwargs):
+        """{'page': мс, 'queries': [(sql, мс, план)]} - лучшее из self.repeat"""
+        factory = RequestFactory()
+        user = User(username='benchmark', is_staff=True, is_superuser=True, is_active=True)
+        queries = []
+
+        def record(execute, sql, sql_params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                queries.append((sql, sql_params))
+            return execute(sql, sql_params, many, context)
+
+        page_ms = None
+        for attempt in range(self.repeat):
+            request = factory.get(path, params)
+            request.user = user
+            del queries[:]
+            started = time.perf_counter()
+            with connection.execute_wrapper(record):
+                response = view(request, **kwargs)
+            elapsed = (time.perf_counter() - started) * 1000
+            page_ms = elapsed if page_ms is None else min(page_ms, elapsed)
+            if response.status_code != 200:
+                raise CommandError(f"{path}: ответ {response.status_code}")
+
+        measured = []
+        with connection.cursor() as cursor:
+            for sql, sql_params in queries:
+                # EXPLAIN не перепроверяет схему: без уникального текста sqlite3 вернул бы
+                # из кэша выражений план, построенный до удаления индексов
+                cursor.execute(f'EXPLAIN QUERY PLAN /* {id(queries)} */ {sql}', sql_params)
+                plan = [row[-1] for row in cursor.fetchall()]
+                best = None
+                for attempt in range(self.repeat):
+                    started = time.perf_counter()
+                    cursor.execute(sql, sql_params)
+                    cursor.fetchall()
+                    elapsed = (time.perf_counter() - started) * 1000
+                    best = elapsed if best is None else min(best, elapsed)
+                measured.append((sql, best, plan))
+        return {'page': page_ms, 'queries': measured}
+
+    def drop_indexes(self):
+        names = [index.name for model in INDEXED_MODELS for index in model._meta.indexes]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT name FROM sqlite_master WHERE type = 'index' AND name IN ({', '.join(['%s'] * len(names))})",
+                names,
+            )
+            existing = [row[0] for row in cursor.fetchall()]
+            for name in existing:
+                cursor.execute(f'DROP INDEX "{name}"')
+        return existing
+
+    def report(self, name, before, after, verbosity):
+        def summary(data):
+            sql_ms = sum(ms for _, ms, _ in data['queries'])
+            return f"{len(data['queries'])} запросов, SQL {sql_ms:.1f} мс, страница {data['page']:.1f} мс"
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"\n=== {name} ==="))
+        self.stdout.write(f"  до:    {summary(before)}")
+        self.stdout.write(f"  после: {summary(after)}")
+
+        for number, ((sql, before_ms, before_plan), (_, after_ms, after_plan)) in enumerate(
+            zip(before['queries'], after['queries']), 1
+        ):
+            if before_plan == after_plan and verbosity < 2:
+                continue
+            self.stdout.write(f"  [{number}] {sql[:200]}{'...' if len(sql) > 200 else ''}")
+            for label, ms, plan in (('до', before_ms, before_plan), ('после', after_ms, after_plan)):
+                self.stdout.write(f"      {label:<6}{ms:8.2f} мс  " + '\n                          '.join(plan))
@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from news_site import derivatives, editor_files
+from news_site.pagecache import invalidate_content
+
+
+class Command(BaseCommand):
+    help = (
+        "Строит уменьшенные копии (JPEG/PNG и WebP) картинок, загруженных через CKEditor, "
+        "для srcset в тексте новостей. Обрабатывает картинки без копий: запускать по cron "
+        "и один раз после обновления для уже загруженных файлов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help="Процессов для обработки картинок",
+        )
+        parser.add_argument('--force', action='store_true', help="Перестроить копии всех картинок")
+        parser.add_argument('--no-scan', action='store_true', help="Не сверять индекс файлов CKEditor с диском")
+
+    def handle(self, *args, **options):
+        if not options['no_scan']:
+            # Картинки, попавшие в папку загрузок в обход редактора
+            editor_files.scan()
+
+        built = skipped = 0
+        for path, widths in derivatives.build(derivatives.pending(options['force']), options['workers']):
+            if widths:
+                built += 1
+            else:
+                skipped += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{path}: {', '.join(map(str, widths)) or 'без копий'}")
+
+        if built:
+            # Страницы с этими картинками перерисуются с srcset
+            invalidate_content()
+        self.stdout.write(self.style.SUCCESS(
+            f"Обработано картинок: {built}, без копий (анимация или ошибка чтения): {skipped}"
+        ))
@@ -0,0 +1,99 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from news_site import blobs, orphans
+from news_site.models import FileBlob, NewsFile
+from news_site.pagecache import invalidate_content
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносит вложения новостей в хранилище по содержимому (news_site/blobs.py): "
+        "файлы хешируются параллельно, одинаковые остаются в одном экземпляре, копии "
+        "удаляются. Повторный запуск обрабатывает только файлы без FileBlob и "
+        "пересчитывает счетчики ссылок."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=min(8, os.cpu_count() or 1),
+            help="Потоков для хеширования (hashlib отпускает GIL)",
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Только посчитать, сколько места освободится")
+
+    def handle(self, *args, **options):
+        # Имя файла -> (id строк NewsFile, имя для расширения)
+        pending = {}
+        rows = NewsFile.objects.filter(blob__isnull=True).exclude(file='').values_list('id', 'file', 'filename')
+        for news_file_id, name, filename in rows.iterator():
+            pending.setdefault(name, ([], filename))[0].append(news_file_id)
+
+        def digest(name):
+            try:
+                return name, blobs.hash_path(default_storage.path(name))
+            except OSError:
+                return name, None
+
+        # Старые адреса, на которые ссылаются тексты новостей: эти файлы не удаляются
+        linked = set(orphans.content_references())
+
+        moved = duplicates = freed = missing = kept = 0
+        seen = set()
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as pool:
+            # Хешируют потоки, в базу пишет только основной поток
+            for name, result in pool.map(digest, pending):
+                if result is None:
+                    missing += 1
+                    self.stdout.write(self.style.WARNING(f"Нет файла: {name}"))
+                    continue
+                sha256, size = result
+                ids, filename = pending[name]
+
+                if options['dry_run']:
+                    if name not in linked and (sha256 in seen or FileBlob.objects.filter(sha256=sha256).exists()):
+                        duplicates += 1
+                        freed += size
+                    seen.add(sha256)
+                    moved += len(ids)
+                    continue
+
+                path = default_storage.path(name)
+                with transaction.atomic():
+                    blob = blobs.acquire_local(path, filename, sha256=sha256, size=size, count=len(ids))
+                    NewsFile.objects.filter(id__in=ids).update(blob=blob, file=blob.path)
+                moved += len(ids)
+                if name == blob.path or NewsFile.objects.filter(file=name).exists():
+                    continue
+                if name in linked:
+                    kept += 1
+                    continue
+                os.unlink(path)
+                if blob.ref_count > len(ids):
+                    # Содержимое уже было в хранилище - эта копия была лишней
+                    duplicates += 1
+                    freed += size
+
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(
+                f"Будет перенесено файлов: {moved}, копий: {duplicates}, освободится {freed / 1048576:.1f} МБ"
+            ))
+            return
+
+        fixed = blobs.recount()
+        if moved:
+            # У перенесенных файлов изменились URL
+            invalidate_content()
+        self.stdout.write(self.style.SUCCESS(
+            f"Перенесено файлов: {moved}, удалено копий: {duplicates}, "
+            f"освобождено {freed / 1048576:.1f} МБ, исправлено счетчиков ссылок: {fixed}"
+        ))
+        if kept:
+            self.stdout.write(self.style.WARNING(
+                f"Оставлено старых копий, на которые ссылаются тексты новостей: {kept}"
+            ))
+        if missing:
+            self.stdout.write(self.style.WARNING(f"Файлов не найдено на диске: {missing}"))
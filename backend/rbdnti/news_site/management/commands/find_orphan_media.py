@@ -0,0 +1,78 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from news_site import orphans
+
+
+def _megabytes(size):
+    return f"{size / 1048576:.1f} МБ"
+
+
+class Command(BaseCommand):
+    help = (
+        "Находит файлы в MEDIA_ROOT, на которые не ссылаются ни вложения новостей, ни "
+        "тексты (адреса /media/...). Без --quarantine только показывает, что найдено; "
+        "с --quarantine переносит файлы в MEDIA_ROOT/.quarantine/<время>/ с теми же путями."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quarantine', action='store_true', help="Перенести найденные файлы в карантин")
+        parser.add_argument(
+            '--min-age', type=float, default=orphans.MIN_AGE.total_seconds() / 3600,
+            help="Не трогать файлы моложе стольких часов (картинки в несохраненных новостях)",
+        )
+        parser.add_argument(
+            '--purge-quarantine', type=int, metavar='DAYS',
+            help="Сначала удалить из карантина запуски старше DAYS дней",
+        )
+        parser.add_argument('--workers', type=int, default=orphans.WORKERS, help="Потоков для обхода каталогов")
+
+    def handle(self, *args, **options):
+        if options['min_age'] < 0:
+            raise CommandError("--min-age не может быть отрицательным")
+
+        if options['purge_quarantine'] is not None:
+            removed, freed = orphans.purge_quarantine(options['purge_quarantine'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Удалено из карантина запусков: {removed}, освобождено {_megabytes(freed)}"
+            ))
+
+        batch = orphans.quarantine_batch() if options['quarantine'] else None
+        found = moved = found_size = 0
+        # Итоги по каталогам верхних уровней (news_files/ckeditor_uploads и т.п.)
+        by_directory = Counter()
+        sizes = Counter()
+        with orphans.find_orphans(options['workers'], timedelta(hours=options['min_age'])) as scan:
+            for path, size in scan.orphans():
+                found += 1
+                found_size += size
+                directory = '/'.join(path.split('/')[:-1][:2]) or '.'
+                by_directory[directory] += 1
+                sizes[directory] += size
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"{path} ({size} байт)")
+                if batch:
+                    try:
+                        orphans.quarantine(path, batch)
+                    except OSError as e:
+                        self.stdout.write(self.style.WARNING(f"Не перенесен {path}: {e}"))
+                        continue
+                    moved += 1
+
+            self.stdout.write(
+                f"Файлов в MEDIA_ROOT: {scan.files} ({_megabytes(scan.size)}), "
+                f"ссылок на отсутствующие файлы: {scan.missing}"
+            )
+
+        for directory, count in sorted(by_directory.items()):
+            self.stdout.write(f"  {directory}: {count} ({_megabytes(sizes[directory])})")
+        if batch:
+            self.stdout.write(self.style.SUCCESS(
+                f"Перенесено в карантин {moved} из {found} файлов ({_megabytes(found_size)}): {batch}"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Файлов без ссылок: {found} ({_megabytes(found_size)}). Перенести в карантин: --quarantine"
+            ))
@@ -0,0 +1,78 @@
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from news_site import bulkimport, ingest
+from news_site.models import ImportProgress
+from news_site.quotes import invalidate_quotes
+
+
+class Command(BaseCommand):
+    help = (
+        "Импортирует новости с вложениями из манифеста (CSV или JSONL, поля - см. "
+        "news_site/bulkimport.py) порциями через bulk_create. Число обработанных строк "
+        "хранится в базе (ImportProgress) и пишется в транзакции порции; повторный "
+        "запуск продолжает с места остановки. "
+        "С --quotes заменяет цитаты бегущей строки строками текстового файла."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('manifest', nargs='?', help="Путь к манифесту (.csv или .jsonl)")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help="Формат манифеста (по умолчанию по расширению)")
+        parser.add_argument('--files-dir', help="Каталог с файлами вложений (по умолчанию - каталог манифеста)")
+        parser.add_argument('--chunk-size', type=int, default=bulkimport.CHUNK_SIZE, help="Новостей в одной транзакции")
+        parser.add_argument('--workers', type=int, default=ingest.WORKERS, help="Потоков для копирования файлов")
+        parser.add_argument('--restart', action='store_true', help="Начать сначала, не глядя на сохраненный ход импорта")
+        parser.add_argument('--quotes', help="Текстовый файл с цитатами, по одной на строку")
+
+    def handle(self, *args, **options):
+        if options['quotes']:
+            with open(options['quotes'], 'rb') as f:
+                total = bulkimport.import_quotes(f)
+            invalidate_quotes()
+            self.stdout.write(self.style.SUCCESS(f"Загружено цитат: {total}"))
+            if not options['manifest']:
+                return
+        if not options['manifest']:
+            raise CommandError("Укажите манифест или --quotes")
+
+        manifest = options['manifest']
+        if not os.path.isfile(manifest):
+            raise CommandError(f"Нет файла {manifest}")
+        progress, _ = ImportProgress.objects.get_or_create(manifest=os.path.abspath(manifest))
+        if options['restart'] and progress.rows:
+            progress.rows = 0
+            progress.save(update_fields=['rows', 'updated_at'])
+        done = progress.rows
+        if done:
+            self.stdout.write(f"Продолжение с строки данных {done + 1}")
+
+        importer = bulkimport.ManifestImporter(
+            options['files_dir'] or os.path.dirname(os.path.abspath(manifest)),
+            workers=options['workers'],
+            log=lambda message: self.stdout.write(self.style.WARNING(message)),
+        )
+        rows = islice(bulkimport.read_manifest(manifest, options['format']), done, None)
+        chunk_size = max(options['chunk_size'], 1)
+        started = time.perf_counter()
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            importer.import_chunk(chunk, progress)
+            self.stdout.write(
+                f"Строк: {progress.rows}, новостей: {importer.stats['news']}, файлов: {importer.stats['files']} "
+                f"({time.perf_counter() - started:.0f} с)"
+            )
+
+        stats = importer.stats
+        self.stdout.write(self.style.SUCCESS(
+            f"Импортировано новостей: {stats['news']}, файлов: {stats['files']}; создано разделов: "
+            f"{stats['sections']}, категорий: {stats['categories']}, подразделений: {stats['subdivisions']}"
+        ))
+        if stats['skipped'] or stats['files_skipped']:
+            self.stdout.write(self.style.WARNING(
+                f"Пропущено строк: {stats['skipped']}, файлов: {stats['files_skipped']}"
+            ))
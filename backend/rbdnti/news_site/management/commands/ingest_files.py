@@ -0,0 +1,45 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from news_site import ingest
+from news_site.models import News
+
+
+class Command(BaseCommand):
+    help = (
+        "Прикрепляет к новости файлы из ZIP-архива или каталога (как \"Загрузить файлы\" в админке), "
+        "но без ограничения времени запроса - для больших пакетов сканов. Относительный каталог "
+        "ищется в UPLOAD_STAGING_DIR."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('news_id', type=int, help="id новости")
+        parser.add_argument('source', help="ZIP-архив или каталог")
+        parser.add_argument('--workers', type=int, default=ingest.WORKERS, help="Потоков для копирования файлов")
+
+    def handle(self, *args, **options):
+        news = News.objects.filter(pk=options['news_id']).first()
+        if news is None:
+            raise CommandError(f"Новость {options['news_id']} не найдена")
+
+        source = options['source']
+        try:
+            if os.path.isfile(source):
+                with open(source, 'rb') as archive:
+                    report = ingest.ingest(news, ingest.zip_entries(archive), options['workers'])
+            else:
+                path = source if os.path.isabs(source) else ingest.resolve_staging_dir(source)
+                if not os.path.isdir(path):
+                    raise CommandError(f"Нет файла или каталога {source}")
+                report = ingest.ingest(news, ingest.directory_entries(path), options['workers'])
+        except ingest.IngestError as e:
+            raise CommandError(str(e))
+
+        for result in report:
+            if not result.imported:
+                self.stdout.write(self.style.WARNING(f"{result.name}: пропущен ({result.detail})"))
+        imported = sum(result.imported for result in report)
+        self.stdout.write(self.style.SUCCESS(
+            f"Прикреплено файлов: {imported}, пропущено: {len(report) - imported}"
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from news_site import search
+
+
+class Command(BaseCommand):
+    help = "Полностью пересобирает полнотекстовый индекс новостей (FTS5)."
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError("Полнотекстовый индекс поддерживается только для SQLite")
+        total = search.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Проиндексировано новостей: {total}"))
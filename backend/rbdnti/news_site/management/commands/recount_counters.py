@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from news_site import counters
+from news_site.pagecache import invalidate_content
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает счетчики новостей и категорий у разделов и категорий."
+
+    def handle(self, *args, **options):
+        fixed = counters.recount()
+        if fixed['sections'] or fixed['categories']:
+            # Счетчики показываются на закэшированных страницах и в меню
+            invalidate_content()
+        self.stdout.write(self.style.SUCCESS(
+            f"Исправлено разделов: {fixed['sections']}, категорий: {fixed['categories']}"
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from news_site.statistics import SOURCES, UNIQUE_SOURCE, rollup, rollup_unique
+
+
+class Command(BaseCommand):
+    help = (
+        "Сворачивает новые строки ViewStatistic/DownloadStatistic в суточные агрегаты "
+        "DailyStatistic и скетчи уникальных посетителей VisitorSketch. Обрабатываются "
+        "только строки после последней отметки; запускать периодически (cron), "
+        "не более одного экземпляра одновременно."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', choices=sorted(SOURCES) + [UNIQUE_SOURCE], action='append',
+            help="Источник для агрегации (по умолчанию все)",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=50000,
+            help="Сколько сырых строк обрабатывать в одной транзакции",
+        )
+
+    def handle(self, *args, **options):
+        for name in options['source'] or sorted(SOURCES) + [UNIQUE_SOURCE]:
+            if name == UNIQUE_SOURCE:
+                processed = rollup_unique(chunk_size=options['chunk_size'])
+            else:
+                processed = rollup(name, chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(f"{name}: учтено строк {processed}"))
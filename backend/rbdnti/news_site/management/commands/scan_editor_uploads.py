@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from news_site import editor_files
+
+
+class Command(BaseCommand):
+    help = (
+        "Сверяет индекс файлов CKEditor (страница \"Файлы CKEditor\") с папкой загрузок: "
+        "перечитываются только каталоги, изменившиеся с прошлой сверки."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Перечитать все каталоги, не глядя на время изменения")
+
+    def handle(self, *args, **options):
+        stats = editor_files.scan(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Добавлено: {stats['added']}, изменено: {stats['updated']}, удалено: {stats['removed']}; "
+            f"каталогов проверено: {stats['scanned']}, без изменений: {stats['skipped']}"
+        ))
@@ -1,5 +1,7 @@
 # middleware.py
-from .models import ViewStatistic, Section, Category, News
+from .models import ViewStatistic, News
+from .resolver import resolver
+from .tracking import tracker
 from django.utils import timezone
 
 class StatisticsMiddleware:
@@ -13,13 +15,15 @@ class StatisticsMiddleware:
         if (request.method == 'GET' and 
             not request.path.startswith('/admin/') and
             not request.path.startswith('/ckeditor/') and
-            not request.path.startswith('/static/')):
+            not request.path.startswith('/static/') and
+            # "Показать еще" (?partial=1) - продолжение уже учтенной страницы
+            not request.GET.get('partial')):
             self.track_view(request)
             
         return response
     
     def track_view(self, request):
-        """Простой трекинг просмотров"""
+        """Трекинг просмотров: событие ставится в очередь, запись в БД - пачками"""
         try:
             path = request.path
             
@@ -31,16 +35,17 @@ class StatisticsMiddleware:
             user_agent = request.META.get('HTTP_USER_AGENT', '')[:500]
             
             # Определяем тип страницы
-            section, category, news = self.analyze_path(path)
+            section_id, category_id, news_id = self.analyze_path(request, path)
             
-            ViewStatistic.objects.create(
+            tracker.record(ViewStatistic(
                 ip_address=ip,
                 user_agent=user_agent,
                 path=path,
-                section=section,
-                category=category,
-                news=news
-            )
+                section_id=section_id,
+                category_id=category_id,
+                news_id=news_id,
+                created_at=timezone.now()
+            ))
             
         except Exception as e:
             print(f"Error tracking view: {e}")
@@ -54,56 +59,31 @@ class StatisticsMiddleware:
             ip = request.META.get('REMOTE_ADDR')
         return ip
     
-    def analyze_path(self, path):
-        """Анализ пути для определения объекта"""
-        section = None
-        category = None
-        news = None
-        
+    def analyze_path(self, request, path):
+        """Анализ пути для определения объекта: (section_id, category_id, news_id)"""
+        # Представление уже определило объекты (например, news_detail)
+        target = getattr(request, 'statistics_target', None)
+        if target:
+            return target
+
         # Главная страница
         if path == '/':
             return None, None, None
-            
+
         # Детальная страница новости
         elif path.startswith('/news/'):
             try:
                 news_id = int(path.split('/')[-2])
-                news = News.objects.filter(id=news_id).first()
-                if news:
-                    return news.section, news.category, news
+                row = News.objects.filter(id=news_id).values_list('section_id', 'category_id', 'id').first()
+                if row:
+                    return row
             except (ValueError, IndexError):
                 pass
-                
+
         # Разделы и категории
         path_parts = [p for p in path.split('/') if p]
-        
         if path_parts:
-            # Ищем раздел
-            section_slug = path_parts[0]
-            section = Section.objects.filter(slug=section_slug).first()
-            
-            # Ищем категорию если есть дополнительные части пути
-            if section and len(path_parts) > 1:
-                category_path = '/'.join(path_parts[1:])
-                category = self.find_category_by_path(section, category_path)
-        
-        return section, category, news
-    
-    def find_category_by_path(self, section, category_path):
-        """Поиск категории по пути"""
-        if not section:
-            return None
-            
-        slugs = [slug for slug in category_path.split('/') if slug]
-        if not slugs:
-            return None
-            
-        category = None
-        parent = None
-        for slug in slugs:
-            try:
-                category = Category.objects.get(section=section, slug=slug, parent=parent)
-                parent = category
-            except Category.DoesNotExist:
-                return None
-        return category
\ No newline at end of file
+            section_id, category_id = resolver.resolve(path_parts[0], '/'.join(path_parts[1:]))
+            return section_id, category_id, None
+
+        return None, None, None
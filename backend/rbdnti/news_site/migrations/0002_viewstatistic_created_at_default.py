@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news_site', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='viewstatistic',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата создания'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:06
+
+from django.db import migrations, models
+
+
+def fill_category_paths(apps, schema_editor):
+    Category = apps.get_model('news_site', 'Category')
+    categories = {c.id: c for c in Category.objects.all()}
+
+    def build(category, seen=()):
+        if category.tree_path:
+            return
+        parent = categories.get(category.parent_id)
+        if parent is not None and parent.id not in seen:
+            build(parent, seen + (category.id,))
+            category.tree_path = f"{parent.tree_path}{category.id}/"
+            category.path = f"{parent.path}/{category.slug}"
+            category.full_path = f"{parent.full_path} / {category.title}"
+        else:
+            category.tree_path = f"/{category.id}/"
+            category.path = category.slug
+            category.full_path = category.title
+
+    for category in categories.values():
+        build(category)
+    Category.objects.bulk_update(categories.values(), ['tree_path', 'path', 'full_path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news_site', '0002_viewstatistic_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='full_path',
+            field=models.CharField(blank=True, editable=False, max_length=1000, verbose_name='Полный путь'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=1000, verbose_name='Путь URL'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='tree_path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=500, verbose_name='Путь по id'),
+        ),
+        migrations.RunPython(fill_category_paths, migrations.RunPython.noop),
+    ]
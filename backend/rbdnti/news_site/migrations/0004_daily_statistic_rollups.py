@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news_site', '0003_category_materialized_paths'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatisticWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Источник')),
+                ('last_id', models.BigIntegerField(default=0, verbose_name='Последний id')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Отметка агрегации',
+                'verbose_name_plural': 'Отметки агрегации',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyStatistic',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True, verbose_name='День')),
+                ('views', models.PositiveIntegerField(default=0, verbose_name='Просмотров')),
+                ('downloads', models.PositiveIntegerField(default=0, verbose_name='Скачиваний')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='news_site.category', verbose_name='Категория')),
+                ('news', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='news_site.news', verbose_name='Новость')),
+                ('news_file', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='news_site.newsfile', verbose_name='Файл')),
+                ('section', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='news_site.section', verbose_name='Раздел')),
+                ('subdivision', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='news_site.subdivision', verbose_name='Подразделение')),
+            ],
+            options={
+                'verbose_name': 'Суточная статистика',
+                'verbose_name_plural': 'Суточная статистика',
+                'ordering': ['-day'],
+            },
+        ),
+    ]
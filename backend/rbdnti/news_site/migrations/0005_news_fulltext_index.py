@@ -0,0 +1,52 @@
+# Полнотекстовый индекс новостей (SQLite FTS5), см. news_site/search.py
+
+import html
+
+from django.db import migrations
+from django.utils.html import strip_tags
+
+FTS_TABLE = 'news_site_news_fts'
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    News = apps.get_model('news_site', 'News')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "title, content, subdivision, filenames, "
+            "tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        rows = []
+        for news in News.objects.select_related('subdivision').prefetch_related('files').iterator(chunk_size=500):
+            rows.append((
+                news.id,
+                news.title or '',
+                ' '.join(html.unescape(strip_tags(news.content or '')).split()),
+                news.subdivision.name if news.subdivision else '',
+                ' '.join(f.filename for f in news.files.all() if f.filename),
+            ))
+            if len(rows) >= 500:
+                cursor.executemany(f"INSERT INTO {FTS_TABLE} (rowid, title, content, subdivision, filenames) VALUES (%s, %s, %s, %s, %s)", rows)
+                rows = []
+        if rows:
+            cursor.executemany(f"INSERT INTO {FTS_TABLE} (rowid, title, content, subdivision, filenames) VALUES (%s, %s, %s, %s, %s)", rows)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news_site', '0004_daily_statistic_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
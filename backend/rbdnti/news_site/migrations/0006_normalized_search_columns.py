@@ -0,0 +1,54 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:11
+
+from django.db import migrations, models
+
+
+def normalize(value):
+    # Копия news_site.lookups.normalize_text на момент миграции
+    if not value:
+        return ''
+    return ' '.join(str(value).split()).casefold()
+
+
+def fill_normalized_columns(apps, schema_editor):
+    for model_name, source, target in (
+        ('Subdivision', 'name', 'name_normalized'),
+        ('News', 'title', 'title_normalized'),
+        ('NewsFile', 'filename', 'filename_normalized'),
+    ):
+        Model = apps.get_model('news_site', model_name)
+        batch = []
+        for obj in Model.objects.only('id', source).iterator(chunk_size=1000):
+            setattr(obj, target, normalize(getattr(obj, source)))
+            batch.append(obj)
+            if len(batch) >= 1000:
+                Model.objects.bulk_update(batch, [target])
+                batch = []
+        if batch:
+            Model.objects.bulk_update(batch, [target])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news_site', '0005_news_fulltext_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='news',
+            name='title_normalized',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255, verbose_name='Заголовок (для поиска)'),
+        ),
+        migrations.AddField(
+            model_name='newsfile',
+            name='filename_normalized',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255, verbose_name='Имя файла (для поиска)'),
+        ),
+        migrations.AddField(
+            model_name='subdivision',
+            name='name_normalized',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100, verbose_name='Название (для поиска)'),
+        ),
+        migrations.RunPython(fill_normalized_columns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:17
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_counters(apps, schema_editor):
+    Section = apps.get_model('news_site', 'Section')
+    Category = apps.get_model('news_site', 'Category')
+    News = apps.get_model('news_site', 'News')
+
+    categories_by_section = dict(Category.objects.order_by().values_list('section_id').annotate(n=Count('id')))
+    news_by_section = dict(News.objects.order_by().values_list('section_id').annotate(n=Count('id')))
+    news_by_category = dict(
+        News.objects.filter(category__isnull=False).order_by().values_list('category_id').annotate(n=Count('id'))
+    )
+
+    sections = list(Section.objects.all())
+    for section in sections:
+        section.categories_count = categories_by_section.get(section.id, 0)
+        section.news_count = news_by_section.get(section.id, 0)
+    Section.objects.bulk_update(sections, ['categories_count', 'news_count'], batch_size=500)
+
+    categories = list(Category.objects.all())
+    subtree = {}
+    for category in categories:
+        direct = news_by_category.get(category.id, 0)
+        for part in category.tree_path.split('/'):
+            if part:
+                subtree[int(part)] = subtree.get(int(part), 0) + direct
+    for category in categories:
+        category.news_count = news_by_category.get(category.id, 0)
+        category.subtree_news_count = subtree.get(category.id, 0)
+    Category.objects.bulk_update(categories, ['news_count', 'subtree_news_count'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news_site', '0007_news_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='news_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Новостей'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='subtree_news_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Новостей с подкатегориями'),
+        ),
+        migrations.AddField(
+            model_name='section',
+            name='categories_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Категорий'),
+        ),
+        migrations.AddField(
+            model_name='section',
+            name='news_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='Новостей'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news_site', '0008_section_category_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitorSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(db_index=True, verbose_name='День')),
+                ('registers', models.BinaryField(verbose_name='Регистры (zlib)')),
+                ('section', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='news_site.section', verbose_name='Раздел')),
+            ],
+            options={
+                'verbose_name': 'Скетч уникальных посетителей',
+                'verbose_name_plural': 'Скетчи уникальных посетителей',
+                'ordering': ['-day'],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news_site', '0009_visitor_sketches'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='dailystatistic',
+            index=models.Index(fields=['section', 'news_file', 'day'], name='daily_section_file_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailystatistic',
+            index=models.Index(fields=['category', 'news_file', 'day'], name='daily_category_file_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailystatistic',
+            index=models.Index(fields=['news_file', 'day'], name='daily_file_day_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['order', '-created_at', '-id'], name='news_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['section', 'category', 'order', '-created_at', '-id'], name='news_section_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['category', 'order', '-created_at', '-id'], name='news_category_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['created_at', 'subdivision'], name='news_created_subdivision_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='viewstatistic',
+            index=models.Index(fields=['created_at', 'ip_address'], name='view_created_ip_idx'),
+        ),
+    ]
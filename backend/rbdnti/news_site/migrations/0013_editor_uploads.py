@@ -0,0 +1,44 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news_site', '0012_file_blobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EditorUploadDirectory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500, unique=True, verbose_name='Путь')),
+                ('mtime_ns', models.BigIntegerField(verbose_name='Время изменения, нс')),
+            ],
+            options={
+                'verbose_name': 'Каталог загрузок CKEditor',
+                'verbose_name_plural': 'Каталоги загрузок CKEditor',
+            },
+        ),
+        migrations.CreateModel(
+            name='EditorUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=500, unique=True, verbose_name='Путь')),
+                ('directory', models.CharField(db_index=True, max_length=500, verbose_name='Каталог')),
+                ('name', models.CharField(max_length=255, verbose_name='Имя файла')),
+                ('name_normalized', models.CharField(blank=True, db_index=True, editable=False, max_length=255, verbose_name='Имя файла (для поиска)')),
+                ('size', models.BigIntegerField(verbose_name='Размер')),
+                ('modified_at', models.DateTimeField(verbose_name='Загружен')),
+                ('is_image', models.BooleanField(default=False, verbose_name='Изображение')),
+            ],
+            options={
+                'verbose_name': 'Файл CKEditor',
+                'verbose_name_plural': 'Файлы CKEditor',
+                'ordering': ['-modified_at'],
+                'indexes': [models.Index(fields=['modified_at', 'id'], name='editor_upload_date_idx'), models.Index(fields=['name', 'id'], name='editor_upload_name_idx'), models.Index(fields=['size', 'id'], name='editor_upload_size_idx')],
+            },
+        ),
+    ]
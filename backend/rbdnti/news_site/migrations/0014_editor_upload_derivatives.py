@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-17 23:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news_site', '0013_editor_uploads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='editorupload',
+            name='derivative_widths',
+            field=models.JSONField(blank=True, editable=False, null=True, verbose_name='Ширины уменьшенных копий'),
+        ),
+        migrations.AddField(
+            model_name='editorupload',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Ширина'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news_site', '0014_editor_upload_derivatives'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='news',
+            index=models.Index(fields=['updated_at'], name='news_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='newsfile',
+            index=models.Index(fields=['updated_at'], name='news_file_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news_site', '0015_updated_at_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='editorupload',
+            name='name_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Имя файла (для поиска)'),
+        ),
+        migrations.AlterField(
+            model_name='news',
+            name='title_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Заголовок (для поиска)'),
+        ),
+        migrations.AlterField(
+            model_name='newsfile',
+            name='filename_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Имя файла (для поиска)'),
+        ),
+        migrations.AlterField(
+            model_name='subdivision',
+            name='name_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='Название (для поиска)'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-18 00:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('news_site', '0016_drop_normalized_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('manifest', models.CharField(max_length=500, unique=True, verbose_name='Манифест')),
+                ('rows', models.IntegerField(default=0, verbose_name='Обработано строк')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Ход импорта',
+                'verbose_name_plural': 'Ход импорта',
+            },
+        ),
+    ]
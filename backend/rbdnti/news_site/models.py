@@ -1,18 +1,45 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
 from ckeditor.fields import RichTextField
 from ckeditor_uploader.fields import RichTextUploadingField
 import os
+import uuid
 from django.utils import timezone
 from django.contrib.auth.models import User
+from .lookups import normalize_text
+
+
+class CounterFieldsMixin:
+    """
+    Счетчики (counters.py) меняются только UPDATE ... SET x = x + d. Полный
+    save() существующей строки (админка, перенос категории) их не пишет -
+    иначе загруженное раньше значение затерло бы приращения, сделанные с тех пор.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and not args and kwargs.get('update_fields') is None \
+                and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields
+            ]
+        super().save(*args, **kwargs)
+
 
 class Subdivision(models.Model):
     name = models.CharField(max_length=100, unique=True, verbose_name="Название подразделения")
     order = models.IntegerField(default=0, verbose_name="Порядок отображения")
+    # Нормализованная копия для поиска (см. lookups.py)
+    name_normalized = models.CharField(max_length=100, blank=True, editable=False, verbose_name="Название (для поиска)")
     
     def __str__(self):
         return self.name
     
     def save(self, *args, **kwargs):
+        self.name_normalized = normalize_text(self.name)
         if not self.order:
             max_order = Subdivision.objects.aggregate(models.Max('order'))['order__max'] or 0
             self.order = max_order + 1
@@ -23,12 +50,16 @@ class Subdivision(models.Model):
         verbose_name_plural = "Подразделения"
         ordering = ['order', 'name']
 
-class Section(models.Model):
+class Section(CounterFieldsMixin, models.Model):
     title = models.CharField(max_length=255, verbose_name="Название")
     slug = models.SlugField(unique=True, verbose_name="URL")
     description = models.TextField(blank=True, verbose_name="Описание")
     order = models.IntegerField(default=0, verbose_name="Порядок отображения")
     subdivision = models.ForeignKey(Subdivision, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Подразделение")
+    # Счетчики, поддерживаются сигналами (см. counters.py)
+    categories_count = models.IntegerField(default=0, editable=False, verbose_name="Категорий")
+    news_count = models.IntegerField(default=0, editable=False, verbose_name="Новостей")
+    counter_fields = ('categories_count', 'news_count')
 
     def __str__(self):
         return self.title
@@ -44,7 +75,7 @@ class Section(models.Model):
         verbose_name_plural = "Разделы"
         ordering = ['order', 'title']
 
-class Category(models.Model):
+class Category(CounterFieldsMixin, models.Model):
     section = models.ForeignKey(Section, on_delete=models.CASCADE, related_name='categories', verbose_name="Раздел")
     title = models.CharField(max_length=255, verbose_name="Название")
     slug = models.SlugField(verbose_name="URL")
@@ -53,6 +84,17 @@ class Category(models.Model):
     order = models.IntegerField(default=0, verbose_name="Порядок отображения")
     subdivision = models.ForeignKey(Subdivision, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Подразделение")
 
+    # Материализованные пути, поддерживаются в save()
+    # tree_path - id предков и самой категории: "/1/5/9/" (для выборки поддерева)
+    tree_path = models.CharField(max_length=500, blank=True, editable=False, db_index=True, verbose_name="Путь по id")
+    path = models.CharField(max_length=1000, blank=True, editable=False, verbose_name="Путь URL")
+    full_path = models.CharField(max_length=1000, blank=True, editable=False, verbose_name="Полный путь")
+
+    # Счетчики, поддерживаются сигналами (см. counters.py)
+    news_count = models.IntegerField(default=0, editable=False, verbose_name="Новостей")
+    subtree_news_count = models.IntegerField(default=0, editable=False, verbose_name="Новостей с подкатегориями")
+    counter_fields = ('news_count', 'subtree_news_count')
+
     class Meta:
         unique_together = ('section', 'slug', 'parent')
         verbose_name = "Категория"
@@ -62,6 +104,13 @@ class Category(models.Model):
     def __str__(self):
         return self.get_full_path()
 
+    def clean(self):
+        super().clean()
+        if self.pk and self.parent_id:
+            own_tree_path = Category.objects.filter(pk=self.pk).values_list('tree_path', flat=True).first()
+            if own_tree_path and Category.objects.filter(Category.subtree_q(own_tree_path), pk=self.parent_id).exists():
+                raise ValidationError({'parent': "Категория не может быть вложена сама в себя"})
+
     def save(self, *args, **kwargs):
         if not self.order:
             max_order = Category.objects.filter(
@@ -69,9 +118,67 @@ class Category(models.Model):
                 parent=self.parent
             ).aggregate(models.Max('order'))['order__max'] or 0
             self.order = max_order + 1
-        super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            old = None
+            if self.pk:
+                old = Category.objects.filter(pk=self.pk).values('tree_path', 'path', 'full_path').first()
+            is_new = old is None
+            if not is_new:
+                self._build_paths()
+            super().save(*args, **kwargs)
+
+            if is_new:
+                # id известен только после вставки
+                self._build_paths()
+                Category.objects.filter(pk=self.pk).update(
+                    tree_path=self.tree_path, path=self.path, full_path=self.full_path
+                )
+            elif (old['tree_path'], old['path'], old['full_path']) != (self.tree_path, self.path, self.full_path):
+                self._rebuild_descendant_paths(old)
+
+    def _build_paths(self):
+        parent = self.parent
+        if parent:
+            self.tree_path = f"{parent.tree_path}{self.pk}/"
+            self.path = f"{parent.path}/{self.slug}"
+            self.full_path = f"{parent.full_path} / {self.title}"
+        else:
+            self.tree_path = f"/{self.pk}/"
+            self.path = self.slug
+            self.full_path = self.title
+
+    def _rebuild_descendant_paths(self, old):
+        """Переписать пути потомков после переименования/перемещения"""
+        descendants = list(
+            Category.objects.filter(Category.subtree_q(old['tree_path'])).exclude(pk=self.pk)
+        )
+        for category in descendants:
+            category.tree_path = self.tree_path + category.tree_path[len(old['tree_path']):]
+            category.path = self.path + category.path[len(old['path']):]
+            category.full_path = self.full_path + category.full_path[len(old['full_path']):]
+        Category.objects.bulk_update(descendants, ['tree_path', 'path', 'full_path'], batch_size=500)
+
+    @staticmethod
+    def subtree_q(tree_path, field='tree_path'):
+        """
+        Фильтр "поддерево с корнем tree_path" как диапазон по индексу:
+        все пути с префиксом "/1/5/" лежат в [ "/1/5/", "/1/50" ), т.к. '0' следует за '/'.
+        """
+        upper = tree_path[:-1] + '0'
+        return Q(**{f'{field}__gte': tree_path, f'{field}__lt': upper})
+
+    def get_subtree(self):
+        """Категория и все ее потомки одним запросом"""
+        return Category.objects.filter(Category.subtree_q(self.tree_path))
+
+    def get_descendant_ids(self):
+        """id категории и всех ее потомков"""
+        return list(self.get_subtree().values_list('id', flat=True))
 
     def get_full_path(self):
+        if self.full_path:
+            return self.full_path
         path = [self.title]
         parent = self.parent
         while parent:
@@ -80,6 +187,8 @@ class Category(models.Model):
         return " / ".join(path)
 
     def get_path(self):
+        if self.path:
+            return self.path
         path = [self.slug]
         parent = self.parent
         while parent:
@@ -93,14 +202,18 @@ class News(models.Model):
     title = models.CharField(max_length=255, verbose_name="Заголовок")
     content = RichTextUploadingField(blank=True, verbose_name="Содержание")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
     order = models.IntegerField(default=0, verbose_name="Порядок отображения")
     subdivision = models.ForeignKey(Subdivision, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Подразделение")
     author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Автор")
+    # Нормализованная копия для поиска (см. lookups.py)
+    title_normalized = models.CharField(max_length=255, blank=True, editable=False, verbose_name="Заголовок (для поиска)")
 
     def __str__(self):
         return self.title
 
     def save(self, *args, **kwargs):
+        self.title_normalized = normalize_text(self.title)
         if not self.order:
             max_order = News.objects.aggregate(models.Max('order'))['order__max'] or 0
             self.order = max_order + 1
@@ -110,19 +223,68 @@ class News(models.Model):
         verbose_name = "Новость"
         verbose_name_plural = "Новости"
         ordering = ['order', '-created_at']
+        # Списки новостей (архив, раздел, категория) и отбор за период в статистике;
+        # замеры - команда benchmark_queries
+        indexes = [
+            models.Index(fields=['order', '-created_at', '-id'], name='news_listing_idx'),
+            models.Index(fields=['section', 'category', 'order', '-created_at', '-id'], name='news_section_listing_idx'),
+            models.Index(fields=['category', 'order', '-created_at', '-id'], name='news_category_listing_idx'),
+            models.Index(fields=['created_at', 'subdivision'], name='news_created_subdivision_idx'),
+            # Max(updated_at) для штампа архива (conditional.py) - чтение конца индекса
+            models.Index(fields=['updated_at'], name='news_updated_idx'),
+        ]
+
+class FileBlob(models.Model):
+    """
+    Содержимое вложения, хранящееся один раз (см. blobs.py).
+    Файл лежит по адресу, вычисленному из SHA-256; ref_count - сколько
+    NewsFile на него ссылается. Последняя ссылка удаляет и файл.
+    """
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name="SHA-256")
+    path = models.CharField(max_length=255, verbose_name="Путь в хранилище")
+    size = models.BigIntegerField(verbose_name="Размер")
+    ref_count = models.PositiveIntegerField(default=0, verbose_name="Число ссылок")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+
+    def __str__(self):
+        return self.path
+
+    class Meta:
+        verbose_name = "Содержимое файла"
+        verbose_name_plural = "Содержимое файлов"
+
 
 class NewsFile(models.Model):
     news = models.ForeignKey(News, on_delete=models.CASCADE, related_name='files', verbose_name="Новость")
     file = models.FileField(upload_to='news_files/', verbose_name="Файл")
+    # Пусто у файлов, еще не перенесенных командой dedupe_files
+    blob = models.ForeignKey(FileBlob, on_delete=models.PROTECT, null=True, blank=True, editable=False,
+                             related_name='news_files', verbose_name="Содержимое")
     filename = models.CharField(max_length=255, blank=True, verbose_name="Имя файла")
     created_at = models.DateTimeField(default=timezone.now, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
+    # Нормализованная копия для поиска (см. lookups.py)
+    filename_normalized = models.CharField(max_length=255, blank=True, editable=False, verbose_name="Имя файла (для поиска)")
 
     def save(self, *args, **kwargs):
         if not self.filename:
             self.filename = self.file.name
+        self.filename_normalized = normalize_text(self.filename)
         if not self.id:
             self.created_at = timezone.now()
-        super().save(*args, **kwargs)
+        if not self.file or self.file._committed:
+            super().save(*args, **kwargs)
+            return
+
+        # Новый файл: вместо копии в news_files/ - ссылка на общее содержимое
+        from . import blobs
+        with transaction.atomic():
+            old_blob_id = self.blob_id
+            self.blob = blobs.acquire(self.file, self.filename)
+            self.file.name = self.blob.path
+            self.file._committed = True
+            super().save(*args, **kwargs)
+            blobs.release(old_blob_id)
 
     def __str__(self):
         return self.filename
@@ -131,6 +293,10 @@ class NewsFile(models.Model):
         verbose_name = "Файл новости"
         verbose_name_plural = "Файлы новостей"
         ordering = ['-created_at']
+        indexes = [
+            # Max(updated_at) для штампа архива (conditional.py)
+            models.Index(fields=['updated_at'], name='news_file_updated_idx'),
+        ]
 
 class ViewStatistic(models.Model):
     ip_address = models.GenericIPAddressField(verbose_name="IP-адрес")
@@ -139,12 +305,17 @@ class ViewStatistic(models.Model):
     section = models.ForeignKey(Section, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Раздел")
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Категория")
     news = models.ForeignKey(News, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Новость")
-    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    # Время запроса, а не момент записи: события пишутся пачками (см. tracking.py)
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Дата создания")
 
     class Meta:
         verbose_name = "Статистика просмотров"
         verbose_name_plural = "Статистика просмотров"
         ordering = ['-created_at']
+        indexes = [
+            # Точный подсчет уникальных IP за период - только по индексу
+            models.Index(fields=['created_at', 'ip_address'], name='view_created_ip_idx'),
+        ]
 
 class DownloadStatistic(models.Model):
     news_file = models.ForeignKey(NewsFile, on_delete=models.CASCADE, verbose_name="Файл")
@@ -168,4 +339,150 @@ class TickerQuote(models.Model):
     class Meta:
         verbose_name = "Цитата для бегущей строки"
         verbose_name_plural = "Цитаты для бегущей строки"
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+
+class DailyStatistic(models.Model):
+    """
+    Суточные агрегаты просмотров и скачиваний.
+    Заполняются командой rollup_statistics; строки просмотров имеют news_file = NULL.
+    """
+    day = models.DateField(db_index=True, verbose_name="День")
+    section = models.ForeignKey(Section, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name="Раздел")
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name="Категория")
+    news = models.ForeignKey(News, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name="Новость")
+    news_file = models.ForeignKey(NewsFile, on_delete=models.CASCADE, null=True, blank=True, related_name='+', verbose_name="Файл")
+    subdivision = models.ForeignKey(Subdivision, on_delete=models.SET_NULL, null=True, blank=True, related_name='+', verbose_name="Подразделение")
+    views = models.PositiveIntegerField(default=0, verbose_name="Просмотров")
+    downloads = models.PositiveIntegerField(default=0, verbose_name="Скачиваний")
+
+    class Meta:
+        verbose_name = "Суточная статистика"
+        verbose_name_plural = "Суточная статистика"
+        ordering = ['-day']
+        # Отчеты за период по разделу/категориям/файлу: строки просмотров - news_file IS NULL
+        indexes = [
+            models.Index(fields=['section', 'news_file', 'day'], name='daily_section_file_day_idx'),
+            models.Index(fields=['category', 'news_file', 'day'], name='daily_category_file_day_idx'),
+            models.Index(fields=['news_file', 'day'], name='daily_file_day_idx'),
+        ]
+
+
+class VisitorSketch(models.Model):
+    """
+    Суточный HyperLogLog-скетч IP посетителей (см. hll.py) для оценки числа
+    уникальных за любой период. section = NULL - скетч по всему сайту.
+    Заполняется командой rollup_statistics.
+    """
+    day = models.DateField(db_index=True, verbose_name="День")
+    section = models.ForeignKey(Section, on_delete=models.CASCADE, null=True, blank=True, related_name='+', verbose_name="Раздел")
+    registers = models.BinaryField(verbose_name="Регистры (zlib)")
+
+    class Meta:
+        verbose_name = "Скетч уникальных посетителей"
+        verbose_name_plural = "Скетчи уникальных посетителей"
+        ordering = ['-day']
+
+
+class StatisticWatermark(models.Model):
+    """Последний id сырой статистики, учтенный в DailyStatistic"""
+    name = models.CharField(max_length=50, unique=True, verbose_name="Источник")
+    last_id = models.BigIntegerField(default=0, verbose_name="Последний id")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Отметка агрегации"
+        verbose_name_plural = "Отметки агрегации"
+
+
+class ImportProgress(models.Model):
+    """
+    Сколько строк манифеста обработал import_content. Пишется в транзакции
+    порции (bulkimport.py): после обрыва порция не импортируется дважды.
+    """
+    manifest = models.CharField(max_length=500, unique=True, verbose_name="Манифест")
+    rows = models.IntegerField(default=0, verbose_name="Обработано строк")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    class Meta:
+        verbose_name = "Ход импорта"
+        verbose_name_plural = "Ход импорта"
+
+
+class ChunkedUpload(models.Model):
+    """
+    Незавершенная загрузка вложения частями (см. uploads.py).
+    Данные пишутся во временный файл, offset - сколько байт уже принято,
+    checksum - CRC32 принятых байт (считается по мере записи).
+    """
+    upload_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False, verbose_name="Идентификатор")
+    news = models.ForeignKey(News, on_delete=models.CASCADE, related_name='+', verbose_name="Новость")
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Пользователь")
+    filename = models.CharField(max_length=255, verbose_name="Имя файла")
+    size = models.BigIntegerField(verbose_name="Размер")
+    offset = models.BigIntegerField(default=0, verbose_name="Принято байт")
+    checksum = models.BigIntegerField(default=0, verbose_name="CRC32 принятых байт")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+    class Meta:
+        verbose_name = "Загрузка частями"
+        verbose_name_plural = "Загрузки частями"
+        ordering = ['-updated_at']
+
+
+class EditorUpload(models.Model):
+    """
+    Файл, загруженный через CKEditor (индекс для страницы "Файлы CKEditor").
+    Пополняется при загрузке (editor_files.EditorStorage), сверяется
+    с диском командой scan_editor_uploads. Уменьшенные копии картинок
+    строит команда build_image_derivatives.
+    """
+    path = models.CharField(max_length=500, unique=True, verbose_name="Путь")
+    directory = models.CharField(max_length=500, db_index=True, verbose_name="Каталог")
+    name = models.CharField(max_length=255, verbose_name="Имя файла")
+    # Нормализованная копия для поиска (см. lookups.py)
+    name_normalized = models.CharField(max_length=255, blank=True, editable=False, verbose_name="Имя файла (для поиска)")
+    size = models.BigIntegerField(verbose_name="Размер")
+    modified_at = models.DateTimeField(verbose_name="Загружен")
+    is_image = models.BooleanField(default=False, verbose_name="Изображение")
+    # Уменьшенные копии картинки (derivatives.py); пусто - еще не строились
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name="Ширина")
+    derivative_widths = models.JSONField(null=True, blank=True, editable=False, verbose_name="Ширины уменьшенных копий")
+
+    def save(self, *args, **kwargs):
+        self.name_normalized = normalize_text(self.name)
+        super().save(*args, **kwargs)
+
+    @property
+    def url(self):
+        return default_storage.url(self.path)
+
+    def __str__(self):
+        return self.path
+
+    class Meta:
+        verbose_name = "Файл CKEditor"
+        verbose_name_plural = "Файлы CKEditor"
+        ordering = ['-modified_at']
+        # Сортировки страницы "Файлы CKEditor"
+        indexes = [
+            models.Index(fields=['modified_at', 'id'], name='editor_upload_date_idx'),
+            models.Index(fields=['name', 'id'], name='editor_upload_name_idx'),
+            models.Index(fields=['size', 'id'], name='editor_upload_size_idx'),
+        ]
+
+
+class EditorUploadDirectory(models.Model):
+    """Каталог загрузок CKEditor и его mtime на момент последней сверки"""
+    path = models.CharField(max_length=500, unique=True, verbose_name="Путь")
+    mtime_ns = models.BigIntegerField(verbose_name="Время изменения, нс")
+
+    def __str__(self):
+        return self.path
+
+    class Meta:
+        verbose_name = "Каталог загрузок CKEditor"
+        verbose_name_plural = "Каталоги загрузок CKEditor"
@@ -0,0 +1,226 @@
+# orphans.py
+"""
+Поиск файлов MEDIA_ROOT, на которые ничего не ссылается.
+
+Ссылками считаются NewsFile.file, FileBlob.path, уменьшенные копии
+картинок CKEditor (derivatives.py) и адреса /media/... в тексте новостей
+(картинки и ссылки CKEditor), а также в описаниях разделов и категорий. Вложение, удаленное вместе со строкой NewsFile
+(файлы до dedupe_files), или картинка, убранная из текста, остаются на
+диске - их находит find_orphans().
+
+Чтобы память не зависела от числа файлов, ссылки и список файлов пишутся
+во временную базу SQLite на диске, сироты выбираются одним запросом по
+ней. Каталоги обходятся параллельно (os.scandir и stat отпускают GIL), в
+базу пишет только основной поток.
+
+Служебные каталоги и файлы с точкой в начале имени (.chunks, .ingest,
+карантин) не рассматриваются, недавние файлы (min_age) тоже: картинка
+могла быть загружена в еще не сохраненную новость. Найденное команда
+find_orphan_media переносит в карантин MEDIA_ROOT/.quarantine/<время>/,
+откуда файл можно вернуть тем же путем.
+"""
+import html
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from urllib.parse import unquote
+
+from django.conf import settings
+
+from . import derivatives, editor_files
+from .models import Category, EditorUpload, FileBlob, News, NewsFile, Section
+
+QUARANTINE_DIR = '.quarantine'
+QUARANTINE_FORMAT = '%Y%m%d-%H%M%S'
+WORKERS = min(8, os.cpu_count() or 1)
+MIN_AGE = timedelta(hours=24)
+BATCH_SIZE = 2000
+
+
+def media_url_re():
+    # Путь заканчивается кавычкой, пробелом, скобкой, параметрами или якорем
+    return re.compile(re.escape(settings.MEDIA_URL) + r'''([^"'\s<>()?#]+)''')
+
+
+def content_paths(text, pattern=None):
+    """Пути (относительно MEDIA_ROOT) из адресов /media/... в HTML"""
+    pattern = pattern or media_url_re()
+    for match in pattern.finditer(html.unescape(text or '')):
+        path = unquote(match.group(1)).strip('/')
+        if path:
+            yield path
+
+
+def references():
+    """Все пути, на которые есть ссылки; повторы возможны"""
+    yield from NewsFile.objects.exclude(file='').values_list('file', flat=True).iterator(chunk_size=BATCH_SIZE)
+    yield from FileBlob.objects.values_list('path', flat=True).iterator(chunk_size=BATCH_SIZE)
+    built = EditorUpload.objects.filter(derivative_widths__isnull=False).values_list('path', 'derivative_widths')
+    for path, widths in built.iterator(chunk_size=BATCH_SIZE):
+        yield from derivatives.derivative_names(path, widths)
+    yield from content_references()
+
+
+def content_references():
+    """Пути из адресов /media/... в текстах новостей и описаниях"""
+    pattern = media_url_re()
+    texts = [
+        News.objects.exclude(content='').values_list('content', flat=True),
+        Section.objects.exclude(description='').values_list('description', flat=True),
+        Category.objects.exclude(description='').values_list('description', flat=True),
+    ]
+    for queryset in texts:
+        for text in queryset.iterator(chunk_size=BATCH_SIZE):
+            yield from content_paths(text, pattern)
+
+
+def _full_path(path):
+    return os.path.join(settings.MEDIA_ROOT, *path.split('/')) if path else str(settings.MEDIA_ROOT)
+
+
+def _scan_directory(directory):
+    """([(путь, размер, mtime)], [подкаталоги]) одного каталога"""
+    files = []
+    subdirs = []
+    prefix = f'{directory}/' if directory else ''
+    try:
+        with os.scandir(_full_path(directory)) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                path = prefix + entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        files.append((path, stat.st_size, stat.st_mtime))
+                except OSError:
+                    # Удален во время обхода
+                    continue
+    except OSError:
+        pass
+    return files, subdirs
+
+
+def walk(workers=WORKERS):
+    """
+    Списки файлов MEDIA_ROOT по каталогам; каталоги читаются параллельно.
+    В работе не больше 2 * workers каталогов - прочитанное не копится в памяти,
+    пока вызывающий пишет предыдущие списки.
+    """
+    workers = max(workers, 1)
+    queue = deque([''])
+    pending = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while queue or pending:
+            while queue and len(pending) < 2 * workers:
+                pending.add(pool.submit(_scan_directory, queue.pop()))
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, subdirs = future.result()
+                queue.extend(subdirs)
+                if files:
+                    yield files
+
+
+class OrphanScan:
+    """Результат find_orphans(): счетчики и выборки по временной базе"""
+
+    def __init__(self, db, cutoff):
+        self.db = db
+        self.cutoff = cutoff
+
+    def _value(self, sql, *params):
+        return self.db.execute(sql, params).fetchone()[0]
+
+    @property
+    def files(self):
+        return self._value('SELECT COUNT(*) FROM files')
+
+    @property
+    def size(self):
+        return self._value('SELECT COALESCE(SUM(size), 0) FROM files')
+
+    @property
+    def missing(self):
+        """Ссылок на файлы, которых нет на диске"""
+        return self._value('SELECT COUNT(*) FROM refs WHERE path NOT IN (SELECT path FROM files)')
+
+    def orphans(self):
+        """(путь, размер) файлов без ссылок старше min_age, по порядку путей"""
+        return self.db.execute(
+            'SELECT path, size FROM files WHERE mtime < ? AND path NOT IN (SELECT path FROM refs) ORDER BY path',
+            (self.cutoff,),
+        )
+
+
+@contextmanager
+def find_orphans(workers=WORKERS, min_age=MIN_AGE):
+    fd, db_path = tempfile.mkstemp(prefix='orphans-', suffix='.sqlite3')
+    os.close(fd)
+    db = sqlite3.connect(db_path)
+    try:
+        db.execute('PRAGMA journal_mode = OFF')
+        db.execute('PRAGMA synchronous = OFF')
+        db.execute('CREATE TABLE refs (path TEXT PRIMARY KEY) WITHOUT ROWID')
+        db.execute('CREATE TABLE files (path TEXT PRIMARY KEY, size INTEGER, mtime REAL) WITHOUT ROWID')
+        with db:
+            db.executemany('INSERT OR IGNORE INTO refs VALUES (?)', ((path,) for path in references()))
+        with db:
+            for files in walk(workers):
+                db.executemany('INSERT OR IGNORE INTO files VALUES (?, ?, ?)', files)
+        yield OrphanScan(db, time.time() - min_age.total_seconds())
+    finally:
+        db.close()
+        os.unlink(db_path)
+
+
+def quarantine_batch():
+    """Каталог карантина для одного запуска (относительно MEDIA_ROOT)"""
+    return f'{QUARANTINE_DIR}/{datetime.now().strftime(QUARANTINE_FORMAT)}'
+
+
+def quarantine(path, batch):
+    """Перенести файл в карантин batch с тем же относительным путем"""
+    target = _full_path(f'{batch}/{path}')
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # Карантин на той же файловой системе - переименование, без копирования
+    os.replace(_full_path(path), target)
+    if path.startswith(editor_files.get_upload_root() + '/'):
+        editor_files.forget(path)
+
+
+def purge_quarantine(days):
+    """Удалить запуски карантина старше days дней. Возвращает (запусков, байт)"""
+    root = _full_path(QUARANTINE_DIR)
+    threshold = datetime.now() - timedelta(days=days)
+    removed = freed = 0
+    try:
+        batches = os.listdir(root)
+    except FileNotFoundError:
+        return removed, freed
+    for name in batches:
+        try:
+            created = datetime.strptime(name, QUARANTINE_FORMAT)
+        except ValueError:
+            continue
+        if created >= threshold:
+            continue
+        path = os.path.join(root, name)
+        for current, _, files in os.walk(path):
+            for filename in files:
+                try:
+                    freed += os.lstat(os.path.join(current, filename)).st_size
+                except OSError:
+                    pass
+        shutil.rmtree(path, ignore_errors=True)
+        removed += 1
+    return removed, freed
@@ -0,0 +1,124 @@
+# pagecache.py
+"""
+Кэш публичных страниц.
+
+Готовый HTML хранится в общем кэше (settings.CACHES) под ключом из URL и
+версии 'content'. Версию меняют сигналы при любом изменении новостей,
+файлов, разделов, категорий, подразделений и цитат (signals.py), поэтому
+старые страницы просто перестают читаться и истекают по таймауту.
+
+Бегущая строка в кэш не попадает: в базовом шаблоне она обрамлена
+маркерами и при каждом ответе рендерится заново со случайными цитатами.
+"""
+import hashlib
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+from .versions import bump_version_on_commit, get_version
+
+CONTENT_VERSION = 'content'
+
+TICKER_START = '<!-- ticker -->'
+TICKER_END = '<!-- /ticker -->'
+TICKER_TEMPLATE = 'news_site/ticker.html'
+
+
+def get_timeout():
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
+
+
+def invalidate_content():
+    """Сбросить кэш страниц во всех воркерах (после коммита)"""
+    bump_version_on_commit(CONTENT_VERSION)
+
+
+class PageCacheStats:
+    """Счетчики попаданий/промахов (на воркер)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def as_dict(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'hit_ratio': round(self.hits / total, 3) if total else None,
+            }
+
+
+page_stats = PageCacheStats()
+
+
+def _key(request, version):
+    url = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+    return f'news_site:page:{version}:{url}'
+
+
+def _split_ticker(html):
+    """HTML без бегущей строки: (до нее, после нее) или None; маркеры остаются"""
+    start = html.find(TICKER_START)
+    end = html.find(TICKER_END, start)
+    if start == -1 or end == -1:
+        return None
+    return html[:start + len(TICKER_START)], html[end:]
+
+
+def _render_ticker(request):
+    return render_to_string(TICKER_TEMPLATE, request=request)
+
+
+def cache_page_content(view):
+    """
+    Кэшировать ответ представления до следующего изменения контента.
+    Кэшируются только GET/HEAD с ответом 200; вместе со страницей
+    сохраняется request.statistics_target для StatisticsMiddleware.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or get_timeout() <= 0:
+            return view(request, *args, **kwargs)
+
+        key = _key(request, get_version(CONTENT_VERSION))
+        entry = cache.get(key)
+        if entry is not None:
+            page_stats.count('hits')
+            if entry['statistics_target']:
+                request.statistics_target = entry['statistics_target']
+            before, after = entry['parts']
+            response = HttpResponse(
+                before + _render_ticker(request) + after,
+                content_type=entry['content_type'],
+            )
+            response['X-Page-Cache'] = 'HIT'
+            return response
+
+        page_stats.count('misses')
+        response = view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            parts = _split_ticker(response.content.decode(response.charset))
+            if parts is not None:
+                cache.set(key, {
+                    'parts': parts,
+                    'content_type': response['Content-Type'],
+                    'statistics_target': getattr(request, 'statistics_target', None),
+                }, get_timeout())
+                page_stats.count('stores')
+        response['X-Page-Cache'] = 'MISS'
+        return response
+
+    return wrapper
@@ -0,0 +1,59 @@
+# quotes.py
+"""
+Цитаты для бегущей строки.
+
+Тексты всех цитат загружаются один раз на воркер и перечитываются при
+изменении версии 'quotes' (ее меняет TickerQuoteAdmin). Случайная выборка
+делается в памяти - без COUNT(*) и ORDER BY RANDOM() на каждой странице.
+"""
+import random
+import threading
+
+from .models import TickerQuote
+from .versions import bump_version_on_commit, get_version
+
+QUOTES_VERSION = 'quotes'
+
+SAMPLE_SIZE = 5
+
+# Если в базе нет цитат
+FALLBACK_QUOTES = [
+    "Наука - это организованное знание. Герберт Спенсер",
+    "Информация - это не знание. Альберт Эйнштейн",
+    "Знание - это сила. Фрэнсис Бэкон",
+    "Технология - это то, чего не было, когда мы родились. Алан Кей",
+    "Будущее уже наступило, оно просто неравномерно распределено. Уильям Гибсон"
+]
+
+
+class QuotePool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._quotes = []
+
+    def _ensure_loaded(self):
+        version = get_version(QUOTES_VERSION)
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            self._quotes = list(TickerQuote.objects.order_by().values_list('text', flat=True))
+            self._version = version
+
+    def sample(self, k=SAMPLE_SIZE):
+        """k случайных цитат (или цитаты по умолчанию, если база пуста)"""
+        self._ensure_loaded()
+        quotes = self._quotes
+        if not quotes:
+            return FALLBACK_QUOTES
+        return random.sample(quotes, min(k, len(quotes)))
+
+
+def invalidate_quotes():
+    """Вызывать после любого изменения таблицы TickerQuote"""
+    bump_version_on_commit(QUOTES_VERSION)
+
+
+quote_pool = QuotePool()
@@ -0,0 +1,61 @@
+# resolver.py
+"""
+Разрешение URL вида /<раздел>/<категория>/<подкатегория>/ в id объектов.
+
+Дерево разделов и категорий загружается один раз на воркер и
+перестраивается при изменении версии 'routing' (см. signals.py).
+"""
+import threading
+
+from .models import Section, Category
+from .versions import get_version
+
+ROUTING_VERSION = 'routing'
+
+
+class RouteResolver:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._sections = {}
+        self._categories = {}
+
+    def _ensure_loaded(self):
+        version = get_version(ROUTING_VERSION)
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            sections = dict(Section.objects.values_list('slug', 'id'))
+
+            categories = {}
+            # при дублях пути побеждает категория с меньшим id
+            for cat_id, section_id, path in Category.objects.order_by('id').values_list('id', 'section_id', 'path'):
+                categories.setdefault((section_id, path), cat_id)
+
+            self._sections = sections
+            self._categories = categories
+            self._version = version
+
+    def section_id(self, section_slug):
+        self._ensure_loaded()
+        return self._sections.get(section_slug)
+
+    def resolve(self, section_slug, category_path=''):
+        """
+        Возвращает (section_id, category_id).
+        section_id = None - раздел не найден; category_id = None - путь
+        категории пуст или не найден.
+        """
+        self._ensure_loaded()
+        section_id = self._sections.get(section_slug)
+        if section_id is None:
+            return None, None
+        path = '/'.join(slug for slug in category_path.split('/') if slug)
+        if not path:
+            return section_id, None
+        return section_id, self._categories.get((section_id, path))
+
+
+resolver = RouteResolver()
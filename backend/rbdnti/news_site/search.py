@@ -0,0 +1,182 @@
+# search.py
+"""
+Полнотекстовый поиск по новостям (SQLite FTS5).
+
+Таблица news_site_news_fts (rowid = News.id) хранит заголовок, текст без
+HTML-тегов, название подразделения и имена вложений. Индекс обновляется
+сигналами (signals.py) и пересобирается командой rebuild_search_index.
+Токенизатор unicode61 приводит к нижнему регистру и кириллицу.
+"""
+import html
+import re
+
+from django.db import connection, transaction
+from django.utils.html import escape, strip_tags
+
+from .models import News
+
+FTS_TABLE = 'news_site_news_fts'
+
+CREATE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    "title, content, subdivision, filenames, "
+    "tokenize = 'unicode61 remove_diacritics 2')"
+)
+
+# Вес столбцов в bm25: заголовок, текст, подразделение, файлы
+RANK_WEIGHTS = (10.0, 1.0, 3.0, 5.0)
+
+# Маркеры подсветки в snippet(); заменяются на <mark> после экранирования
+_HL_START, _HL_END = '\x02', '\x03'
+
+_TOKEN_RE = re.compile(r'[\s,;:.!?\"«»()\-*^]+')
+_WORD_RE = re.compile(r'\w')
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def plain_text(value):
+    """HTML -> текст для индекса: без тегов, сущностей и лишних пробелов"""
+    if not value:
+        return ''
+    # split() без аргументов режет и по неразрывному пробелу
+    return ' '.join(html.unescape(strip_tags(value)).split())
+
+
+def tokenize(query):
+    # Токен без букв и цифр ("№", "/"): unicode61 превращает его в пустую фразу
+    # MATCH, а поиск ncontains требует этот знак в заголовке - 0 результатов
+    return [t for t in _TOKEN_RE.split(query or '') if _WORD_RE.search(t)]
+
+
+def build_match(tokens):
+    """Все токены обязательны, каждый ищется как префикс слова"""
+    return ' '.join('"{}"*'.format(t.replace('"', '""')) for t in tokens)
+
+
+def index_news(news_ids):
+    """(Пере)индексировать новости по id"""
+    if not is_available():
+        return
+    news_ids = list(news_ids)
+    for start in range(0, len(news_ids), 500):
+        chunk = news_ids[start:start + 500]
+        rows = []
+        for news in (News.objects.filter(id__in=chunk)
+                     .select_related('subdivision').prefetch_related('files')
+                     .order_by()):
+            rows.append((
+                news.id,
+                news.title or '',
+                plain_text(news.content),
+                news.subdivision.name if news.subdivision else '',
+                ' '.join(f.filename for f in news.files.all() if f.filename),
+            ))
+        with connection.cursor() as cursor:
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", chunk)
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, content, subdivision, filenames) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                rows,
+            )
+
+
+def remove_news(news_ids):
+    if not is_available():
+        return
+    news_ids = list(news_ids)
+    if not news_ids:
+        return
+    with connection.cursor() as cursor:
+        placeholders = ', '.join(['%s'] * len(news_ids))
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", news_ids)
+
+
+def rebuild(chunk_size=500):
+    """
+    Полная пересборка индекса в одной транзакции: поиск до конца пересборки
+    работает по старому индексу. Возвращает число проиндексированных новостей.
+    """
+    total = 0
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(CREATE_SQL)
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        ids = []
+        for news_id in News.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=chunk_size):
+            ids.append(news_id)
+            if len(ids) >= chunk_size:
+                index_news(ids)
+                total += len(ids)
+                ids = []
+        if ids:
+            index_news(ids)
+            total += len(ids)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    return total
+
+
+def highlight(snippet):
+    """Экранировать фрагмент и заменить маркеры на <mark>"""
+    return escape(snippet).replace(_HL_START, '<mark>').replace(_HL_END, '</mark>')
+
+
+def search(query, section_slug=None, category_id=None, limit=20, offset=0):
+    """
+    Ранжированный поиск: страница id по bm25 вместе с общим числом совпадений
+    (оконная функция) и фрагменты с подсветкой только для этой страницы.
+    Возвращает (всего найдено, [(news_id, html-фрагмент с подсветкой), ...]).
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return 0, []
+
+    match = build_match(tokens)
+    joins = ''
+    where = [f'{FTS_TABLE} MATCH %s']
+    params = [match]
+    if section_slug:
+        joins += ' JOIN news_site_section s ON s.id = n.section_id'
+        where.append('s.slug = %s')
+        params.append(section_slug)
+    if category_id:
+        where.append('n.category_id = %s')
+        params.append(category_id)
+
+    # bm25() нельзя вызывать рядом с оконной функцией - ранжируем во вложенном запросе
+    ranked = (
+        f"SELECT {FTS_TABLE}.rowid AS id, "
+        f"bm25({FTS_TABLE}, {', '.join(str(w) for w in RANK_WEIGHTS)}) AS rank "
+        f"FROM {FTS_TABLE} JOIN news_site_news n ON n.id = {FTS_TABLE}.rowid{joins} "
+        f"WHERE {' AND '.join(where)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT id, COUNT(*) OVER () FROM ({ranked}) ORDER BY rank, id LIMIT %s OFFSET %s",
+            params + [limit, offset],
+        )
+        page = cursor.fetchall()
+        if page:
+            total = page[0][1]
+        elif offset:
+            # Страница за концом выдачи - общее число нужно отдельно
+            cursor.execute(f"SELECT COUNT(*) FROM ({ranked})", params)
+            total = cursor.fetchone()[0]
+        else:
+            total = 0
+
+        ids = [news_id for news_id, _ in page]
+        snippets = {}
+        if ids:
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(
+                f"SELECT rowid, snippet({FTS_TABLE}, -1, %s, %s, '…', 16) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND rowid IN ({placeholders})",
+                [_HL_START, _HL_END, match] + ids,
+            )
+            snippets = dict(cursor.fetchall())
+    return total, [(news_id, highlight(snippets.get(news_id, ''))) for news_id in ids]
@@ -0,0 +1,138 @@
+# signals.py
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import blobs, counters, search
+from .models import Section, Category, News, NewsFile, Subdivision, TickerQuote
+from .pagecache import invalidate_content
+from .resolver import ROUTING_VERSION
+from .versions import bump_version_on_commit
+
+
+@receiver(post_save, sender=Section)
+@receiver(post_delete, sender=Section)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_routing(sender, **kwargs):
+    """
+    Сбросить кэш маршрутов во всех воркерах. После коммита: Category.save()
+    дописывает пути (tree_path, path) уже после post_save
+    """
+    bump_version_on_commit(ROUTING_VERSION)
+
+
+@receiver(post_save, sender=News)
+@receiver(post_delete, sender=News)
+@receiver(post_save, sender=NewsFile)
+@receiver(post_delete, sender=NewsFile)
+@receiver(post_save, sender=Section)
+@receiver(post_delete, sender=Section)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Subdivision)
+@receiver(post_delete, sender=Subdivision)
+@receiver(post_save, sender=TickerQuote)
+@receiver(post_delete, sender=TickerQuote)
+def invalidate_pages(sender, **kwargs):
+    """Сбросить кэш страниц во всех воркерах (pagecache.py)"""
+    invalidate_content()
+
+
+# Полнотекстовый индекс (search.py)
+
+@receiver(post_save, sender=News)
+def index_news(sender, instance, **kwargs):
+    search.index_news([instance.pk])
+
+
+@receiver(post_delete, sender=News)
+def unindex_news(sender, instance, **kwargs):
+    search.remove_news([instance.pk])
+
+
+@receiver(post_save, sender=NewsFile)
+@receiver(post_delete, sender=NewsFile)
+def index_news_files(sender, instance, **kwargs):
+    search.index_news([instance.news_id])
+
+
+@receiver(post_save, sender=Subdivision)
+def index_subdivision_news(sender, instance, **kwargs):
+    search.index_news(News.objects.filter(subdivision=instance).values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Subdivision)
+def remember_subdivision_news(sender, instance, **kwargs):
+    # После удаления у новостей будет subdivision = NULL, запоминаем их заранее
+    instance._news_ids = list(News.objects.filter(subdivision=instance).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Subdivision)
+def index_orphaned_subdivision_news(sender, instance, **kwargs):
+    search.index_news(getattr(instance, '_news_ids', []))
+
+
+# Счетчики новостей и категорий (counters.py)
+
+@receiver(pre_save, sender=News)
+def remember_news_place(sender, instance, **kwargs):
+    instance._counter_place = None
+    if instance.pk:
+        instance._counter_place = News.objects.filter(pk=instance.pk).values_list('section_id', 'category_id').first()
+
+
+@receiver(post_save, sender=News)
+def count_saved_news(sender, instance, created, **kwargs):
+    old = getattr(instance, '_counter_place', None)
+    if created or old is None:
+        counters.change_news_count(instance.section_id, instance.category_id, 1)
+    else:
+        counters.move_news(old[0], old[1], instance.section_id, instance.category_id)
+
+
+@receiver(pre_delete, sender=News)
+def remember_news_tree_path(sender, instance, **kwargs):
+    # pre_delete приходит до удаления любых объектов каскада, категория еще на месте
+    instance._counter_tree_path = counters.category_tree_path(instance.category_id)
+
+
+@receiver(post_delete, sender=News)
+def count_deleted_news(sender, instance, **kwargs):
+    counters.change_news_count(
+        instance.section_id, instance.category_id, -1,
+        tree_path=getattr(instance, '_counter_tree_path', None),
+    )
+
+
+@receiver(pre_save, sender=Category)
+def remember_category_place(sender, instance, **kwargs):
+    instance._counter_place = None
+    if instance.pk:
+        instance._counter_place = Category.objects.filter(pk=instance.pk).values(
+            'section_id', 'tree_path', 'subtree_news_count'
+        ).first()
+
+
+@receiver(post_save, sender=Category)
+def count_saved_category(sender, instance, created, **kwargs):
+    old = getattr(instance, '_counter_place', None)
+    if created or old is None:
+        counters.change_categories_count(instance.section_id, 1)
+        return
+    if old['section_id'] != instance.section_id:
+        counters.change_categories_count(old['section_id'], -1)
+        counters.change_categories_count(instance.section_id, 1)
+    counters.move_subtree(old['tree_path'], instance.tree_path, old['subtree_news_count'])
+
+
+@receiver(post_delete, sender=Category)
+def count_deleted_category(sender, instance, **kwargs):
+    # Новости категории удаляются каскадом раньше и уменьшают счетчики сами
+    counters.change_categories_count(instance.section_id, -1)
+
+
+# Общее содержимое вложений (blobs.py)
+
+@receiver(post_delete, sender=NewsFile)
+def release_news_file_blob(sender, instance, **kwargs):
+    blobs.release(instance.blob_id)
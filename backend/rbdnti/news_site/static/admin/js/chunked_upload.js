@@ -0,0 +1,175 @@
+// chunked_upload.js - загрузка файлов новости частями с докачкой (серверная часть - news_site/uploads.py)
+// Каждый файл режется на части по chunk_size байт и отправляется PUT-запросами
+// с Content-Range и CRC32 части. При обрыве связи загрузка продолжается с того
+// места, которое сервер уже принял; повторный выбор того же файла после
+// перезагрузки страницы тоже продолжает, а не начинает заново.
+// Без JavaScript форма отправляется обычным multipart-запросом.
+document.addEventListener('DOMContentLoaded', function () {
+    const form = document.getElementById('upload-form');
+    const fileInput = document.getElementById('id_files');
+    const status = document.getElementById('chunked-status');
+    if (!form || !fileInput || !status || !window.fetch || !window.Blob || !Blob.prototype.arrayBuffer) {
+        return;
+    }
+
+    const MAX_RETRIES = 6;
+    const csrfToken = form.querySelector('[name=csrfmiddlewaretoken]').value;
+
+    // Таблица для CRC32 (тот же полином, что у zlib.crc32 на сервере)
+    const CRC_TABLE = new Uint32Array(256);
+    for (let n = 0; n < 256; n++) {
+        let c = n;
+        for (let k = 0; k < 8; k++) {
+            c = c & 1 ? 0xEDB88320 ^ (c >>> 1) : c >>> 1;
+        }
+        CRC_TABLE[n] = c >>> 0;
+    }
+
+    function crc32(bytes) {
+        let crc = 0xFFFFFFFF;
+        for (let i = 0; i < bytes.length; i++) {
+            crc = CRC_TABLE[(crc ^ bytes[i]) & 0xFF] ^ (crc >>> 8);
+        }
+        return (crc ^ 0xFFFFFFFF) >>> 0;
+    }
+
+    function sleep(ms) {
+        return new Promise(function (resolve) { setTimeout(resolve, ms); });
+    }
+
+    // Запрос к серверу: {ok, status, data}; обрыв связи - status 0
+    async function send(url, options) {
+        options.headers = Object.assign({ 'X-CSRFToken': csrfToken }, options.headers || {});
+        options.credentials = 'same-origin';
+        try {
+            const response = await fetch(url, options);
+            let data = {};
+            try {
+                data = await response.json();
+            } catch (e) {
+                // Не JSON (например, ошибка прокси) - остается пустой объект
+            }
+            return { ok: response.ok, status: response.status, data: data };
+        } catch (e) {
+            return { ok: false, status: 0, data: {} };
+        }
+    }
+
+    function formatSize(bytes) {
+        if (bytes >= 1073741824) return (bytes / 1073741824).toFixed(2) + ' ГБ';
+        if (bytes >= 1048576) return (bytes / 1048576).toFixed(1) + ' МБ';
+        return (bytes / 1024).toFixed(1) + ' КБ';
+    }
+
+    function addRow(file) {
+        const row = document.createElement('li');
+        const name = document.createElement('span');
+        name.textContent = file.name + ' ';
+        const bar = document.createElement('progress');
+        bar.max = file.size || 1;
+        bar.value = 0;
+        const text = document.createElement('small');
+        row.append(name, bar, text);
+        status.appendChild(row);
+        return {
+            update: function (offset, note) {
+                bar.value = offset;
+                text.textContent = ' ' + formatSize(offset) + ' из ' + formatSize(file.size) + (note ? ' - ' + note : '');
+            },
+        };
+    }
+
+    async function uploadFile(file, row) {
+        const body = new FormData();
+        body.append('filename', file.name);
+        body.append('size', file.size);
+        const started = await send(form.dataset.startUrl, { method: 'POST', body: body });
+        if (!started.ok) {
+            throw new Error(started.data.error || 'ошибка ' + started.status);
+        }
+        const url = started.data.url;
+        const chunkSize = started.data.chunk_size;
+        let offset = started.data.offset;
+        let complete = started.data.complete;
+        let failures = 0;
+        row.update(offset, offset ? 'продолжение' : '');
+
+        while (!complete) {
+            const chunk = file.slice(offset, Math.min(offset + chunkSize, file.size));
+            const checksum = crc32(new Uint8Array(await chunk.arrayBuffer()));
+            const result = await send(url, {
+                method: 'PUT',
+                body: chunk,
+                headers: {
+                    'Content-Type': 'application/octet-stream',
+                    'Content-Range': 'bytes ' + offset + '-' + (offset + chunk.size - 1) + '/' + file.size,
+                    'X-Chunk-CRC32': String(checksum),
+                },
+            });
+
+            if (result.ok) {
+                offset = result.data.offset;
+                complete = result.data.complete;
+                failures = 0;
+                row.update(offset);
+                continue;
+            }
+            if (result.status === 409 && typeof result.data.offset === 'number') {
+                // Сервер принял больше или меньше, чем думали - продолжаем с его offset
+                offset = result.data.offset;
+                continue;
+            }
+            if (result.status >= 400 && result.status < 500 && result.status !== 408 && result.status !== 429) {
+                throw new Error(result.data.error || 'ошибка ' + result.status);
+            }
+
+            failures += 1;
+            if (failures > MAX_RETRIES) {
+                throw new Error(result.data.error || 'нет связи с сервером');
+            }
+            row.update(offset, 'повтор через ' + (2 ** failures) + ' с');
+            await sleep(1000 * 2 ** failures);
+            // После обрыва узнаем, сколько сервер успел принять
+            const state = await send(url, { method: 'GET' });
+            if (state.ok) {
+                offset = state.data.offset;
+            } else if (state.status === 404) {
+                // Загрузка завершилась последней частью, ответ на которую потерялся
+                complete = true;
+            }
+        }
+        row.update(file.size, 'готово');
+    }
+
+    form.addEventListener('submit', async function (event) {
+        const files = Array.from(fileInput.files);
+        if (!files.length) {
+            return;
+        }
+        event.preventDefault();
+        const button = form.querySelector('[type=submit]');
+        button.disabled = true;
+        fileInput.disabled = true;
+        status.innerHTML = '';
+        status.style.display = 'block';
+
+        let failed = 0;
+        for (const file of files) {
+            const row = addRow(file);
+            try {
+                await uploadFile(file, row);
+            } catch (error) {
+                failed += 1;
+                row.update(0, 'не загружен: ' + error.message);
+            }
+        }
+
+        if (failed) {
+            // Выберите те же файлы еще раз - загрузка продолжится с принятого места
+            button.disabled = false;
+            fileInput.disabled = false;
+        } else {
+            window.location.reload();
+        }
+    });
+});
@@ -0,0 +1,41 @@
+// Кнопка "Показать еще" под списком новостей: подгружает следующую страницу
+// (?after=<курсор>&partial=1, JSON {html, next, next_page}) и дописывает ее в список.
+// Без JavaScript кнопка остается обычной ссылкой на следующую страницу.
+document.addEventListener('click', function (event) {
+    const button = event.target.closest('.load-more');
+    if (!button || button.classList.contains('loading')) {
+        return;
+    }
+    event.preventDefault();
+    button.classList.add('loading');
+
+    fetch(button.dataset.url, { headers: { 'Accept': 'application/json' } })
+        .then(function (response) {
+            if (!response.ok) {
+                throw new Error(response.status);
+            }
+            return response.json();
+        })
+        .then(function (data) {
+            document.querySelector(button.dataset.target).insertAdjacentHTML('beforeend', data.html);
+            if (data.next) {
+                button.dataset.url = data.next;
+                button.href = data.next_page;
+                // "Вперёд" ведет за последнюю подгруженную новость
+                button.parentNode.querySelectorAll('.pagination-btn.next').forEach(function (link) {
+                    link.href = data.next_page;
+                });
+            } else {
+                button.parentNode.querySelectorAll('.load-more, .pagination-btn.next').forEach(function (link) {
+                    link.remove();
+                });
+            }
+        })
+        .catch(function () {
+            // Не вышло - переходим на следующую страницу обычным способом
+            window.location.href = button.href;
+        })
+        .finally(function () {
+            button.classList.remove('loading');
+        });
+});
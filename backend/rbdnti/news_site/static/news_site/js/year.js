@@ -0,0 +1,2 @@
+// Текущий год в подвале (в разметке - год на момент выкладки, если JavaScript выключен)
+document.getElementById('current-year').textContent = new Date().getFullYear();
@@ -0,0 +1,264 @@
+# statistics.py
+"""
+Агрегация статистики просмотров и скачиваний.
+
+Сырые ViewStatistic/DownloadStatistic сворачиваются в суточные строки
+DailyStatistic командой rollup_statistics. Запросы за любой период
+складываются из агрегатов и "хвоста" - сырых строк после отметки агрегации.
+
+Уникальные посетители оцениваются по суточным HyperLogLog-скетчам
+VisitorSketch (hll.py, ошибка ~1.6%); exact=True считает точно по сырым строкам.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import archive
+from .hll import HyperLogLog
+from .models import DailyStatistic, DownloadStatistic, StatisticWatermark, ViewStatistic, VisitorSketch
+
+# Источник -> (модель, поле даты, поля ключа агрегата в сырой таблице)
+SOURCES = {
+    'views': (ViewStatistic, 'created_at', {
+        'section_id': 'section_id',
+        'category_id': 'category_id',
+        'news_id': 'news_id',
+        'subdivision_id': 'news__subdivision_id',
+    }),
+    'downloads': (DownloadStatistic, 'downloaded_at', {
+        'section_id': 'news_file__news__section_id',
+        'category_id': 'news_file__news__category_id',
+        'news_id': 'news_file__news_id',
+        'news_file_id': 'news_file_id',
+        'subdivision_id': 'news_file__news__subdivision_id',
+    }),
+}
+
+KEY_FIELDS = ('day', 'section_id', 'category_id', 'news_id', 'news_file_id', 'subdivision_id')
+
+# Отметка для скетчей уникальных посетителей (своя, независимая от 'views')
+UNIQUE_SOURCE = 'unique_visitors'
+
+
+def get_watermark(name):
+    return StatisticWatermark.objects.filter(name=name).values_list('last_id', flat=True).first() or 0
+
+
+def rollup(name, chunk_size=50000):
+    """
+    Свернуть в DailyStatistic сырые строки источника name, появившиеся после отметки.
+    Каждая порция и сдвиг отметки - одна транзакция. Возвращает число учтенных строк.
+    """
+    model, date_field, key_map = SOURCES[name]
+    counter_field = name
+    processed = 0
+
+    last_id = get_watermark(name)
+    max_id = model.objects.aggregate(Max('id'))['id__max'] or 0
+
+    while last_id < max_id:
+        upper = min(last_id + chunk_size, max_id)
+        # Ключи выбираются под префиксом: имена вида section_id заняты полями модели
+        rows = (
+            model.objects.filter(id__gt=last_id, id__lte=upper)
+            .annotate(day=TruncDate(date_field, tzinfo=timezone.get_current_timezone()))
+            .values('day', **{f'key_{key}': F(lookup) for key, lookup in key_map.items()})
+            .annotate(n=Count('id'))
+            .order_by()
+        )
+        rows = [
+            {'day': row['day'], 'n': row['n'],
+             **{key: row[f'key_{key}'] for key in key_map}}
+            for row in rows
+        ]
+
+        with transaction.atomic():
+            _merge_rows(name, counter_field, rows)
+            StatisticWatermark.objects.update_or_create(name=name, defaults={'last_id': upper})
+
+        processed += sum(row['n'] for row in rows)
+        last_id = upper
+
+    return processed
+
+
+def _merge_rows(name, counter_field, rows):
+    if not rows:
+        return
+    days = {row['day'] for row in rows}
+    existing = {}
+    for stat in DailyStatistic.objects.filter(day__in=days, news_file__isnull=(name == 'views')):
+        existing.setdefault(tuple(getattr(stat, f) for f in KEY_FIELDS), stat)
+
+    to_create = []
+    to_update = []
+    for row in rows:
+        key = tuple(row.get(f) for f in KEY_FIELDS)
+        stat = existing.get(key)
+        if stat is None:
+            stat = DailyStatistic(**dict(zip(KEY_FIELDS, key)))
+            existing[key] = stat
+            to_create.append(stat)
+        elif stat not in to_update and stat.pk:
+            to_update.append(stat)
+        setattr(stat, counter_field, getattr(stat, counter_field) + row['n'])
+
+    DailyStatistic.objects.bulk_create(to_create, batch_size=500)
+    DailyStatistic.objects.bulk_update(to_update, [counter_field], batch_size=500)
+
+
+def _rollup_range(start_date, end_date):
+    lookups = {}
+    if start_date:
+        lookups['day__gte'] = start_date.date()
+    if end_date:
+        lookups['day__lte'] = end_date.date()
+    return lookups
+
+
+def _raw_range(date_field, start_date, end_date):
+    lookups = {}
+    if start_date:
+        lookups[f'{date_field}__gte'] = start_date
+    if end_date:
+        lookups[f'{date_field}__lt'] = end_date + timedelta(days=1)
+    return lookups
+
+
+def count_events(name, start_date=None, end_date=None, **lookups):
+    """
+    Число просмотров/скачиваний за период [start_date, end_date] (даты включительно).
+    lookups - фильтры, общие для сырой таблицы и DailyStatistic
+    (section, category__in, news_file__news__section, ...).
+    """
+    model, date_field, _ = SOURCES[name]
+    # Отметка и агрегаты читаются в одной транзакции, чтобы не посчитать строки дважды
+    with transaction.atomic():
+        last_id = get_watermark(name)
+        rolled = DailyStatistic.objects.filter(
+            news_file__isnull=(name == 'views'), **_rollup_range(start_date, end_date), **lookups
+        ).aggregate(total=Sum(name))['total'] or 0
+        tail = model.objects.filter(
+            id__gt=last_id, **_raw_range(date_field, start_date, end_date), **lookups
+        ).count()
+    return rolled + tail
+
+
+def count_views(start_date=None, end_date=None, **lookups):
+    return count_events('views', start_date, end_date, **lookups)
+
+
+def count_downloads(start_date=None, end_date=None, **lookups):
+    return count_events('downloads', start_date, end_date, **lookups)
+
+
+def count_events_by(name, group_by, start_date=None, end_date=None, **lookups):
+    """
+    То же, что count_events, но с группировкой по полю group_by
+    (например 'category_id'): {значение: число}.
+    """
+    model, date_field, _ = SOURCES[name]
+    counts = {}
+    with transaction.atomic():
+        last_id = get_watermark(name)
+        rolled = DailyStatistic.objects.filter(
+            news_file__isnull=(name == 'views'), **_rollup_range(start_date, end_date), **lookups
+        ).values_list(group_by).annotate(total=Sum(name)).order_by()
+        tail = model.objects.filter(
+            id__gt=last_id, **_raw_range(date_field, start_date, end_date), **lookups
+        ).values_list(group_by).annotate(total=Count('id')).order_by()
+        for key, total in list(rolled) + list(tail):
+            counts[key] = counts.get(key, 0) + total
+    return counts
+
+
+def rollup_unique(chunk_size=50000):
+    """
+    Добавить в суточные скетчи VisitorSketch IP из просмотров после отметки
+    UNIQUE_SOURCE. Возвращает число учтенных строк.
+    """
+    processed = 0
+    last_id = get_watermark(UNIQUE_SOURCE)
+    max_id = ViewStatistic.objects.aggregate(Max('id'))['id__max'] or 0
+
+    while last_id < max_id:
+        upper = min(last_id + chunk_size, max_id)
+        chunk = ViewStatistic.objects.filter(id__gt=last_id, id__lte=upper)
+        rows = (
+            chunk.annotate(day=TruncDate('created_at', tzinfo=timezone.get_current_timezone()))
+            .values_list('day', 'section_id', 'ip_address')
+            .distinct()
+            .order_by()
+        )
+        sketches = {}
+        for day, section_id, ip_address in rows:
+            # Каждый IP - в скетч раздела и в скетч всего сайта
+            for key in ((day, section_id), (day, None)) if section_id else ((day, None),):
+                sketches.setdefault(key, HyperLogLog()).add(ip_address)
+
+        with transaction.atomic():
+            _merge_sketches(sketches)
+            StatisticWatermark.objects.update_or_create(name=UNIQUE_SOURCE, defaults={'last_id': upper})
+
+        processed += chunk.count()
+        last_id = upper
+
+    return processed
+
+
+def _merge_sketches(sketches):
+    if not sketches:
+        return
+    existing = {}
+    for row in VisitorSketch.objects.filter(day__in={day for day, _ in sketches}):
+        existing.setdefault((row.day, row.section_id), row)
+
+    to_create = []
+    to_update = []
+    for (day, section_id), sketch in sketches.items():
+        row = existing.get((day, section_id))
+        if row is None:
+            to_create.append(VisitorSketch(day=day, section_id=section_id, registers=sketch.to_bytes()))
+        else:
+            row.registers = sketch.merge(HyperLogLog.from_bytes(row.registers)).to_bytes()
+            to_update.append(row)
+
+    VisitorSketch.objects.bulk_create(to_create, batch_size=500)
+    VisitorSketch.objects.bulk_update(to_update, ['registers'], batch_size=500)
+
+
+def count_unique_visitors(start_date=None, end_date=None, section_id=None, exact=False):
+    """
+    Уникальные IP посетителей за период [start_date, end_date].
+    По умолчанию - оценка по скетчам (погрешность hll.STANDARD_ERROR, ~1.6%);
+    exact=True - точный COUNT(DISTINCT) по сырым строкам (для сверки), включая
+    строки, перенесенные в архив (archive.py).
+    """
+    lookups = {'section_id': section_id} if section_id else {}
+    if exact:
+        raw = ViewStatistic.objects.filter(**_raw_range('created_at', start_date, end_date), **lookups)
+        if not archive.has_partitions('views', start_date, end_date):
+            return raw.values('ip_address').distinct().count()
+        ips = set(raw.values_list('ip_address', flat=True).distinct().order_by().iterator())
+        section = str(section_id) if section_id else None
+        ips.update(
+            row['ip_address'] for row in archive.iter_archived('views', start_date, end_date)
+            if section is None or row['section_id'] == section
+        )
+        return len(ips)
+
+    sketch = HyperLogLog()
+    with transaction.atomic():
+        last_id = get_watermark(UNIQUE_SOURCE)
+        rows = VisitorSketch.objects.filter(
+            section_id=section_id, **_rollup_range(start_date, end_date)
+        ).values_list('registers', flat=True)
+        for registers in rows.iterator():
+            sketch.merge(HyperLogLog.from_bytes(registers))
+        sketch.update(ViewStatistic.objects.filter(
+            id__gt=last_id, **_raw_range('created_at', start_date, end_date), **lookups
+        ).values_list('ip_address', flat=True).distinct().order_by())
+    return sketch.count()
@@ -0,0 +1,97 @@
+# storage.py
+"""
+Хранилище статики для collectstatic: имена с хешем содержимого
+(ManifestStaticFilesStorage: style.css -> style.3f2a9c1b7e4d.css, ссылки в
+CSS переписываются) и рядом заранее сжатые копии .gz (и .br, если
+установлен модуль brotli).
+
+nginx отдает готовую .gz (gzip_static) и кэширует файлы с хешем в имени
+навсегда (nginx/nginx.conf) - сжатие не тратит CPU на каждый запрос, а
+после выкладки меняются имена, а не содержимое по старым адресам.
+
+collectstatic запускается при каждом старте контейнера, поэтому сжимается
+только то, что изменилось: копия пишется, если ее нет или она старше
+исходного файла. Файлы с хешем в имени по содержимому неизменны, их копии
+после первого запуска не трогаются.
+"""
+import gzip
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.map', '.txt', '.html', '.xml', '.ico', '.ttf', '.eot')
+# Меньше - выигрыш не окупает лишний файл
+MIN_SIZE = 256
+WORKERS = min(4, os.cpu_count() or 1)
+
+
+def _fresh(target, source_mtime):
+    try:
+        return os.stat(target).st_mtime >= source_mtime
+    except OSError:
+        return False
+
+
+def _write(target, data):
+    tmp = f'{target}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, target)
+
+
+def compress(path):
+    """Записать path.gz (и path.br), если их нет или они устарели. Возвращает число записанных"""
+    stat = os.stat(path)
+    if stat.st_size < MIN_SIZE:
+        return 0
+    variants = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda data: brotli.compress(data, quality=11)))
+
+    written = 0
+    data = None
+    for suffix, pack in variants:
+        target = path + suffix
+        if _fresh(target, stat.st_mtime):
+            continue
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        packed = pack(data)
+        if len(packed) >= len(data):
+            # Несжимаемое содержимое - nginx отдаст исходный файл
+            continue
+        _write(target, packed)
+        written += 1
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # Файл, которого нет в манифесте, но есть в STATIC_ROOT, получает имя
+    # с хешем на лету, а не ValueError
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if not isinstance(processed, Exception):
+                names.add(name)
+                if hashed_name:
+                    names.add(hashed_name)
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+
+        compressible = [
+            self.path(name) for name in sorted(names)
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS
+        ]
+        # zlib и brotli отпускают GIL
+        with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+            list(pool.map(compress, compressible))
@@ -1,3 +1,1335 @@
-from django.test import TestCase
+"""
+Бюджеты запросов для страниц сайта и админки.
 
-# Create your tests here.
+Тест наполняет базу типовым набором данных, открывает каждый URL из
+news_site/urls.py и основные списки админки и сверяет число SQL-запросов
+и их суммарное время с таблицей VIEW_BUDGETS. При превышении печатаются
+запросы, сгруппированные по тексту: N+1 видно по повторам.
+
+Запуск: python manage.py test news_site
+"""
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+import zlib
+from collections import Counter
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import archive, blobs, bulkimport, counters, derivatives, editor_files, ingest, orphans, search, uploads, urls as site_urls
+from .admin import NewsAdmin, SectionAdmin
+from .models import (
+    Category, ChunkedUpload, EditorUpload, EditorUploadDirectory, FileBlob, DownloadStatistic, ImportProgress, News, NewsFile, Section, Subdivision, TickerQuote, ViewStatistic,
+)
+from .statistics import count_unique_visitors
+from .pagecache import CONTENT_VERSION
+from .quotes import QUOTES_VERSION
+from .resolver import ROUTING_VERSION
+from .tracking import ViewTracker, tracker
+from .versions import bump_version, get_version
+
+
+# (имя URL, аргументы из набора данных, метод, макс. запросов, макс. время SQL, мс)
+# Бюджет запросов не зависит от объема данных: рост числа строк в наборе
+# не должен менять эти цифры. Время - грубая граница против тяжелых запросов.
+VIEW_BUDGETS = [
+    ('news_site:index', None, 'get', 3, 100),
+    ('news_site:news_archive', None, 'get', 5, 100),
+    ('news_site:section', lambda d: {'section_slug': d.section.slug}, 'get', 6, 100),
+    ('news_site:category', lambda d: {'section_slug': d.section.slug, 'category_path': d.deep_category.path}, 'get', 6, 100),
+    ('news_site:news_detail', lambda d: {'news_id': d.news.id}, 'get', 4, 100),
+    ('news_site:search_news', None, 'get', 7, 200),
+    ('news_site:statistics', None, 'get', 51, 200),
+    ('news_site:tracked_download', lambda d: {'file_id': d.news_file.id}, 'get', 2, 100),
+    ('news_site:ckeditor_files', None, 'get', 6, 100),
+    ('news_site:delete_ckeditor_file', None, 'post', 2, 100),
+    ('news_site:system_stats', None, 'get', 2, 100),
+
+    ('admin:news_site_news_changelist', None, 'get', 9, 200),
+    ('admin:news_site_newsfile_changelist', None, 'get', 6, 200),
+    ('admin:news_site_category_changelist', None, 'get', 8, 100),
+    ('admin:news_site_section_changelist', None, 'get', 5, 100),
+    ('admin:news_site_subdivision_changelist', None, 'get', 5, 100),
+    ('admin:news_site_downloadstatistic_changelist', None, 'get', 5, 100),
+    ('admin:news_site_tickerquote_changelist', None, 'get', 5, 100),
+]
+
+# Дополнительные параметры запроса для отдельных URL
+QUERY_PARAMS = {
+    'news_site:search_news': lambda d: {'q': 'отчет', 'section': d.section.slug},
+    'news_site:statistics': lambda d: {'section_id': d.section.id, 'analyze_type': 'section'},
+}
+
+
+class QueryRecorder:
+    """Запоминает SQL, параметры и время каждого запроса (connection.execute_wrapper)"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, (time.perf_counter() - start) * 1000))
+
+    @property
+    def total_ms(self):
+        return sum(ms for _, ms in self.queries)
+
+    def report(self):
+        """SQL, сгруппированный по тексту запроса, самые частые - первыми"""
+        counts = Counter(sql for sql, _ in self.queries)
+        times = Counter()
+        for sql, ms in self.queries:
+            times[sql] += ms
+        lines = []
+        for sql, count in counts.most_common():
+            marker = '  <-- N+1?' if count > 2 else ''
+            lines.append(f'{count:>4} x {times[sql]:7.1f} ms  {sql}{marker}')
+        return '\n'.join(lines)
+
+
+class SeedData:
+    """Типовой набор: разделы с деревом категорий, новости с файлами, статистика"""
+
+    SECTIONS = 4
+    ROOT_CATEGORIES = 3
+    CHILDREN = 3
+    NEWS_PER_CATEGORY = 3
+    FILES_PER_NEWS = 2
+
+    def __init__(self):
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        subdivisions = [Subdivision.objects.create(name=f'Отдел {i}') for i in range(1, 6)]
+        TickerQuote.objects.bulk_create(TickerQuote(text=f'Цитата {i}') for i in range(30))
+
+        news_number = 0
+        for s in range(self.SECTIONS):
+            section = Section.objects.create(title=f'Раздел {s}', slug=f'section-{s}', subdivision=subdivisions[s])
+            for r in range(self.ROOT_CATEGORIES):
+                root = Category.objects.create(section=section, title=f'Категория {r}', slug=f'cat-{r}')
+                leaves = [root]
+                for c in range(self.CHILDREN):
+                    child = Category.objects.create(section=section, parent=root, title=f'Подкатегория {c}', slug=f'sub-{c}')
+                    leaves.append(Category.objects.create(section=section, parent=child, title='Лист', slug='leaf'))
+                    leaves.append(child)
+                for category in leaves + [None]:
+                    for _ in range(self.NEWS_PER_CATEGORY):
+                        news_number += 1
+                        news = News.objects.create(
+                            section=section, category=category, author=self.user,
+                            subdivision=subdivisions[news_number % len(subdivisions)],
+                            title=f'Отчет о работе №{news_number}',
+                            content=f'<p>Текст новости {news_number}</p>',
+                        )
+                        for f in range(self.FILES_PER_NEWS):
+                            NewsFile.objects.create(
+                                news=news, filename=f'Отчет_{news_number}_{f}.pdf',
+                                file=ContentFile(b'%PDF-1.4 test', name=f'report_{news_number}_{f}.pdf'),
+                            )
+
+        self.section = Section.objects.order_by('id').first()
+        self.deep_category = Category.objects.filter(section=self.section, parent__parent__isnull=False).order_by('id').first()
+        self.news = News.objects.filter(category=self.deep_category).order_by('id').first()
+        self.news_file = self.news.files.order_by('id').first()
+
+        now = timezone.now()
+        ViewStatistic.objects.bulk_create(
+            ViewStatistic(
+                ip_address=f'10.0.0.{i % 50}', path=f'/news/{news.id}/',
+                section_id=news.section_id, category_id=news.category_id, news=news,
+                created_at=now - timedelta(days=i % 20),
+            )
+            for i, news in enumerate(News.objects.all()[:300])
+        )
+        DownloadStatistic.objects.bulk_create(
+            DownloadStatistic(news_file=news_file, ip_address=f'10.0.1.{i % 50}')
+            for i, news_file in enumerate(NewsFile.objects.all()[:300])
+        )
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PAGE_CACHE_TIMEOUT=0,
+    # Манифест статики появляется только после collectstatic
+    STORAGES={**settings.STORAGES, 'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}},
+)
+class NewsSiteTestCase(TestCase):
+    """Временный MEDIA_ROOT и запись просмотров без фонового потока"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls._media_root = tempfile.mkdtemp()
+        cls._media = override_settings(MEDIA_ROOT=cls._media_root)
+        cls._media.enable()
+        # События просмотров пишутся в потоке запроса, без фонового потока
+        cls._tracker = mock.patch.multiple(tracker, use_thread=False, batch_size=10 ** 6)
+        cls._tracker.start()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._tracker.stop()
+        cls._media.disable()
+        shutil.rmtree(cls._media_root, ignore_errors=True)
+
+    def setUp(self):
+        # В TestCase транзакция не коммитится, и версии кэшей (versions.py) после
+        # setUpTestData не менялись: объявляем данные теста заново
+        for name in (ROUTING_VERSION, CONTENT_VERSION, QUOTES_VERSION):
+            bump_version(name)
+
+    def tearDown(self):
+        tracker.flush()
+
+
+class QueryBudgetTests(NewsSiteTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = SeedData()
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.data.user)
+
+    def request(self, name, kwargs, method):
+        url = reverse(name, kwargs=kwargs(self.data) if kwargs else None)
+        params = QUERY_PARAMS[name](self.data) if name in QUERY_PARAMS else {}
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = getattr(self.client, method)(url, params)
+        return url, response, recorder
+
+    def test_every_url_has_budget(self):
+        budgeted = {name for name, *_ in VIEW_BUDGETS}
+        for pattern in site_urls.urlpatterns:
+            self.assertIn(f'{site_urls.app_name}:{pattern.name}', budgeted,
+                          'Добавьте бюджет для нового URL в VIEW_BUDGETS')
+
+    def test_query_budgets(self):
+        for name, kwargs, method, max_queries, max_ms in VIEW_BUDGETS:
+            with self.subTest(view=name):
+                # Первый запрос прогревает кэши воркера (маршруты, цитаты)
+                self.request(name, kwargs, method)
+                url, response, recorder = self.request(name, kwargs, method)
+                self.assertLess(response.status_code, 400, url)
+                count = len(recorder.queries)
+                self.assertTrue(
+                    count <= max_queries and recorder.total_ms <= max_ms,
+                    f'\n{method.upper()} {url}: {count} запросов (бюджет {max_queries}), '
+                    f'{recorder.total_ms:.1f} мс SQL (бюджет {max_ms})\n{recorder.report()}'
+                )
+
+    def test_page_cache_hit_has_no_queries(self):
+        url = reverse('news_site:news_detail', kwargs={'news_id': self.data.news.id})
+        with self.settings(PAGE_CACHE_TIMEOUT=600):
+            self.client.get(url)
+            recorder = QueryRecorder()
+            with connection.execute_wrapper(recorder):
+                response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        # Остаются только валидаторы ETag/Last-Modified и сессия авторизации
+        self.assertLessEqual(len(recorder.queries), 4, recorder.report())
+
+    def test_news_files_count_only_in_changelist(self):
+        # Сортировка по числу файлов (столбец files_count)
+        column = NewsAdmin.list_display.index('files_count')
+        response = self.client.get(reverse('admin:news_site_news_changelist'), {'o': f'-{column}'})
+        counts = [news.files_total for news in response.context['cl'].result_list]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+
+        for url in (reverse('admin:news_site_news_change', args=[self.data.news.id]),
+                    reverse('admin:news_site_news_delete', args=[self.data.news.id])):
+            recorder = QueryRecorder()
+            with connection.execute_wrapper(recorder):
+                self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertFalse([sql for sql, _ in recorder.queries if 'GROUP BY' in sql], url)
+
+
+class ViewTrackerTests(TestCase):
+    """Очередь просмотров (tracking.py): ограничение, таймер, сброс при выходе, ошибки записи"""
+
+    def make_tracker(self, **options):
+        options = {'max_queue_size': 3, 'batch_size': 100, 'flush_interval': 60, 'use_thread': False, **options}
+        return ViewTracker(**options)
+
+    def view(self, n=0, **fields):
+        return ViewStatistic(ip_address=f'10.0.0.{n}', path=f'/{n}/', **fields)
+
+    def test_queue_is_bounded(self):
+        for policy, kept in (('drop_oldest', ['/2/', '/3/', '/4/']), ('drop_newest', ['/0/', '/1/', '/2/'])):
+            queue = self.make_tracker(overflow_policy=policy)
+            for n in range(5):
+                queue.record(self.view(n))
+            self.assertEqual(queue.stats()['dropped'], 2)
+            self.assertEqual([view.path for view in queue._queue], kept)
+
+    def test_flush_by_batch_size_and_on_shutdown(self):
+        queue = self.make_tracker(max_queue_size=10, batch_size=2)
+        for n in range(3):
+            queue.record(self.view(n))
+        self.assertEqual((ViewStatistic.objects.count(), queue.stats()['pending']), (2, 1))
+        queue.shutdown()
+        self.assertEqual((ViewStatistic.objects.count(), queue.stats()['pending']), (3, 0))
+
+    def test_flush_interval(self):
+        queue = self.make_tracker(use_thread=True, flush_interval=0.05)
+        flushed = threading.Event()
+        with mock.patch.object(queue, 'flush', side_effect=flushed.set):
+            queue.record(self.view())
+            # Пачка не набрана - сбрасывает таймер фонового потока
+            self.assertTrue(flushed.wait(2))
+            queue._stopping = True
+            queue._wakeup.set()
+            queue._thread.join(2)
+
+    def test_locked_database_is_retried(self):
+        queue = self.make_tracker()
+        queue.record(self.view(1))
+        queue.record(self.view(2))
+        bulk_create = ViewStatistic.objects.bulk_create
+        with mock.patch.object(ViewStatistic.objects, 'bulk_create',
+                               side_effect=OperationalError('database is locked')), \
+                self.assertLogs('news_site.tracking', 'WARNING'):
+            self.assertEqual(queue.flush(), 0)
+        self.assertEqual([view.path for view in queue._queue], ['/1/', '/2/'])
+        with mock.patch.object(ViewStatistic.objects, 'bulk_create', bulk_create):
+            self.assertEqual(queue.flush(), 2)
+        self.assertEqual(queue.stats()['failed'], 0)
+
+
+class ViewTrackerReferenceTests(TransactionTestCase):
+    """Внешние ключи SQLite проверяются при коммите - нужен настоящий коммит"""
+
+    def test_deleted_news_does_not_drop_batch(self):
+        section = Section.objects.create(title='Раздел', slug='section')
+        kept, deleted = (News.objects.create(section=section, title=f'Новость {n}') for n in range(2))
+        queue = ViewTracker(max_queue_size=10, batch_size=100, flush_interval=60, use_thread=False)
+        for news in (kept, deleted, kept):
+            queue.record(ViewStatistic(ip_address='10.0.0.1', path='/', section=section, news_id=news.id))
+        # Новость удалена после постановки просмотра в очередь
+        News.objects.filter(id=deleted.id).delete()
+
+        self.assertEqual(queue.flush(), 3)
+        self.assertEqual(sorted(ViewStatistic.objects.values_list('news_id', flat=True), key=str),
+                         sorted([kept.id, kept.id, None], key=str))
+
+
+class DownloadServingTests(NewsSiteTestCase):
+    """tracked_download: режимы отдачи, Range и учет докачки"""
+
+    CONTENT = bytes(range(256)) * 40
+
+    @classmethod
+    def setUpTestData(cls):
+        section = Section.objects.create(title='Раздел', slug='section')
+        news = News.objects.create(section=section, title='Новость')
+        cls.news_file = NewsFile.objects.create(
+            news=news, filename='Отчет.pdf', file=ContentFile(cls.CONTENT, name='report.pdf'),
+        )
+        cls.url = reverse('news_site:tracked_download', kwargs={'file_id': cls.news_file.id})
+
+    def downloads(self):
+        return DownloadStatistic.objects.filter(news_file=self.news_file).count()
+
+    @override_settings(DOWNLOAD_SERVE_MODE='django')
+    def test_full_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT)
+        self.assertEqual(response['Content-Length'], str(len(self.CONTENT)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.downloads(), 1)
+
+    @override_settings(DOWNLOAD_SERVE_MODE='accel')
+    def test_admin_link_is_not_counted(self):
+        # ?untracked=1 действует только для сотрудников
+        self.client.get(self.url + '?untracked=1')
+        self.assertEqual(self.downloads(), 1)
+        self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+        response = self.client.get(self.url + '?untracked=1')
+        self.assertTrue(response['X-Accel-Redirect'].startswith('/protected-media/news_files/blobs/'))
+        self.assertEqual(self.downloads(), 1)
+
+    @override_settings(DOWNLOAD_SERVE_MODE='django')
+    def test_range_continuation_is_not_counted(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=1000-1999')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 1000-1999/{len(self.CONTENT)}')
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT[1000:2000])
+        self.assertEqual(self.downloads(), 0)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=9000-')
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT[9000:])
+        self.assertEqual(self.downloads(), 0)
+
+    @override_settings(DOWNLOAD_SERVE_MODE='django')
+    def test_stale_if_range_returns_whole_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.CONTENT)
+
+    @override_settings(DOWNLOAD_SERVE_MODE='django')
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.CONTENT)}-')
+        self.assertEqual(response.status_code, 416)
+
+    @override_settings(DOWNLOAD_SERVE_MODE='accel', DOWNLOAD_ACCEL_PREFIX='/protected-media/')
+    def test_accel_redirect(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.news_file.file.name)
+        self.assertEqual(response.content, b'')
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual(self.downloads(), 1)
+
+
+class ArchiveTests(NewsSiteTestCase):
+    """archive_statistics: перенос старых строк в CSV и точный подсчет уникальных"""
+
+    def setUp(self):
+        super().setUp()
+        archive_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive_dir, ignore_errors=True)
+        settings_override = override_settings(STATISTICS_ARCHIVE_DIR=archive_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        section = Section.objects.create(title='Раздел', slug='section')
+        now = timezone.now()
+        ViewStatistic.objects.bulk_create(
+            ViewStatistic(ip_address=f'10.0.0.{i % 50}', path='/', section=section if i % 2 else None)
+            for i in range(200)
+        )
+        for i, view_id in enumerate(ViewStatistic.objects.order_by('id').values_list('id', flat=True)):
+            ViewStatistic.objects.filter(id=view_id).update(created_at=now - timedelta(days=i * 4))
+        self.section = section
+
+    def unique(self, **kwargs):
+        return count_unique_visitors(exact=True, **kwargs)
+
+    def test_only_rolled_up_rows_are_archived(self):
+        call_command('archive_statistics', stdout=StringIO())
+        self.assertEqual(ViewStatistic.objects.count(), 200)
+
+    def test_archive_keeps_exact_counts(self):
+        before = (self.unique(), self.unique(section_id=self.section.id))
+        call_command('rollup_statistics', stdout=StringIO())
+        call_command('archive_statistics', '--days', '100', '--chunk-size', '7', stdout=StringIO())
+
+        cutoff = timezone.now() - timedelta(days=101)
+        self.assertFalse(ViewStatistic.objects.filter(created_at__lt=cutoff).exists())
+        self.assertEqual(ViewStatistic.objects.count(), 26)
+        self.assertEqual(sum(1 for _ in archive.iter_archived('views')), 174)
+        self.assertEqual((self.unique(), self.unique(section_id=self.section.id)), before)
+
+    def test_section_unique_from_sketches(self):
+        call_command('rollup_statistics', stdout=StringIO())
+        exact = self.unique(section_id=self.section.id)
+        # Сырые строки уже учтены в скетчах раздела
+        ViewStatistic.objects.all().delete()
+        response = self.client.get(reverse('news_site:statistics'),
+                                   {'section_id': self.section.id, 'analyze_type': 'section'})
+        self.assertAlmostEqual(response.context['analysis_results']['total_unique'], exact, delta=1)
+        self.assertLess(exact, response.context['unique_users'])
+
+    def test_interrupted_chunk_is_read_once(self):
+        call_command('rollup_statistics', stdout=StringIO())
+        model, _, columns = archive.ARCHIVE_SOURCES['views']
+        old = model.objects.filter(created_at__lt=timezone.now() - timedelta(days=101))
+        rows = list(old.order_by('id').values(*columns)[:10])
+        # Порция записана, но процесс упал до удаления из базы
+        archive._write_rows('views', columns, rows)
+        call_command('archive_statistics', '--days', '100', stdout=StringIO())
+        self.assertEqual(sum(1 for _ in archive.iter_archived('views')), 174)
+
+    def test_shorter_retry_chunk(self):
+        model, _, columns = archive.ARCHIVE_SOURCES['views']
+        moment = timezone.now() - timedelta(days=400)
+        rows = list(model.objects.order_by('id').values(*columns)[:6])
+        for row in rows:
+            row['created_at'] = moment
+        # Порция из 4 строк не удалена; повтор с --chunk-size 2, затем остальное
+        archive._write_rows('views', columns, rows[:4])
+        archive._write_rows('views', columns, rows[:2])
+        archive._write_rows('views', columns, rows[2:4])
+        archive._write_rows('views', columns, rows[4:])
+        archived = [int(row['id']) for row in archive.iter_archived('views')]
+        self.assertEqual(sorted(archived), [row['id'] for row in rows])
+
+    def test_rows_out_of_id_order_are_kept(self):
+        model, _, columns = archive.ARCHIVE_SOURCES['views']
+        moment = timezone.now() - timedelta(days=400)
+        rows = list(model.objects.order_by('id').values(*columns)[:2])
+        for row in rows:
+            row['created_at'] = moment
+        # Второй запуск дописывает в тот же месяц строку с меньшим id
+        archive._write_rows('views', columns, [rows[1]])
+        archive._write_rows('views', columns, [rows[0], rows[1]])
+        archived = sorted(int(row['id']) for row in archive.iter_archived('views'))
+        self.assertEqual(archived, sorted(row['id'] for row in rows))
+
+
+class BenchmarkQueriesTests(NewsSiteTestCase):
+    """benchmark_queries: прогон на маленьком наборе, изменения откатываются"""
+
+    def test_benchmark_rolls_back(self):
+        out = StringIO()
+        call_command('benchmark_queries', '--seed', '--news', '60', '--views', '300', '--downloads', '30',
+                     '--repeat', '1', stdout=out)
+        self.assertIn('=== statistics_view, раздел ===', out.getvalue())
+        self.assertIn('news_listing_idx', out.getvalue())
+        self.assertFalse(News.objects.exists())
+        self.assertFalse(ViewStatistic.objects.exists())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'news_listing_idx'")
+            self.assertIsNotNone(cursor.fetchone())
+
+
+@mock.patch.multiple('news_site.views', ARCHIVE_PAGE_SIZE=4, LISTING_PAGE_SIZE=3)
+class KeysetPaginationTests(NewsSiteTestCase):
+    """Списки новостей постранично по курсору"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.section = Section.objects.create(title='Раздел', slug='section')
+        # Одинаковые order и created_at: порядок решает id
+        same_time = timezone.now() - timedelta(days=1)
+        for i in range(10):
+            news = News.objects.create(section=cls.section, title=f'Новость {i}', order=1 + i // 4)
+            if i % 4 == 1:
+                News.objects.filter(id=news.id).update(created_at=same_time)
+        cls.expected = list(News.objects.order_by('order', '-created_at', '-id').values_list('id', flat=True))
+        cls.url = reverse('news_site:news_archive')
+
+    def page_ids(self, response):
+        return [news.id for news in response.context['news_list']]
+
+    def test_walk_forward_and_back(self):
+        seen = []
+        url = self.url
+        pages = []
+        while url:
+            response = self.client.get(url)
+            pages.append(self.page_ids(response))
+            seen += pages[-1]
+            url = response.context['page_urls']['next_page']
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(response.context['total_news'], 10)
+
+        response = self.client.get(response.context['page_urls']['previous_page'])
+        self.assertEqual(self.page_ids(response), pages[-2])
+
+    def test_deep_page_costs_the_same(self):
+        first = self.client.get(self.url)
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            self.client.get(first.context['page_urls']['next_page'])
+        deep_queries = len(recorder.queries)
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            self.client.get(self.url)
+        self.assertEqual(deep_queries, len(recorder.queries))
+
+    def test_bad_cursor_shows_first_page(self):
+        response = self.client.get(self.url, {'after': 'garbage'})
+        self.assertEqual(self.page_ids(response), self.expected[:4])
+
+    def test_load_more_fragment(self):
+        url = reverse('news_site:section', kwargs={'section_slug': self.section.slug})
+        first = self.client.get(url)
+        self.assertEqual(self.page_ids(first), self.expected[:3])
+        tracker.flush()
+        views = ViewStatistic.objects.count()
+        data = self.client.get(first.context['page_urls']['next']).json()
+        tracker.flush()
+        # Подгрузка - не новый просмотр раздела
+        self.assertEqual(ViewStatistic.objects.count(), views)
+        self.assertIn(f'/news/{self.expected[3]}/', data['html'])
+        self.assertNotIn(f'/news/{self.expected[2]}/', data['html'])
+        self.assertTrue(data['next'].endswith('&partial=1'))
+
+
+class ChunkedUploadTests(NewsSiteTestCase):
+    """Загрузка вложений частями: докачка, проверка CRC32, перенос в news_files/"""
+
+    CONTENT = bytes(range(256)) * 40
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        section = Section.objects.create(title='Раздел', slug='section')
+        cls.news = News.objects.create(section=section, title='Новость')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def start(self, filename='Отчет.pdf', size=None):
+        url = reverse('admin:news_chunked_upload_start', args=[self.news.id])
+        size = len(self.CONTENT) if size is None else size
+        return self.client.post(url, {'filename': filename, 'size': size}).json()
+
+    def put(self, state, start, end, crc=None, data=None):
+        data = self.CONTENT[start:end] if data is None else data
+        headers = {'Content-Range': f'bytes {start}-{end - 1}/{len(self.CONTENT)}'}
+        if crc is not None:
+            headers['X-Chunk-CRC32'] = str(crc)
+        return self.client.put(state['url'], data, content_type='application/octet-stream', headers=headers)
+
+    def test_upload_in_chunks_with_resume(self):
+        state = self.start()
+        self.assertEqual(state['offset'], 0)
+
+        response = self.put(state, 0, 4000, crc=zlib.crc32(self.CONTENT[:4000]))
+        self.assertEqual(response.json()['offset'], 4000)
+
+        # Повторный старт того же файла продолжает загрузку, а не начинает заново
+        resumed = self.start()
+        self.assertEqual((resumed['upload_id'], resumed['offset']), (state['upload_id'], 4000))
+        self.assertEqual(resumed['checksum'], zlib.crc32(self.CONTENT[:4000]))
+
+        # Часть не с того места отклоняется с текущим offset
+        response = self.put(state, 2000, 6000)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 4000)
+
+        response = self.put(state, 4000, len(self.CONTENT))
+        self.assertTrue(response.json()['complete'])
+
+        news_file = NewsFile.objects.get(id=response.json()['file_id'])
+        self.assertEqual(news_file.filename, 'Отчет.pdf')
+        self.assertTrue(news_file.file.name.startswith('news_files/'))
+        with news_file.file.open('rb') as f:
+            self.assertEqual(f.read(), self.CONTENT)
+        self.assertFalse(ChunkedUpload.objects.exists())
+        part = os.path.join(settings.MEDIA_ROOT, uploads.CHUNKS_DIR, f"{state['upload_id']}.part")
+        self.assertFalse(os.path.exists(part))
+
+    def test_chunk_with_wrong_crc_is_rejected(self):
+        state = self.start()
+        response = self.put(state, 0, 4000, crc=zlib.crc32(self.CONTENT[:4000]) ^ 1)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ChunkedUpload.objects.get().offset, 0)
+
+        response = self.put(state, 0, 4000, crc=zlib.crc32(self.CONTENT[:4000]))
+        self.assertEqual(response.json()['offset'], 4000)
+
+    def test_retried_chunk_does_not_overwrite_accepted_bytes(self):
+        state = self.start()
+        upload = ChunkedUpload.objects.get()
+        stale = ChunkedUpload.objects.get()
+        uploads.write_chunk(upload, BytesIO(self.CONTENT[:4000]), 0, 4000)
+        # Второй запрос с тем же offset (другие байты) опоздал и не засчитан
+        with self.assertRaises(uploads.UploadError) as error:
+            uploads.write_chunk(stale, BytesIO(b'x' * 4000), 0, 4000)
+        self.assertEqual(error.exception.status, 409)
+
+        with open(uploads.part_path(upload), 'rb') as f:
+            self.assertEqual(f.read(), self.CONTENT[:4000])
+        upload.refresh_from_db()
+        self.assertEqual(upload.checksum, zlib.crc32(self.CONTENT[:4000]))
+        # Файлы частей не остаются
+        leftovers = [name for name in os.listdir(os.path.dirname(uploads.part_path(upload)))
+                     if name.startswith(state['upload_id']) and not name.endswith('.part')]
+        self.assertEqual(leftovers, [])
+
+    def test_range_must_match_upload(self):
+        state = self.start()
+        response = self.put(state, 0, 4000, data=self.CONTENT[:100])
+        self.assertEqual(response.status_code, 400)
+        response = self.client.put(state['url'], b'x', content_type='application/octet-stream')
+        self.assertEqual(response.status_code, 400)
+
+    def test_cancel_and_empty_file(self):
+        state = self.start()
+        self.put(state, 0, 4000)
+        self.client.delete(state['url'])
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertEqual(self.client.get(state['url']).status_code, 404)
+
+        state = self.start(filename='empty.txt', size=0)
+        self.assertTrue(state['complete'])
+        self.assertEqual(NewsFile.objects.get(news=self.news).filename, 'empty.txt')
+
+
+class FileBlobTests(NewsSiteTestCase):
+    """Вложения по содержимому: один файл на одинаковое содержимое, счетчик ссылок"""
+
+    @classmethod
+    def setUpTestData(cls):
+        section = Section.objects.create(title='Раздел', slug='section')
+        cls.news = [News.objects.create(section=section, title=f'Новость {i}') for i in range(3)]
+
+    def attach(self, news, content, name='report.pdf'):
+        return NewsFile.objects.create(news=news, file=ContentFile(content, name=name), filename=name)
+
+    def test_same_content_is_stored_once(self):
+        first = self.attach(self.news[0], b'same content')
+        second = self.attach(self.news[1], b'same content', name='copy.PDF')
+        other = self.attach(self.news[2], b'other content')
+
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertNotEqual(first.blob_id, other.blob_id)
+        self.assertEqual(FileBlob.objects.get(pk=first.blob_id).ref_count, 2)
+        self.assertTrue(first.file.name.startswith(blobs.BLOBS_DIR + '/'))
+        self.assertEqual(second.filename, 'copy.PDF')
+
+        path = first.file.path
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(FileBlob.objects.get(pk=second.blob_id).ref_count, 1)
+        self.assertTrue(os.path.exists(path))
+
+        # Последняя ссылка удаляет и содержимое
+        with self.captureOnCommitCallbacks(execute=True):
+            self.news[1].delete()
+        self.assertFalse(FileBlob.objects.filter(pk=second.blob_id).exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_replacing_file_releases_old_blob(self):
+        news_file = self.attach(self.news[0], b'version 1')
+        old_blob_id = news_file.blob_id
+        news_file.file = ContentFile(b'version 2', name='report.pdf')
+        with self.captureOnCommitCallbacks(execute=True):
+            news_file.save()
+        self.assertFalse(FileBlob.objects.filter(pk=old_blob_id).exists())
+        with news_file.file.open('rb') as f:
+            self.assertEqual(f.read(), b'version 2')
+
+    def test_dedupe_command_moves_legacy_files(self):
+        names = [default_storage.save(f'news_files/legacy_{i}.pdf', ContentFile(b'legacy')) for i in range(3)]
+        NewsFile.objects.bulk_create(
+            NewsFile(news=news, file=name, filename=f'Файл {i}.pdf')
+            for i, (news, name) in enumerate(zip(self.news, names))
+        )
+        self.attach(self.news[0], b'legacy')
+        # На старый адрес ссылается текст новости - копия остается
+        linked = default_storage.save('news_files/Отчет.pdf', ContentFile(b'legacy'))
+        NewsFile.objects.create(news=self.news[2], file=linked, filename='Отчет.pdf')
+        News.objects.filter(pk=self.news[1].pk).update(
+            content=f'<p><a href="{default_storage.url(linked)}">Отчет</a></p>'
+        )
+
+        out = StringIO()
+        call_command('dedupe_files', workers=2, stdout=out)
+
+        blob = FileBlob.objects.get()
+        self.assertEqual(blob.ref_count, 5)
+        self.assertTrue(default_storage.exists(linked))
+        self.assertIn('Оставлено старых копий, на которые ссылаются тексты новостей: 1', out.getvalue())
+        self.assertFalse(NewsFile.objects.filter(blob__isnull=True).exists())
+        self.assertEqual(set(NewsFile.objects.values_list('file', flat=True)), {blob.path})
+        for name in names:
+            self.assertFalse(default_storage.exists(name))
+        self.assertIn('удалено копий: 3', out.getvalue())
+
+
+class IngestTests(NewsSiteTestCase):
+    """Массовая загрузка в upload_files_view: ZIP, каталог на сервере, отчет"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        section = Section.objects.create(title='Раздел', slug='section')
+        cls.news = News.objects.create(section=section, title='Новость')
+        cls.url = reverse('admin:news_upload_files', args=[cls.news.id])
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def make_zip(self, members):
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, content in members.items():
+                archive.writestr(name, content)
+        buffer.seek(0)
+        buffer.name = 'scans.zip'
+        return buffer
+
+    def test_zip_is_imported_in_one_insert(self):
+        archive = self.make_zip({
+            'scan_1.pdf': b'first',
+            'папка/scan_2.pdf': b'second',
+            'copy_of_1.pdf': b'first',
+            '__MACOSX/._scan_1.pdf': b'junk',
+        })
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.client.post(self.url, {'archive': archive})
+        self.assertEqual(response.status_code, 200)
+
+        files = NewsFile.objects.filter(news=self.news)
+        self.assertEqual(sorted(files.values_list('filename', flat=True)), ['scan_1.pdf', 'scan_2.pdf'])
+        self.assertEqual(files.get(filename='scan_2.pdf').filename_normalized, 'scan_2.pdf')
+        inserts = [sql for sql, _ in recorder.queries if sql.startswith('INSERT INTO "news_site_newsfile"')]
+        self.assertEqual(len(inserts), 1)
+
+        report = {result.name: result for result in response.context['report']}
+        self.assertTrue(report['scan_2.pdf'].imported)
+        self.assertEqual(report['copy_of_1.pdf'].detail, "такой файл уже прикреплен")
+        self.assertEqual(report['._scan_1.pdf'].detail, "служебный файл")
+
+    def test_staging_directory(self):
+        staging = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, staging, ignore_errors=True)
+        os.makedirs(os.path.join(staging, 'batch', 'sub'))
+        for name, content in (('a.pdf', b'a'), ('sub/b.pdf', b'b')):
+            with open(os.path.join(staging, 'batch', name), 'wb') as f:
+                f.write(content)
+
+        with self.settings(UPLOAD_STAGING_DIR=staging):
+            response = self.client.get(self.url)
+            self.assertEqual(response.context['staging_dirs'], ['batch'])
+            self.client.post(self.url, {'staging_dir': 'batch'})
+            # Выход за пределы UPLOAD_STAGING_DIR запрещен
+            response = self.client.post(self.url, {'staging_dir': '../'}, follow=True)
+            self.assertContains(response, 'Каталог не найден')
+
+        self.assertEqual(sorted(NewsFile.objects.filter(news=self.news).values_list('filename', flat=True)),
+                         ['a.pdf', 'b.pdf'])
+        self.assertTrue(os.path.exists(os.path.join(staging, 'batch', 'a.pdf')))
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, ingest.STAGING_DIR)), [])
+
+    def test_bad_archive(self):
+        bad = BytesIO(b'not a zip')
+        bad.name = 'bad.zip'
+        response = self.client.post(self.url, {'archive': bad}, follow=True)
+        self.assertContains(response, 'не является ZIP-архивом')
+        self.assertFalse(NewsFile.objects.exists())
+
+
+    def test_ingest_command(self):
+        staging = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, staging, ignore_errors=True)
+        os.makedirs(os.path.join(staging, 'scans'))
+        for i in range(3):
+            with open(os.path.join(staging, 'scans', f'скан_{i}.pdf'), 'wb') as f:
+                f.write(f'scan {i}'.encode())
+        archive_path = os.path.join(staging, 'more.zip')
+        with open(archive_path, 'wb') as f:
+            f.write(self.make_zip({'a.txt': b'a', 'скан_0.pdf': b'scan 0'}).getvalue())
+
+        out = StringIO()
+        with self.settings(UPLOAD_STAGING_DIR=staging):
+            call_command('ingest_files', self.news.id, 'scans', stdout=out)
+            call_command('ingest_files', self.news.id, archive_path, stdout=out)
+        self.assertEqual(NewsFile.objects.filter(news=self.news).count(), 4)
+        self.assertIn("Прикреплено файлов: 1, пропущено: 1", out.getvalue())
+
+
+class BulkImportTests(NewsSiteTestCase):
+    """import_content: манифест порциями, побочные эффекты сигналов, продолжение"""
+
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        with open(os.path.join(self.dir, 'scan.pdf'), 'wb') as f:
+            f.write(b'scan')
+
+    def write_manifest(self, rows):
+        path = os.path.join(self.dir, 'manifest.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write((row if isinstance(row, str) else json.dumps(row, ensure_ascii=False)) + '\n')
+        return path
+
+    def run_import(self, path, **options):
+        out = StringIO()
+        call_command('import_content', path, stdout=out, **options)
+        return out.getvalue()
+
+    def test_import_manifest(self):
+        section = Section.objects.create(title='Отчеты', slug='reports')
+        path = self.write_manifest([
+            {'section': 'reports', 'category': 'annual/2020', 'category_title': 'Годовые / 2020',
+             'subdivision': 'Отдел 1', 'title': 'Отчет за 2020', 'created_at': '2020-12-31',
+             'files': ['scan.pdf', 'missing.pdf']},
+            {'section': 'reports', 'category': 'annual', 'title': 'Сводка'},
+            {'section': 'new', 'section_title': 'Новый раздел', 'title': 'Новость'},
+            {'section': 'reports'},
+            'не json',
+        ])
+        output = self.run_import(path, chunk_size=2)
+
+        self.assertEqual(News.objects.count(), 3)
+        news = News.objects.get(title='Отчет за 2020')
+        self.assertEqual(news.category.full_path, 'Годовые / 2020')
+        self.assertEqual(news.subdivision.name, 'Отдел 1')
+        self.assertEqual(timezone.localtime(news.created_at).date().isoformat(), '2020-12-31')
+        self.assertEqual(news.title_normalized, 'отчет за 2020')
+        self.assertEqual(list(news.files.values_list('filename', flat=True)), ['scan.pdf'])
+        self.assertEqual(list(News.objects.order_by('order').values_list('title', flat=True)),
+                         ['Отчет за 2020', 'Сводка', 'Новость'])
+
+        # Счетчики, обычно обновляемые сигналами
+        section.refresh_from_db()
+        self.assertEqual(section.news_count, 2)
+        annual = Category.objects.get(section=section, path='annual')
+        self.assertEqual((annual.news_count, annual.subtree_news_count), (1, 2))
+        self.assertEqual(Section.objects.get(slug='new').title, 'Новый раздел')
+
+        self.assertIn('нет файла', output)
+        self.assertIn('строка 4: нет заголовка', output)
+        self.assertIn('строка 5: неверный JSON', output)
+
+    def test_resume_from_state(self):
+        Section.objects.create(title='Отчеты', slug='reports')
+        rows = [{'section': 'reports', 'title': f'Новость {i}'} for i in range(5)]
+        path = self.write_manifest(rows)
+        ImportProgress.objects.create(manifest=os.path.abspath(path), rows=3)
+
+        self.run_import(path)
+        self.assertEqual(sorted(News.objects.values_list('title', flat=True)), ['Новость 3', 'Новость 4'])
+        # Повторный запуск ничего не добавляет
+        self.run_import(path)
+        self.assertEqual(News.objects.count(), 2)
+
+    def test_failed_chunk_is_not_counted(self):
+        Section.objects.create(title='Отчеты', slug='reports')
+        path = self.write_manifest([{'section': 'reports', 'title': f'Новость {i}'} for i in range(4)])
+        index_news = bulkimport.search.index_news
+        calls = []
+
+        def fail_second(ids):
+            calls.append(ids)
+            if len(calls) == 2:
+                raise RuntimeError('обрыв')
+            index_news(ids)
+
+        with mock.patch.object(bulkimport.search, 'index_news', fail_second), self.assertRaises(RuntimeError):
+            self.run_import(path, chunk_size=2)
+        # Вторая порция откатилась вместе с отметкой хода импорта
+        self.assertEqual(ImportProgress.objects.get(manifest=os.path.abspath(path)).rows, 2)
+        self.assertEqual(News.objects.count(), 2)
+
+        self.run_import(path, chunk_size=2)
+        self.assertEqual(sorted(News.objects.values_list('title', flat=True)), [f'Новость {i}' for i in range(4)])
+
+    def test_quotes_upload_replaces_quotes(self):
+        TickerQuote.objects.create(text='старая')
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        quotes = BytesIO('﻿Первая\n\n  Вторая  \r\nТретья'.encode('utf-8'))
+        quotes.name = 'quotes.txt'
+        self.client.post(reverse('admin:news_site_tickerquote_add'), {'txt_file': quotes})
+        self.assertEqual(sorted(TickerQuote.objects.values_list('text', flat=True)), ['Вторая', 'Первая', 'Третья'])
+
+
+class EditorFilesTests(NewsSiteTestCase):
+    """Индекс загрузок CKEditor: запись при загрузке, сверка с диском, страница"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.root = os.path.join(settings.MEDIA_ROOT, editor_files.get_upload_root())
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def put_file(self, relative, content=b'data'):
+        path = os.path.join(self.root, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def indexed(self):
+        return sorted(EditorUpload.objects.values_list('name', flat=True))
+
+    def test_upload_is_recorded(self):
+        image = BytesIO(b'GIF89a')
+        image.name = 'Картинка.gif'
+        response = self.client.post(reverse('ckeditor_upload'), {'upload': image})
+        upload = EditorUpload.objects.get()
+        self.assertEqual(response.json()['url'], upload.url)
+        self.assertTrue(upload.is_image)
+        self.assertEqual(upload.size, 6)
+
+    def test_browse_thumbnails_exist(self):
+        image = BytesIO(b'GIF89a')
+        image.name = 'Картинка с длинным именем.gif'
+        self.client.post(reverse('ckeditor_upload'), {'upload': image})
+        response = self.client.get(reverse('ckeditor_browse'))
+        files = response.context['files']
+        self.assertEqual([f['visible_filename'] for f in files], [EditorUpload.objects.get().name])
+        for item in files:
+            # Миниатюра - сам файл: media в тестах не раздается, проверяем файл по URL
+            self.assertTrue(item['thumb'].startswith(settings.MEDIA_URL))
+            self.assertTrue(default_storage.exists(unquote(item['thumb'][len(settings.MEDIA_URL):])))
+
+    def test_incremental_scan(self):
+        self.put_file('2024/01/01/a.png')
+        self.put_file('2024/01/02/b.pdf')
+        stats = editor_files.scan()
+        self.assertEqual(stats['added'], 2)
+        self.assertEqual(self.indexed(), ['a.png', 'b.pdf'])
+
+        # Ничего не менялось - файлы не перечитываются
+        stats = editor_files.scan()
+        self.assertEqual((stats['scanned'], stats['added']), (0, 0))
+        self.assertGreater(stats['skipped'], 0)
+
+        os.remove(os.path.join(self.root, '2024/01/01/a.png'))
+        self.put_file('2024/01/02/c.jpg')
+        shutil.rmtree(os.path.join(self.root, '2024/01/02'))
+        self.put_file('2024/02/01/d.txt')
+        stats = editor_files.scan()
+        self.assertEqual(self.indexed(), ['d.txt'])
+        self.assertFalse(EditorUploadDirectory.objects.filter(path__endswith='2024/01/02').exists())
+
+    def test_page_search_sort_and_delete(self):
+        for i in range(5):
+            self.put_file(f'2024/01/01/file_{i}.pdf', b'x' * (i + 1))
+        self.put_file('2024/01/01/Отчет.pdf')
+        url = reverse('news_site:ckeditor_files')
+
+        response = self.client.get(url, {'sort': 'size'})
+        self.assertEqual(response.context['files'].paginator.count, 6)
+        self.assertEqual(response.context['files'][0].name, 'file_4.pdf')
+
+        response = self.client.get(url, {'q': 'ОТЧЕТ'})
+        self.assertEqual([f.name for f in response.context['files']], ['Отчет.pdf'])
+
+        upload = EditorUpload.objects.get(name='Отчет.pdf')
+        content = get_version(CONTENT_VERSION)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('news_site:delete_ckeditor_file'), {'filepath': upload.path, 'next': url + '?q=x'})
+        self.assertFalse(EditorUpload.objects.filter(pk=upload.pk).exists())
+        # Закэшированные страницы со ссылкой на файл сброшены
+        self.assertNotEqual(get_version(CONTENT_VERSION), content)
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, upload.path)))
+
+        # Файлы вне папки CKEditor не удаляются
+        outside = os.path.join(settings.MEDIA_ROOT, 'news_files', 'keep.pdf')
+        with open(outside, 'wb') as f:
+            f.write(b'keep')
+        self.client.post(reverse('news_site:delete_ckeditor_file'), {'filepath': 'news_files/keep.pdf'})
+        self.assertTrue(os.path.exists(outside))
+
+
+class OrphanMediaTests(NewsSiteTestCase):
+    """Поиск файлов без ссылок и перенос в карантин"""
+
+    def setUp(self):
+        super().setUp()
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        os.makedirs(settings.MEDIA_ROOT)
+        self.section = Section.objects.create(title='Раздел', slug='section')
+
+    def put_file(self, relative, content=b'data', age=timedelta(days=2)):
+        path = os.path.join(settings.MEDIA_ROOT, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        moment = time.time() - age.total_seconds()
+        os.utime(path, (moment, moment))
+        return path
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('find_orphan_media', *args, '--workers=2', stdout=out)
+        return out.getvalue()
+
+    def test_content_paths(self):
+        text = (
+            '<img src="/media/news_files/ckeditor_uploads/%D0%A4%D0%BE%D1%82%D0%BE.png?v=1">'
+            "<a href='http://example.com/media/a/b.pdf#p2'>x</a> /static/x.css /media/c%20d.doc&amp;"
+        )
+        self.assertEqual(
+            list(orphans.content_paths(text)),
+            ['news_files/ckeditor_uploads/Фото.png', 'a/b.pdf', 'c d.doc&'],
+        )
+
+    def test_find_and_quarantine(self):
+        news_file = NewsFile.objects.create(
+            news=News.objects.create(section=self.section, title='С вложением'),
+            file=ContentFile(b'attachment', name='report.pdf'), filename='report.pdf',
+        )
+        used = self.put_file('news_files/ckeditor_uploads/2024/01/01/Фото.png')
+        News.objects.create(
+            section=self.section, title='С картинкой',
+            content=f'<p><img src="{default_storage.url("news_files/ckeditor_uploads/2024/01/01/Фото.png")}"></p>',
+        )
+        orphan = self.put_file('news_files/ckeditor_uploads/2024/01/01/removed.png', b'x' * 10)
+        legacy = self.put_file('news_files/old.pdf', b'y' * 20)
+        fresh = self.put_file('news_files/ckeditor_uploads/2024/01/02/new.png', age=timedelta(0))
+        service = self.put_file('news_files/.chunks/upload.part')
+        editor_files.scan()
+
+        output = self.run_command()
+        self.assertIn("Файлов без ссылок: 2", output)
+        self.assertTrue(os.path.exists(orphan))
+
+        self.run_command('--quarantine')
+        for path in (news_file.file.path, used, fresh, service):
+            self.assertTrue(os.path.exists(path))
+        self.assertFalse(os.path.exists(orphan))
+        self.assertFalse(os.path.exists(legacy))
+        batch, = os.listdir(os.path.join(settings.MEDIA_ROOT, orphans.QUARANTINE_DIR))
+        self.assertTrue(os.path.exists(os.path.join(settings.MEDIA_ROOT, orphans.QUARANTINE_DIR, batch, 'news_files', 'old.pdf')))
+        self.assertFalse(EditorUpload.objects.filter(name='removed.png').exists())
+
+        # Карантин не считается сиротами; старые запуски удаляются
+        self.assertIn("Файлов без ссылок: 0", self.run_command())
+        os.rename(
+            os.path.join(settings.MEDIA_ROOT, orphans.QUARANTINE_DIR, batch),
+            os.path.join(settings.MEDIA_ROOT, orphans.QUARANTINE_DIR, '20000101-000000'),
+        )
+        self.assertEqual(orphans.purge_quarantine(days=30), (1, 30))
+
+
+class ImageDerivativesTests(NewsSiteTestCase):
+    """Уменьшенные копии картинок CKEditor и srcset в тексте новости"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.section = Section.objects.create(title='Раздел', slug='section')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def upload(self, name, size, mode='RGB', fmt='JPEG'):
+        from PIL import Image
+        content = BytesIO()
+        Image.new(mode, size, 'red').save(content, fmt)
+        content.seek(0)
+        content.name = name
+        url = self.client.post(reverse('ckeditor_upload'), {'upload': content}).json()['url']
+        return EditorUpload.objects.get(path=url[len(settings.MEDIA_URL):].replace('%20', ' '))
+
+    def test_build_and_rewrite(self):
+        photo = self.upload('photo.jpg', (2000, 1000))
+        icon = self.upload('icon.png', (300, 200), mode='RGBA', fmt='PNG')
+        call_command('build_image_derivatives', '--workers=1', '--no-scan', stdout=StringIO())
+
+        photo.refresh_from_db()
+        icon.refresh_from_db()
+        self.assertEqual((photo.width, photo.derivative_widths), (2000, [480, 960, 1600]))
+        self.assertEqual(icon.derivative_widths, [300])
+        for name in derivatives.derivative_names(photo.path, photo.derivative_widths):
+            self.assertTrue(default_storage.exists(name), name)
+        self.assertTrue(default_storage.exists(derivatives.derivative_name(icon.path, 300, 'png')))
+        # Копии - не сироты
+        self.assertTrue(set(derivatives.derivative_names(photo.path, [480])) <= set(orphans.references()))
+
+        news = News.objects.create(section=self.section, title='Фото', content=(
+            f'<p><img alt="Фото" src="{photo.url}" style="width:500px; height:250px" /></p>'
+            f'<p><img src="/static/logo.png"></p>'
+        ))
+        html = self.client.get(reverse('news_site:news_detail', kwargs={'news_id': news.id})).content.decode()
+        self.assertIn('<source type="image/webp" srcset="', html)
+        self.assertIn(default_storage.url(derivatives.derivative_name(photo.path, 960, 'webp')) + ' 960w', html)
+        self.assertIn(f'src="{default_storage.url(derivatives.derivative_name(photo.path, 1600, "jpg"))}"', html)
+        self.assertIn('sizes="500px"', html)
+        self.assertIn('alt="Фото"', html)
+        self.assertIn('<img src="/static/logo.png">', html)
+
+        # Повторный запуск ничего не делает, удаление картинки удаляет и копии
+        output = StringIO()
+        call_command('build_image_derivatives', '--workers=1', '--no-scan', stdout=output)
+        self.assertIn("Обработано картинок: 0", output.getvalue())
+        self.client.post(reverse('news_site:delete_ckeditor_file'), {'filepath': photo.path})
+        for name in derivatives.derivative_names(photo.path, [480, 960, 1600]):
+            self.assertFalse(default_storage.exists(name), name)
+
+    def test_content_without_derivatives_is_unchanged(self):
+        content = '<p><img src="/media/news_files/ckeditor_uploads/missing.jpg"></p>'
+        self.assertEqual(derivatives.responsive_images(content), content)
+        self.assertEqual(derivatives.responsive_images('<p>Текст</p>'), '<p>Текст</p>')
+
+
+class StaticFilesStorageTests(NewsSiteTestCase):
+    """collectstatic: имена с хешем и сжатые копии только для изменившихся файлов"""
+
+    def setUp(self):
+        super().setUp()
+        self.source = tempfile.mkdtemp()
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source, ignore_errors=True)
+        self.addCleanup(shutil.rmtree, self.static_root, ignore_errors=True)
+        os.makedirs(os.path.join(self.source, 'css'))
+        self.write('css/site.css', 'body { background: url("logo.gif"); }\n' + '.item { color: red; }\n' * 50)
+        self.write('css/logo.gif', 'GIF89a' + 'x' * 1000)
+        self.write('css/tiny.css', 'a{}')
+
+    def write(self, name, content):
+        with open(os.path.join(self.source, name), 'w') as f:
+            f.write(content)
+
+    def collect(self):
+        with self.settings(
+            STATIC_ROOT=self.static_root, STATICFILES_DIRS=[self.source],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STORAGES={**settings.STORAGES, 'staticfiles': {'BACKEND': 'news_site.storage.CompressedManifestStaticFilesStorage'}},
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            return json.loads(open(os.path.join(self.static_root, 'staticfiles.json')).read())['paths']
+
+    def test_hashed_and_compressed(self):
+        paths = self.collect()
+        hashed = os.path.join(self.static_root, paths['css/site.css'])
+        with gzip.open(hashed + '.gz') as f, open(hashed, 'rb') as original:
+            content = f.read()
+            self.assertEqual(content, original.read())
+        self.assertIn(paths['css/logo.gif'].split('/')[-1].encode(), content)
+        self.assertTrue(os.path.exists(os.path.join(self.static_root, 'css', 'site.css.gz')))
+        self.assertFalse(os.path.exists(os.path.join(self.static_root, paths['css/logo.gif']) + '.gz'))
+        self.assertFalse(os.path.exists(os.path.join(self.static_root, paths['css/tiny.css']) + '.gz'))
+
+        # Повторный запуск не пересжимает неизменившиеся файлы
+        mtime = os.stat(hashed + '.gz').st_mtime_ns
+        self.write('css/site.css', '.changed { color: blue; }\n' * 50)
+        new_paths = self.collect()
+        self.assertEqual(os.stat(hashed + '.gz').st_mtime_ns, mtime)
+        self.assertNotEqual(new_paths['css/site.css'], paths['css/site.css'])
+        self.assertTrue(os.path.exists(os.path.join(self.static_root, new_paths['css/site.css']) + '.gz'))
+
+
+class CounterTests(NewsSiteTestCase):
+    """Счетчики новостей и категорий (counters.py) после создания, удаления, переноса и правки"""
+
+    def setUp(self):
+        super().setUp()
+        self.section = Section.objects.create(title='Раздел', slug='section')
+        self.other = Section.objects.create(title='Другой', slug='other')
+        self.root = Category.objects.create(section=self.section, title='Корень', slug='root')
+        self.child = Category.objects.create(section=self.section, title='Дочерняя', slug='child', parent=self.root)
+
+    def counts(self):
+        sections = {s.slug: (s.categories_count, s.news_count) for s in Section.objects.all()}
+        categories = {c.slug: (c.news_count, c.subtree_news_count) for c in Category.objects.all()}
+        return sections, categories
+
+    def assertRecounted(self):
+        # Пересчет по фактическим данным ничего не исправляет
+        before = self.counts()
+        self.assertEqual(counters.recount(), {'sections': 0, 'categories': 0})
+        self.assertEqual(self.counts(), before)
+
+    def test_news_and_categories(self):
+        news = News.objects.create(section=self.section, category=self.child, title='Новость')
+        News.objects.create(section=self.section, category=self.root, title='Новость 2')
+        self.assertEqual(self.counts(), (
+            {'section': (2, 2), 'other': (0, 0)},
+            {'root': (1, 2), 'child': (1, 1)},
+        ))
+
+        # Перенос новости и категории в другой раздел/ветку
+        news.section, news.category = self.other, None
+        news.save()
+        self.child.parent = None
+        self.child.save()
+        self.assertEqual(self.counts(), (
+            {'section': (2, 1), 'other': (0, 1)},
+            {'root': (1, 1), 'child': (0, 0)},
+        ))
+        self.assertRecounted()
+
+        news.delete()
+        self.root.delete()
+        self.assertEqual(self.counts(), ({'section': (1, 0), 'other': (0, 0)}, {'child': (0, 0)}))
+        self.assertRecounted()
+
+    def test_stale_instance_does_not_overwrite_counters(self):
+        section = Section.objects.get(pk=self.section.pk)
+        child = Category.objects.get(pk=self.child.pk)
+        News.objects.create(section=self.section, category=self.child, title='Новость')
+        section.title = 'Раздел (новое название)'
+        section.save()
+        child.parent = None
+        child.save()
+        self.assertEqual(self.counts(), (
+            {'section': (2, 1), 'other': (0, 0)},
+            {'root': (0, 0), 'child': (1, 1)},
+        ))
+        self.assertRecounted()
+
+    def test_recount_command_invalidates_pages(self):
+        Section.objects.filter(pk=self.section.pk).update(news_count=7)
+        content = get_version(CONTENT_VERSION)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('recount_counters', stdout=StringIO())
+        self.assertEqual(Section.objects.get(pk=self.section.pk).news_count, 0)
+        self.assertNotEqual(get_version(CONTENT_VERSION), content)
+
+    def test_admin_edit_keeps_counters(self):
+        News.objects.create(section=self.section, category=self.child, title='Новость')
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        save_model = SectionAdmin.save_model
+
+        def add_news_meanwhile(admin, request, obj, form, change):
+            # Новость добавлена, пока открыта форма раздела: obj уже загружен
+            News.objects.create(section=self.section, title='Новость 2')
+            save_model(admin, request, obj, form, change)
+
+        url = reverse('admin:news_site_section_change', args=[self.section.pk])
+        with mock.patch.object(SectionAdmin, 'save_model', add_news_meanwhile):
+            response = self.client.post(url, {
+                'title': 'Раздел', 'slug': 'section', 'description': '', 'order': 5, 'subdivision': '',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Section.objects.get(pk=self.section.pk).order, 5)
+        self.assertEqual(self.counts()[0]['section'], (2, 2))
+        self.assertRecounted()
+
+
+class CacheVersionTests(NewsSiteTestCase):
+    """Версии кэшей меняются только после коммита изменений"""
+
+    def test_bump_after_commit(self):
+        section = Section.objects.create(title='Раздел', slug='section')
+        routing, content = get_version(ROUTING_VERSION), get_version(CONTENT_VERSION)
+        with self.captureOnCommitCallbacks() as callbacks:
+            category = Category.objects.create(section=section, title='Категория', slug='cat')
+            self.assertEqual((get_version(ROUTING_VERSION), get_version(CONTENT_VERSION)), (routing, content))
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_version(ROUTING_VERSION), routing)
+        self.assertNotEqual(get_version(CONTENT_VERSION), content)
+        self.assertEqual(category.path, 'cat')
+
+
+class SearchTests(NewsSiteTestCase):
+    """Поиск по новостям: токены запроса"""
+
+    def test_tokens_without_letters_are_ignored(self):
+        section = Section.objects.create(title='Приказы', slug='orders')
+        News.objects.create(section=section, title='Приказ 5 от 01/02/2024')
+        self.assertEqual(search.tokenize('приказ № 5 / 2024'), ['приказ', '5', '2024'])
+        self.assertEqual(search.build_match(search.tokenize('№ / -')), '')
+
+        url = reverse('news_site:search_news')
+        for available in (True, False):
+            # False - поиск ncontains по заголовку, подразделению и файлам (не SQLite)
+            with mock.patch.object(search, 'is_available', return_value=available):
+                for query in ('приказ № 5', 'приказ / 5'):
+                    response = self.client.get(url, {'q': query})
+                    self.assertEqual(response.context['results_count'], 1, (available, query))
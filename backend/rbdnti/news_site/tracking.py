@@ -0,0 +1,207 @@
+# tracking.py
+"""
+Буферизованная запись статистики просмотров.
+
+Middleware не пишет в БД на каждый запрос: события складываются в очередь
+в памяти воркера и сбрасываются пачками (bulk_create, одна транзакция на пачку)
+по размеру пачки или по таймеру. Очередь ограничена по размеру, при
+переполнении события отбрасываются согласно OVERFLOW_POLICY.
+
+Пачка, которую не удалось записать из-за блокировки SQLite ("database is
+locked"), возвращается в начало очереди и пишется при следующем сбросе.
+Если новость, раздел или категория удалены между постановкой события в
+очередь и сбросом, ссылка обнуляется (как on_delete=SET_NULL у уже
+записанных строк), остальная пачка записывается.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, transaction
+
+from .models import Category, News, Section, ViewStatistic
+
+logger = logging.getLogger(__name__)
+
+# Поле ViewStatistic -> модель, на которую оно ссылается
+REFERENCES = (('section_id', Section), ('category_id', Category), ('news_id', News))
+
+DEFAULTS = {
+    'MAX_QUEUE_SIZE': 10000,       # максимум событий в памяти воркера
+    'BATCH_SIZE': 500,             # событий в одной транзакции
+    'FLUSH_INTERVAL': 5.0,         # секунд между сбросами
+    'OVERFLOW_POLICY': 'drop_oldest',  # или 'drop_newest'
+    'ASYNC': True,                 # False - сброс в потоке запроса (тесты)
+}
+
+
+def get_tracking_settings():
+    conf = dict(DEFAULTS)
+    conf.update(getattr(settings, 'STATISTICS_TRACKING', {}))
+    return conf
+
+
+class ViewTracker:
+    """Очередь событий просмотра с пакетной записью в БД"""
+
+    def __init__(self, max_queue_size, batch_size, flush_interval,
+                 overflow_policy='drop_oldest', use_thread=True):
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy
+        self.use_thread = use_thread
+
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._pid = None
+
+        # Счетчики
+        self.queued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+
+    @classmethod
+    def from_settings(cls):
+        conf = get_tracking_settings()
+        return cls(
+            max_queue_size=conf['MAX_QUEUE_SIZE'],
+            batch_size=conf['BATCH_SIZE'],
+            flush_interval=conf['FLUSH_INTERVAL'],
+            overflow_policy=conf['OVERFLOW_POLICY'],
+            use_thread=conf['ASYNC'],
+        )
+
+    def record(self, view):
+        """Поставить событие (несохраненный ViewStatistic) в очередь"""
+        self._ensure_worker()
+        with self._lock:
+            if len(self._queue) >= self.max_queue_size:
+                self.dropped += 1
+                if self.overflow_policy == 'drop_newest':
+                    return False
+                self._queue.popleft()
+            self._queue.append(view)
+            self.queued += 1
+            batch_ready = len(self._queue) >= self.batch_size
+
+        if batch_ready:
+            if self.use_thread:
+                self._wakeup.set()
+            else:
+                self.flush()
+        return True
+
+    def flush(self):
+        """Записать все накопленные события. Возвращает число записанных."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                if not batch:
+                    break
+                try:
+                    try:
+                        self._insert(batch)
+                    except IntegrityError:
+                        self._clear_missing_references(batch)
+                        self._insert(batch)
+                    self.flushed += len(batch)
+                    written += len(batch)
+                except OperationalError as e:
+                    if 'locked' not in str(e):
+                        self.failed += len(batch)
+                        logger.exception("Error flushing view statistics")
+                        break
+                    # Блокировка временная - повторим при следующем сбросе
+                    self._requeue(batch)
+                    logger.warning("View statistics flush postponed: %s", e)
+                    break
+                except Exception:
+                    # Пачку не возвращаем в очередь, чтобы память оставалась ограниченной
+                    self.failed += len(batch)
+                    logger.exception("Error flushing view statistics")
+                    break
+        return written
+
+    def _insert(self, batch):
+        for view in batch:
+            # После отката неудачной попытки id, выданные bulk_create, недействительны
+            view.pk = None
+        with transaction.atomic():
+            ViewStatistic.objects.bulk_create(batch)
+
+    def _clear_missing_references(self, batch):
+        for field, model in REFERENCES:
+            ids = {getattr(view, field) for view in batch} - {None}
+            if not ids:
+                continue
+            missing = ids - set(model.objects.filter(id__in=ids).values_list('id', flat=True))
+            for view in batch:
+                if getattr(view, field) in missing:
+                    setattr(view, field, None)
+
+    def _requeue(self, batch):
+        with self._lock:
+            self._queue.extendleft(reversed(batch))
+            # Очередь остается ограниченной: лишнее - самые старые события
+            while len(self._queue) > self.max_queue_size:
+                self._queue.popleft()
+                self.dropped += 1
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._queue)
+        return {
+            'queued': self.queued,
+            'flushed': self.flushed,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'pending': pending,
+        }
+
+    def shutdown(self):
+        """Остановить фоновый поток и сбросить остаток очереди"""
+        self._stopping = True
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def _ensure_worker(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            # После fork (gunicorn --preload) очередь и поток родителя не наследуем
+            self._queue.clear()
+            self._pid = pid
+            self._stopping = False
+            if self.use_thread:
+                self._thread = threading.Thread(target=self._run, name='view-tracker', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        from django.db import connection
+
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+        connection.close()
+
+
+tracker = ViewTracker.from_settings()
+atexit.register(tracker.shutdown)
@@ -0,0 +1,175 @@
+# uploads.py
+"""
+Загрузка больших вложений новостей частями с докачкой.
+
+Клиент (admin/js/chunked_upload.js) создает загрузку (start), затем
+отправляет части PUT-запросами с заголовком Content-Range. Тело части
+читается из потока запроса кусками READ_SIZE и сразу пишется на диск,
+поэтому память воркера не зависит от размера файла. CRC32 принятых байт
+считается по ходу записи и хранится в ChunkedUpload; CRC32 части,
+присланный клиентом, сверяется до того, как часть будет засчитана.
+
+Часть сначала пишется в собственный файл, затем засчитывается условным
+UPDATE offset и только после этого дописывается во временный файл
+загрузки MEDIA_ROOT/news_files/.chunks/<upload_id>.part. Два запроса с
+одним offset (повтор клиента после таймаута) не пишут в .part оба: байты
+на диске всегда те, по которым посчитан сохраненный CRC32.
+
+Оборвалась связь - клиент узнает принятый offset и продолжает с него.
+Последняя часть завершает загрузку: временный файл становится общим
+содержимым FileBlob (blobs.py, жесткая ссылка на той же файловой системе)
+или удаляется, если такое содержимое уже есть, и создается NewsFile.
+"""
+import os
+import shutil
+import uuid
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import blobs
+from .models import ChunkedUpload, NewsFile
+
+CHUNKS_DIR = os.path.join('news_files', '.chunks')
+READ_SIZE = 1024 * 1024
+# Брошенные загрузки удаляются при старте новых
+STALE_AFTER = timedelta(days=7)
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def get_chunk_size():
+    return getattr(settings, 'CHUNKED_UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024)
+
+
+def part_path(upload):
+    return os.path.join(settings.MEDIA_ROOT, CHUNKS_DIR, f'{upload.upload_id}.part')
+
+
+def start(news, filename, size, user=None):
+    """
+    Новая загрузка или незавершенная загрузка того же файла (имя и размер)
+    тем же пользователем - тогда клиент продолжит с ее offset.
+    """
+    filename = os.path.basename(filename or '').strip()[:255]
+    if not filename or size < 0:
+        raise UploadError("Не указаны имя или размер файла")
+    remove_stale()
+
+    upload = ChunkedUpload.objects.filter(news=news, user=user, filename=filename, size=size).first()
+    if upload is not None:
+        try:
+            on_disk = os.path.getsize(part_path(upload))
+        except OSError:
+            on_disk = -1
+        if on_disk >= upload.offset:
+            return upload
+        # Временный файл пропал или короче принятого - начинаем заново
+        cancel(upload)
+
+    upload = ChunkedUpload.objects.create(news=news, user=user, filename=filename, size=size)
+    os.makedirs(os.path.dirname(part_path(upload)), exist_ok=True)
+    open(part_path(upload), 'wb').close()
+    return upload
+
+
+def write_chunk(upload, stream, start, length, chunk_crc=None):
+    """
+    Записать часть [start, start + length) из потока stream.
+    Возвращает NewsFile, если это была последняя часть, иначе None.
+    """
+    if start != upload.offset:
+        raise UploadError("Часть не с того места", status=409, offset=upload.offset)
+    if length <= 0 or start + length > upload.size:
+        raise UploadError("Часть выходит за размер файла", offset=upload.offset)
+
+    path = part_path(upload)
+    chunk_path = f'{path}.{uuid.uuid4().hex}.chunk'
+    checksum = upload.checksum
+    crc = 0
+    received = 0
+    try:
+        with open(chunk_path, 'wb') as f:
+            while received < length:
+                data = stream.read(min(READ_SIZE, length - received))
+                if not data:
+                    break
+                f.write(data)
+                crc = zlib.crc32(data, crc)
+                checksum = zlib.crc32(data, checksum)
+                received += len(data)
+
+        if received != length:
+            raise UploadError("Часть получена не полностью", offset=upload.offset)
+        if chunk_crc is not None and chunk_crc != crc:
+            raise UploadError("Контрольная сумма части не совпала", offset=upload.offset)
+
+        # Засчитываем часть, только если offset не сдвинул параллельный запрос
+        updated = ChunkedUpload.objects.filter(pk=upload.pk, offset=start).update(
+            offset=start + length, checksum=checksum, updated_at=timezone.now(),
+        )
+        if not updated:
+            upload.refresh_from_db()
+            raise UploadError("Часть уже принята другим запросом", status=409, offset=upload.offset)
+
+        # Offset занят этим запросом - в .part пишет только он
+        try:
+            with open(chunk_path, 'rb') as src, open(path, 'r+b') as dst:
+                dst.seek(start)
+                shutil.copyfileobj(src, dst, READ_SIZE)
+        except OSError:
+            ChunkedUpload.objects.filter(pk=upload.pk, offset=start + length).update(
+                offset=start, checksum=upload.checksum,
+            )
+            raise
+    finally:
+        try:
+            os.unlink(chunk_path)
+        except FileNotFoundError:
+            pass
+    upload.offset = start + length
+    upload.checksum = checksum
+
+    if upload.offset == upload.size:
+        return finish(upload)
+    return None
+
+
+def finish(upload):
+    """Сохранить принятый файл как общее содержимое (blobs.py) и создать NewsFile"""
+    path = part_path(upload)
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+        sha256, size = blobs.hash_file(f)
+
+    with transaction.atomic():
+        # Такое содержимое уже есть - временный файл просто удаляется,
+        # иначе он становится файлом FileBlob (жесткая ссылка, без копирования)
+        blob = blobs.acquire_local(path, upload.filename, sha256=sha256, size=size)
+        news_file = NewsFile.objects.create(
+            news=upload.news, file=blob.path, filename=upload.filename, blob=blob,
+        )
+        upload.delete()
+    os.unlink(path)
+    return news_file
+
+
+def cancel(upload):
+    try:
+        os.unlink(part_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def remove_stale():
+    for upload in ChunkedUpload.objects.filter(updated_at__lt=timezone.now() - STALE_AFTER):
+        cancel(upload)
@@ -12,6 +12,7 @@ urlpatterns = [
     path('ckeditor-files/', views.ckeditor_files_view, name='ckeditor_files'),
     path('delete-ckeditor-file/', views.delete_ckeditor_file, name='delete_ckeditor_file'),
     path('archive/', views.news_archive, name='news_archive'),
+    path('system-stats/', views.system_stats, name='system_stats'),
     path('<slug:section_slug>/', views.section_view, name='section'),
     path('<slug:section_slug>/<path:category_path>/', views.category_view, name='category'),
 ]
\ No newline at end of file
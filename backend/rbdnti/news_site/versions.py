@@ -0,0 +1,40 @@
+# versions.py
+"""
+Версии данных, общие для всех воркеров gunicorn.
+
+Кэши в памяти воркера (маршруты, цитаты, страницы) сверяют свою версию
+с версией в общем кэше (settings.CACHES) и перестраиваются, если данные
+изменились в любом воркере. Версия - время изменения в наносекундах.
+
+Изменения данных меняют версию после коммита (bump_version_on_commit):
+иначе другой воркер успеет прочитать старые данные до коммита и
+закэшировать их уже под новой версией.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _key(name):
+    return f'news_site:version:{name}'
+
+
+def get_version(name):
+    """Текущая версия набора данных name"""
+    version = cache.get(_key(name))
+    if version is None:
+        version = bump_version(name)
+    return version
+
+
+def bump_version(name):
+    """Отметить изменение набора данных name"""
+    version = time.time_ns()
+    cache.set(_key(name), version, None)
+    return version
+
+
+def bump_version_on_commit(name):
+    """bump_version после коммита текущей транзакции (вне транзакции - сразу)"""
+    transaction.on_commit(lambda: bump_version(name))
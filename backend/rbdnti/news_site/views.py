@@ -1,66 +1,71 @@
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.http import JsonResponse
 from django.utils import timezone
+from urllib.parse import urlencode
 from datetime import datetime, timedelta
-from django.db.models import Count, Q
+from django.core.paginator import Paginator
+from django.db.models import Count, Q, Sum
+from django.urls import reverse
 import os
 import random
 from django.conf import settings
-from .models import Section, Category, News, NewsFile, ViewStatistic, DownloadStatistic, Subdivision
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from .models import Section, Category, News, NewsFile, ViewStatistic, DownloadStatistic, Subdivision, EditorUpload, EditorUploadDirectory
+from .conditional import (
+    conditional_page, news_detail_stamp, section_stamp, category_stamp, news_archive_stamp,
+)
+from .pagecache import cache_page_content, invalidate_content, page_stats, CONTENT_VERSION
+from .resolver import resolver
+from .tracking import tracker
+from .versions import get_version
+from . import derivatives, downloads, editor_files, keyset, search
+from .statistics import count_views, count_downloads, count_events_by, count_unique_visitors
+from .hll import STANDARD_ERROR
+from django.http import Http404
 from collections import defaultdict
 import re
 from django.utils.html import strip_tags
 from django.db.models import Q
 
 
+# Размер страницы списков новостей (постранично по курсору, см. keyset.py)
+ARCHIVE_PAGE_SIZE = 100
+LISTING_PAGE_SIZE = 50
+
+
+def render_news_listing(request, template, context, page, show_path=False):
+    """
+    Страница со списком новостей. ?partial=1 - только следующие новости
+    для кнопки "Показать еще": JSON {html, next, next_page}.
+    """
+    urls = {
+        'next_page': f'{request.path}?{urlencode({"after": page.next_cursor})}' if page.next_cursor else None,
+        'previous_page': f'{request.path}?{urlencode({"before": page.previous_cursor})}' if page.previous_cursor else None,
+    }
+    urls['next'] = f'{urls["next_page"]}&partial=1' if urls['next_page'] else None
+
+    if request.GET.get('partial'):
+        html = render_to_string('news_site/news_items.html', {'news_list': page, 'show_path': show_path}, request)
+        return JsonResponse({'html': html, 'next': urls['next'], 'next_page': urls['next_page']})
+
+    return render(request, template, {**context, 'news_list': page, 'show_path': show_path, 'page_urls': urls})
+
+
+@conditional_page(news_archive_stamp)
+@cache_page_content
 def news_archive(request):
-    """Архив всех новостей с пагинацией"""
-    all_news = News.objects.select_related('section', 'category', 'author', 'subdivision').prefetch_related('files').all()
-    
-    paginator = Paginator(all_news, 100)
-    page = request.GET.get('page')
-    
-    try:
-        news_list = paginator.page(page)
-    except PageNotAnInteger:
-        news_list = paginator.page(1)
-    except EmptyPage:
-        news_list = paginator.page(paginator.num_pages)
-    
-    ticker_quotes = get_ticker_quotes()
+    """Архив всех новостей, постранично по курсору"""
+    all_news = News.objects.select_related('section', 'category', 'author', 'subdivision').prefetch_related('files')
+    page = keyset.paginate(all_news, request, ARCHIVE_PAGE_SIZE)
     
     context = {
-        'news_list': news_list,
-        'total_news': all_news.count(),
-        'ticker_quotes': ticker_quotes,
+        'total_news': keyset.cached_count('archive', News.objects.all()),
         'title': 'Архив новостей'
     }
     
-    return render(request, 'news_site/news_archive.html', context)
-
-
-def get_ticker_quotes():
-    """Загружает случайные цитаты из базы данных"""
-    from .models import TickerQuote
-    
-    quotes_count = TickerQuote.objects.count()
-    
-    if quotes_count == 0:
-        # Fallback на старые цитаты, если в базе нет данных
-        return [
-            "Наука - это организованное знание. Герберт Спенсер",
-            "Информация - это не знание. Альберт Эйнштейн",
-            "Знание - это сила. Фрэнсис Бэкон",
-            "Технология - это то, чего не было, когда мы родились. Алан Кей",
-            "Будущее уже наступило, оно просто неравномерно распределено. Уильям Гибсон"
-        ]
-    
-    # Берем 5 случайных цитат
-    random_quotes = list(TickerQuote.objects.order_by('?')[:5])
-    return [quote.text for quote in random_quotes]
+    return render_news_listing(request, 'news_site/news_archive.html', context, page, show_path=True)
 
 
 def get_client_ip(request):
@@ -74,166 +79,155 @@ def get_client_ip(request):
 
 
 def tracked_download(request, file_id):
-    """Простое скачивание с трекингом БЕЗ JavaScript"""
+    """Скачивание с трекингом БЕЗ JavaScript (способ отдачи - см. downloads.py)"""
     news_file = get_object_or_404(NewsFile, id=file_id)
     
-    DownloadStatistic.objects.create(
-        news_file=news_file,
-        ip_address=get_client_ip(request),
-        user_agent=request.META.get('HTTP_USER_AGENT', '')[:500]
-    )
+    # Докачка (Range не с начала файла) - не новое скачивание; ссылки
+    # из админки (?untracked=1 у сотрудников) - тоже
+    untracked = request.GET.get('untracked') and request.user.is_staff
+    if not downloads.is_continuation(request) and not untracked:
+        DownloadStatistic.objects.create(
+            news_file=news_file,
+            ip_address=get_client_ip(request),
+            user_agent=request.META.get('HTTP_USER_AGENT', '')[:500]
+        )
     
-    return redirect(news_file.file.url)
+    return downloads.serve_file(request, news_file)
 
 
+@cache_page_content
 def index(request):
     sections = Section.objects.all()
     latest_news = News.objects.select_related('section', 'category', 'author', 'subdivision').prefetch_related('files')[:3]
-    ticker_quotes = get_ticker_quotes()
     
     return render(request, 'news_site/index.html', {
         'sections': sections,
         'latest_news': latest_news,
-        'ticker_quotes': ticker_quotes
     })
 
 
+@conditional_page(section_stamp)
+@cache_page_content
 def section_view(request, section_slug):
-    section = get_object_or_404(Section, slug=section_slug)
-    categories = Category.objects.filter(section=section, parent__isnull=True)
+    section_id = resolver.section_id(section_slug)
+    if section_id is None:
+        raise Http404("Раздел не найден")
+    section = get_object_or_404(Section, id=section_id)
+    categories = list(Category.objects.filter(section=section, parent__isnull=True))
     news_list = News.objects.filter(section=section, category__isnull=True).prefetch_related('files')
-    ticker_quotes = get_ticker_quotes()
+    page = keyset.paginate(news_list, request, LISTING_PAGE_SIZE)
     
-    return render(request, 'news_site/section.html', {
+    return render_news_listing(request, 'news_site/section.html', {
         'section': section,
         'categories': categories,
-        'news': news_list,
-        'ticker_quotes': ticker_quotes
-    })
+        # Новости вне категорий - по счетчикам, без COUNT
+        'total_news': section.news_count - sum(category.subtree_news_count for category in categories),
+    }, page)
 
 
+@conditional_page(category_stamp)
+@cache_page_content
 def category_view(request, section_slug, category_path):
-    section = get_object_or_404(Section, slug=section_slug)
-    slugs = [slug for slug in category_path.strip('/').split('/') if slug]
-
-    category = None
-    parent = None
-    for slug in slugs:
-        category = get_object_or_404(Category, section=section, slug=slug, parent=parent)
-        parent = category
+    section_id, category_id = resolver.resolve(section_slug, category_path)
+    if section_id is None:
+        raise Http404("Раздел не найден")
+
+    if category_id is not None:
+        category = get_object_or_404(Category.objects.select_related('section'), id=category_id)
+        section = category.section
+    elif any(category_path.split('/')):
+        raise Http404("Категория не найдена")
+    else:
+        category = None
+        section = get_object_or_404(Section, id=section_id)
 
     subcategories = Category.objects.filter(parent=category)
     news_list = News.objects.filter(category=category).prefetch_related('files')
-    ticker_quotes = get_ticker_quotes()
+    page = keyset.paginate(news_list, request, LISTING_PAGE_SIZE)
+    if category is not None:
+        total_news = category.news_count
+    else:
+        total_news = keyset.cached_count('uncategorized', News.objects.filter(category__isnull=True))
 
-    return render(request, 'news_site/category.html', {
+    return render_news_listing(request, 'news_site/category.html', {
         'section': section,
         'category': category,
         'subcategories': subcategories,
-        'news': news_list,
-        'ticker_quotes': ticker_quotes
-    })
+        'total_news': total_news,
+    }, page)
 
 
+@conditional_page(news_detail_stamp)
+@cache_page_content
 def news_detail(request, news_id):
-    news = get_object_or_404(News.objects.select_related('author', 'subdivision').prefetch_related('files'), id=news_id)
-    ticker_quotes = get_ticker_quotes()
+    news = get_object_or_404(News.objects.select_related('section', 'category', 'author', 'subdivision').prefetch_related('files'), id=news_id)
+    # Middleware статистики возьмет объекты отсюда, без повторного запроса
+    request.statistics_target = (news.section_id, news.category_id, news.id)
     
     return render(request, 'news_site/news_detail.html', {
         'news': news,
-        'ticker_quotes': ticker_quotes
+        'content': derivatives.responsive_images(news.content),
     })
 
 
 def search_news(request):
     """
-    Упрощённый поиск: по News.title, Subdivision.name и именам вложений (NewsFile.filename).
-    Поведение:
-      - SQL фильтр с title__icontains, subdivision__name__icontains, files__filename__icontains
-      - Если SQL ничего не дал (часто из-за регистрозависимости в SQLite), fallback:
-        берём последние N записей и делаем Python-проверку (casefold + strip_tags)
-      - Сохранены фильтры section/category (они сужают результаты, но не участвуют в текстовом матчинге)
+    Полнотекстовый поиск (FTS5, см. search.py) по заголовку, тексту новости,
+    подразделению и именам вложений.
+      - один ранжированный запрос с пагинацией и подсветкой совпадений
+      - фильтры section/category сужают выдачу в том же запросе
     """
-    import re
-    from django.utils.html import strip_tags
-    from django.db.models import Q
-
     raw_q = request.GET.get('q', '') or ''
     query = raw_q.replace('\u00A0', ' ')
     query = ' '.join(query.split()).strip()
 
     section_filter = request.GET.get('section', '')
     category_filter = request.GET.get('category', '')
+    if not category_filter.isdigit():
+        category_filter = ''
 
-    # Базовый queryset (предзагружаем файлы)
-    base_qs = News.objects.select_related('subdivision', 'section', 'category').prefetch_related('files').all()
-
-    def normalize_for_python(text: str) -> str:
-        if not text:
-            return ''
-        cleaned = strip_tags(text)
-        cleaned = cleaned.replace('\u00A0', ' ')
-        cleaned = ' '.join(cleaned.split())
-        return cleaned.casefold()
-
-    def python_matches(news_obj, tokens):
-        """Проверяем title, subdivision.name и все filename в news_obj.files"""
-        hay = []
-        hay.append((news_obj.title or '').casefold())
-        if news_obj.subdivision and getattr(news_obj.subdivision, 'name', None):
-            hay.append(str(news_obj.subdivision.name).casefold())
-        # добавляем все имена файлов
-        try:
-            for f in news_obj.files.all():
-                if getattr(f, 'filename', None):
-                    hay.append(str(f.filename).casefold())
-        except Exception:
-            pass
-        big = "\n".join(hay)
-        return all(tok in big for tok in tokens)
-
-    news_list = base_qs
-
-    if query:
-        # токенизация (удаляем пустые токены)
-        tokens = [t for t in re.split(r'[\s,;:.!?\"«»()\-]+', query) if t]
-
-        def build_q_for_tokens(tok_list):
-            q_obj = Q()
-            for tok in tok_list:
-                tok_q = (
-                    Q(title__icontains=tok) |
-                    Q(subdivision__name__icontains=tok) |
-                    Q(files__filename__icontains=tok)
+    per_page = 20
+    try:
+        page_number = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page_number = 1
+
+    base_qs = News.objects.select_related('subdivision', 'section', 'category').prefetch_related('files')
+
+    if query and search.is_available():
+        results_count, hits = search.search(
+            query,
+            section_slug=section_filter or None,
+            category_id=category_filter or None,
+            limit=per_page,
+            offset=(page_number - 1) * per_page,
+        )
+        news_by_id = base_qs.in_bulk([news_id for news_id, _ in hits])
+        news_list = []
+        for news_id, snippet in hits:
+            news = news_by_id.get(news_id)
+            if news is not None:
+                news.search_snippet = snippet
+                news_list.append(news)
+    else:
+        news_list = base_qs.all()
+        if query:
+            tokens = search.tokenize(query)
+            for tok in tokens:
+                news_list = news_list.filter(
+                    Q(title_normalized__ncontains=tok) |
+                    Q(subdivision__name_normalized__ncontains=tok) |
+                    Q(files__filename_normalized__ncontains=tok)
                 )
-                q_obj &= tok_q
-            return q_obj
-
-        sql_q = build_q_for_tokens(tokens)
-        filtered_qs = base_qs.filter(sql_q).distinct()
-
-        # Если SQL ничего не дал — делаем fallback (берём последние N записей)
-        if not filtered_qs.exists():
-            candidates = list(base_qs.order_by('-created_at')[:2000])
-        else:
-            candidates = list(filtered_qs[:2000])
-
-        normalized_tokens = [t.casefold() for t in tokens]
-        results = [obj for obj in candidates if python_matches(obj, normalized_tokens)]
-
-        news_list = results
-
-    # Применяем фильтры section/category (они не участвуют в текстовом поиске)
-    if section_filter:
-        if isinstance(news_list, list):
-            news_list = [n for n in news_list if n.section and n.section.slug == section_filter]
-        else:
+            news_list = news_list.distinct()
+        if section_filter:
             news_list = news_list.filter(section__slug=section_filter)
-    if category_filter:
-        if isinstance(news_list, list):
-            news_list = [n for n in news_list if n.category and str(n.category.id) == str(category_filter)]
-        else:
+        if category_filter:
             news_list = news_list.filter(category__id=category_filter)
+        results_count = news_list.count()
+        news_list = news_list[(page_number - 1) * per_page:page_number * per_page]
+
+    num_pages = max((results_count + per_page - 1) // per_page, 1)
 
     sections = Section.objects.all()
     categories = Category.objects.all()
@@ -243,8 +237,6 @@ def search_news(request):
     selected_section = Section.objects.filter(slug=section_filter).first() if section_filter else None
     selected_category = Category.objects.filter(id=category_filter).first() if category_filter else None
 
-    ticker_quotes = get_ticker_quotes()
-
     context = {
         'news_list': news_list,
         'query': query,
@@ -254,8 +246,11 @@ def search_news(request):
         'categories': categories,
         'selected_section': selected_section,
         'selected_category': selected_category,
-        'ticker_quotes': ticker_quotes,
-        'results_count': (len(news_list) if isinstance(news_list, list) else news_list.count()),
+        'results_count': results_count,
+        'page_number': page_number,
+        'num_pages': num_pages,
+        'previous_page': page_number - 1 if page_number > 1 else None,
+        'next_page': page_number + 1 if page_number < num_pages else None,
     }
 
     return render(request, 'news_site/search_results.html', context)
@@ -286,26 +281,31 @@ def statistics_view(request):
         return filtered
     
     news_queryset = get_filtered_queryset(News.objects.all())
-    views_queryset = get_filtered_queryset(ViewStatistic.objects.all(), 'created_at')
-    downloads_queryset = get_filtered_queryset(DownloadStatistic.objects.all(), 'downloaded_at')
+    files_queryset = get_filtered_queryset(NewsFile.objects.all())
     
-    unique_users = get_filtered_queryset(ViewStatistic.objects.all(), 'created_at').values('ip_address').distinct().count()
+    def count_by(queryset, field):
+        """{значение field: число строк} одним GROUP BY"""
+        return dict(queryset.values_list(field).annotate(n=Count('id')).order_by())
     
-    total_news_period = news_queryset.count()
-    total_views_period = views_queryset.count()
-    total_downloads_period = downloads_queryset.count()
+    # Подразделения в порядке отображения; статистика строится по счетчикам {subdivision_id: n}
+    subdivision_names = dict(Subdivision.objects.values_list('id', 'name'))
     
-    # Статистика по подразделениям
-    subdivision_stats = {}
-    all_subdivisions = Subdivision.objects.all()
+    def get_subdivision_stats(counts):
+        stats = {name: counts[sub_id] for sub_id, name in subdivision_names.items() if counts.get(sub_id)}
+        # Сортируем по количеству новостей (убывание)
+        return dict(sorted(stats.items(), key=lambda x: x[1], reverse=True))
+    
+    # Оценка по HyperLogLog-скетчам; exact_unique=1 - точный подсчет для сверки
+    exact_unique = request.GET.get('exact_unique') == '1'
+    unique_users = count_unique_visitors(start_date, end_date, exact=exact_unique)
     
-    for subdivision in all_subdivisions:
-        subdivision_news_count = news_queryset.filter(subdivision=subdivision).count()
-        if subdivision_news_count > 0:
-            subdivision_stats[subdivision.name] = subdivision_news_count
+    news_by_subdivision = count_by(news_queryset, 'subdivision_id')
+    total_news_period = sum(news_by_subdivision.values())
+    total_views_period = count_views(start_date, end_date)
+    total_downloads_period = count_downloads(start_date, end_date)
     
-    # Сортируем по количеству новостей (убывание)
-    subdivision_stats = dict(sorted(subdivision_stats.items(), key=lambda x: x[1], reverse=True))
+    # Статистика по подразделениям
+    subdivision_stats = get_subdivision_stats(news_by_subdivision)
     
     all_sections = Section.objects.all()
     
@@ -316,9 +316,14 @@ def statistics_view(request):
     if selected_section_id:
         selected_section = get_object_or_404(Section, id=selected_section_id)
         
-        def get_categories_with_paths(section, parent=None, path=""):
+        # Все категории раздела одним запросом, обход дерева - в памяти
+        section_tree = defaultdict(list)
+        for category in Category.objects.filter(section=selected_section).order_by('title'):
+            section_tree[category.parent_id].append(category)
+
+        def get_categories_with_paths(parent=None, path=""):
             categories = []
-            for category in Category.objects.filter(section=section, parent=parent).order_by('title'):
+            for category in section_tree.get(parent.id if parent else None, []):
                 current_path = f"{path}/{category.title}" if path else category.title
                 categories.append({
                     'id': category.id,
@@ -326,114 +331,102 @@ def statistics_view(request):
                     'full_path': current_path,
                     'parent': parent
                 })
-                categories.extend(get_categories_with_paths(section, category, current_path))
+                categories.extend(get_categories_with_paths(category, current_path))
             return categories
         
-        section_categories = get_categories_with_paths(selected_section)
-        
-        def get_all_subcategory_ids(category_id):
-            category_ids = [category_id]
-            for child in Category.objects.filter(parent_id=category_id):
-                category_ids.extend(get_all_subcategory_ids(child.id))
-            return category_ids
+        section_categories = get_categories_with_paths()
         
         if analyze_type == 'section' or selected_category_id:
             if analyze_type == 'section':
                 target_name = selected_section.title
                 
-                target_news = news_queryset.filter(section=selected_section)
+                target_news_by_subdivision = count_by(news_queryset.filter(section=selected_section), 'subdivision_id')
+                
+                target_files = files_queryset.filter(news__section=selected_section).count()
+                
+                target_views = count_views(start_date, end_date, section=selected_section)
+                
+                target_downloads = count_downloads(start_date, end_date, news_file__news__section=selected_section)
                 
-                target_files = NewsFile.objects.filter(news__section=selected_section)
-                if start_date or end_date:
-                    target_files = get_filtered_queryset(target_files, 'created_at')
+                # Суточные скетчи раздела пишет rollup_unique вместе со скетчами всего сайта
+                target_unique = count_unique_visitors(start_date, end_date, section_id=selected_section.id, exact=exact_unique)
                 
-                target_views = views_queryset.filter(section=selected_section)
+                # Верхние категории раздела и все их поддеревья.
+                # Корень поддерева - первый id в tree_path ("/<root>/.../")
+                root_categories = list(Category.objects.filter(section=selected_section, parent__isnull=True))
+                root_of = {}
+                if root_categories:
+                    subtree_q = Q()
+                    for category in root_categories:
+                        subtree_q |= Category.subtree_q(category.tree_path)
+                    for cat_id, tree_path in Category.objects.filter(subtree_q).values_list('id', 'tree_path'):
+                        root_of[cat_id] = int(tree_path.split('/')[1])
+                subtree_ids = list(root_of)
                 
-                target_downloads = downloads_queryset.filter(news_file__news__section=selected_section)
+                # По одному GROUP BY на показатель, суммы по поддеревьям - в памяти
+                news_by_category = defaultdict(lambda: defaultdict(int))
+                for cat_id, sub_id, n in (news_queryset.filter(category__in=subtree_ids)
+                                          .values_list('category_id', 'subdivision_id')
+                                          .annotate(n=Count('id')).order_by()):
+                    news_by_category[root_of[cat_id]][sub_id] += n
                 
-                # Статистика по подразделениям для раздела
-                section_subdivision_stats = {}
-                for subdivision in all_subdivisions:
-                    subdivision_news_count = target_news.filter(subdivision=subdivision).count()
-                    if subdivision_news_count > 0:
-                        section_subdivision_stats[subdivision.name] = subdivision_news_count
+                def roll_up(counts):
+                    totals = defaultdict(int)
+                    for cat_id, n in counts.items():
+                        totals[root_of[cat_id]] += n
+                    return totals
                 
-                section_subdivision_stats = dict(sorted(section_subdivision_stats.items(), key=lambda x: x[1], reverse=True))
+                files_by_root = roll_up(count_by(files_queryset.filter(news__category__in=subtree_ids), 'news__category_id'))
+                views_by_root = roll_up(count_events_by('views', 'category_id', start_date, end_date, category__in=subtree_ids))
+                downloads_by_root = roll_up(count_events_by(
+                    'downloads', 'news_file__news__category_id', start_date, end_date,
+                    news_file__news__category__in=subtree_ids,
+                ))
                 
                 categories_stats = []
-                for category in Category.objects.filter(section=selected_section, parent__isnull=True):
-                    all_category_ids = get_all_subcategory_ids(category.id)
-                    
-                    cat_news = news_queryset.filter(category__in=all_category_ids)
-                    
-                    cat_files = NewsFile.objects.filter(news__category__in=all_category_ids)
-                    if start_date or end_date:
-                        cat_files = get_filtered_queryset(cat_files, 'created_at')
-                    
-                    cat_views = views_queryset.filter(category__in=all_category_ids)
-                    
-                    cat_downloads = downloads_queryset.filter(news_file__news__category__in=all_category_ids)
-                    
-                    # Статистика по подразделениям для категории
-                    category_subdivision_stats = {}
-                    for subdivision in all_subdivisions:
-                        subdivision_news_count = cat_news.filter(subdivision=subdivision).count()
-                        if subdivision_news_count > 0:
-                            category_subdivision_stats[subdivision.name] = subdivision_news_count
-                    
-                    category_subdivision_stats = dict(sorted(category_subdivision_stats.items(), key=lambda x: x[1], reverse=True))
-                    
+                for category in root_categories:
+                    cat_news = news_by_category[category.id]
                     categories_stats.append({
                         'id': category.id,
                         'title': category.title,
                         'full_path': category.get_full_path(),
-                        'news_count': cat_news.count(),
-                        'files_count': cat_files.count(),
-                        'views_count': cat_views.count(),
-                        'downloads_count': cat_downloads.count(),
-                        'subdivision_stats': category_subdivision_stats
+                        'news_count': sum(cat_news.values()),
+                        'files_count': files_by_root[category.id],
+                        'views_count': views_by_root[category.id],
+                        'downloads_count': downloads_by_root[category.id],
+                        'subdivision_stats': get_subdivision_stats(cat_news)
                     })
                 
                 analysis_results = {
                     'full_path': target_name,
-                    'total_news': target_news.count(),
-                    'total_files': target_files.count(),
-                    'total_views': target_views.count(),
-                    'total_downloads': target_downloads.count(),
-                    'subdivision_stats': section_subdivision_stats,
+                    'total_news': sum(target_news_by_subdivision.values()),
+                    'total_files': target_files,
+                    'total_views': target_views,
+                    'total_downloads': target_downloads,
+                    'total_unique': target_unique,
+                    'subdivision_stats': get_subdivision_stats(target_news_by_subdivision),
                     'categories_stats': categories_stats
                 }
                 
             elif selected_category_id:
                 selected_category = get_object_or_404(Category, id=selected_category_id)
-                all_category_ids = get_all_subcategory_ids(selected_category_id)
+                all_category_ids = selected_category.get_descendant_ids()
                 
-                target_news = news_queryset.filter(category__in=all_category_ids)
+                target_news_by_subdivision = count_by(news_queryset.filter(category__in=all_category_ids), 'subdivision_id')
                 
-                target_files = NewsFile.objects.filter(news__category__in=all_category_ids)
-                if start_date or end_date:
-                    target_files = get_filtered_queryset(target_files, 'created_at')
+                target_files = files_queryset.filter(news__category__in=all_category_ids).count()
                 
-                target_views = views_queryset.filter(category__in=all_category_ids)
+                target_views = count_views(start_date, end_date, category__in=all_category_ids)
                 
-                target_downloads = downloads_queryset.filter(news_file__news__category__in=all_category_ids)
-                
-                # Статистика по подразделениям для категории
-                category_subdivision_stats = {}
-                for subdivision in all_subdivisions:
-                    subdivision_news_count = target_news.filter(subdivision=subdivision).count()
-                    if subdivision_news_count > 0:
-                        category_subdivision_stats[subdivision.name] = subdivision_news_count
-                
-                category_subdivision_stats = dict(sorted(category_subdivision_stats.items(), key=lambda x: x[1], reverse=True))
+                target_downloads = count_downloads(start_date, end_date, news_file__news__category__in=all_category_ids)
                 
                 analysis_results = {
                     'full_path': selected_category.get_full_path(),
-                    'total_news': target_news.count(),
-                    'total_files': target_files.count(),
-                    'total_views': target_views.count(),
-                    'total_downloads': target_downloads.count(),
-                    'subdivision_stats': category_subdivision_stats,
+                    'total_news': sum(target_news_by_subdivision.values()),
+                    'total_files': target_files,
+                    'total_views': target_views,
+                    'total_downloads': target_downloads,
+                    'subdivision_stats': get_subdivision_stats(target_news_by_subdivision),
                     'categories_stats': None
                 }
     
@@ -441,6 +434,8 @@ def statistics_view(request):
         'start_date': start_date_str,
         'end_date': end_date_str,
         'unique_users': unique_users,
+        'exact_unique': exact_unique,
+        'unique_error_percent': round(STANDARD_ERROR * 2 * 100, 1),
         'total_news_period': total_news_period,
         'total_views_period': total_views_period,
         'total_downloads_period': total_downloads_period,
@@ -452,50 +447,57 @@ def statistics_view(request):
         'selected_section': selected_section,
         'section_categories': section_categories,
         'analysis_results': analysis_results,
-        'ticker_quotes': get_ticker_quotes(),
     }
     
     return render(request, 'news_site/statistics.html', context)
 
 
+# Сортировки страницы "Файлы CKEditor": параметр sort -> ORDER BY
+EDITOR_FILES_SORTS = {
+    'date': ('-modified_at', '-id'),
+    'date_asc': ('modified_at', 'id'),
+    'name': ('name', 'id'),
+    'name_desc': ('-name', '-id'),
+    'size': ('-size', '-id'),
+    'size_asc': ('size', 'id'),
+}
+EDITOR_FILES_PAGE_SIZE = 50
+
+
 @staff_member_required
 def ckeditor_files_view(request):
-    """Просмотр файлов, загруженных через CKEditor с рекурсивным поиском"""
-    ckeditor_upload_path = os.path.join(settings.MEDIA_ROOT, 'news_files/ckeditor_uploads/')
-    
-    def get_files_recursively(directory):
-        all_files = []
-        if os.path.exists(directory):
-            for item in os.listdir(directory):
-                item_path = os.path.join(directory, item)
-                if os.path.isfile(item_path):
-                    relative_path = os.path.relpath(item_path, settings.MEDIA_ROOT)
-                    file_url = os.path.join(settings.MEDIA_URL, relative_path)
-                    file_size = os.path.getsize(item_path)
-                    import datetime
-                    file_time = os.path.getctime(item_path)
-                    uploaded_time = datetime.datetime.fromtimestamp(file_time)
-                    
-                    all_files.append({
-                        'name': item,
-                        'path': item_path,
-                        'url': file_url,
-                        'size': file_size,
-                        'uploaded': uploaded_time,
-                        'relative_path': relative_path
-                    })
-                elif os.path.isdir(item_path):
-                    all_files.extend(get_files_recursively(item_path))
-        return all_files
-    
-    files = get_files_recursively(ckeditor_upload_path)
-    files.sort(key=lambda x: x['uploaded'], reverse=True)
-    
+    """Файлы, загруженные через CKEditor: страница индекса EditorUpload (см. editor_files.py)"""
+    if request.method == 'POST':
+        stats = editor_files.scan()
+        messages.success(
+            request,
+            f"Список обновлен: добавлено {stats['added']}, изменено {stats['updated']}, "
+            f"удалено {stats['removed']} (проверено каталогов: {stats['scanned']}, без изменений: {stats['skipped']})"
+        )
+        return redirect('news_site:ckeditor_files')
+    if not EditorUploadDirectory.objects.exists():
+        # Первое открытие после обновления: индекс еще не строился
+        editor_files.scan()
+
+    query = request.GET.get('q', '').strip()
+    sort = request.GET.get('sort')
+    if sort not in EDITOR_FILES_SORTS:
+        sort = 'date'
+
+    files = EditorUpload.objects.all()
+    if query:
+        files = files.filter(name_normalized__ncontains=query)
+    totals = files.aggregate(size=Sum('size'), images=Count('id', filter=Q(is_image=True)))
+    page = Paginator(files.order_by(*EDITOR_FILES_SORTS[sort]), EDITOR_FILES_PAGE_SIZE).get_page(request.GET.get('page'))
+
     context = {
         'title': 'Файлы CKEditor',
-        'files': files,
-        'media_url': settings.MEDIA_URL,
-        'ticker_quotes': get_ticker_quotes(),
+        'files': page,
+        'total_size': totals['size'] or 0,
+        'images_count': totals['images'],
+        'query': query,
+        'sort': sort,
+        'upload_root': editor_files.get_upload_root(),
     }
     return render(request, 'admin/news_site/ckeditor_files.html', context)
 
@@ -503,6 +505,10 @@ def ckeditor_files_view(request):
 @staff_member_required
 def delete_ckeditor_file(request):
     """Удаление файла CKEditor"""
+    back = request.POST.get('next', '')
+    if not back.startswith(reverse('news_site:ckeditor_files')):
+        back = reverse('news_site:ckeditor_files')
+
     if request.method == 'POST':
         filename = request.POST.get('filename')
         filepath = request.POST.get('filepath')
@@ -510,18 +516,42 @@ def delete_ckeditor_file(request):
         if filepath:
             file_path = os.path.join(settings.MEDIA_ROOT, filepath)
         elif filename:
-            file_path = os.path.join(settings.MEDIA_ROOT, 'news_files/ckeditor_uploads/', filename)
+            file_path = os.path.join(settings.MEDIA_ROOT, editor_files.get_upload_root(), filename)
         else:
             messages.error(request, 'Не указан файл для удаления')
-            return redirect('news_site:ckeditor_files')
+            return redirect(back)
+
+        # Удалять можно только загрузки CKEditor
+        upload_root = os.path.realpath(os.path.join(settings.MEDIA_ROOT, editor_files.get_upload_root()))
+        file_path = os.path.realpath(file_path)
+        if os.path.commonpath([upload_root, file_path]) != upload_root:
+            messages.error(request, 'Можно удалять только файлы CKEditor')
+            return redirect(back)
+        relative_path = os.path.relpath(file_path, os.path.realpath(settings.MEDIA_ROOT))
             
         try:
             if os.path.exists(file_path):
+                derivatives.remove(relative_path)
                 os.remove(file_path)
+                # Страницы и ETag ссылаются на удаленный файл и его копии
+                invalidate_content()
                 messages.success(request, f'Файл "{os.path.basename(file_path)}" успешно удален')
             else:
-                messages.error(request, f'Файл не найден: {file_path}')
+                messages.error(request, f'Файл не найден: {relative_path}')
+            editor_files.forget(relative_path)
         except Exception as e:
             messages.error(request, f'Ошибка при удалении файла: {str(e)}')
         
-    return redirect('news_site:ckeditor_files')
\ No newline at end of file
+    return redirect(back)
+
+
+@staff_member_required
+def system_stats(request):
+    """Счетчики кэша страниц и очереди статистики текущего воркера (JSON)"""
+    return JsonResponse({
+        'page_cache': {
+            **page_stats.as_dict(),
+            'content_version': get_version(CONTENT_VERSION),
+        },
+        'view_tracker': tracker.stats(),
+    })
@@ -30,9 +30,28 @@ ALLOWED_HOSTS = [h.strip() for h in raw_hosts.split(",") if h.strip()]
 
 # ⬇️ ДОБАВЛЕНО: Настройки для больших файлов (5GB)
 DATA_UPLOAD_MAX_MEMORY_SIZE = 5368709120  # 5GB в байтах
-FILE_UPLOAD_MAX_MEMORY_SIZE = 5368709120  # 5GB в байтах
+# Файлы больше 2.5MB из обычной формы пишутся во временный файл, а не в память
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2621440
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 5000      # Увеличиваем лимит полей
 
+# ⬇️ Загрузка вложений частями с докачкой (news_site/uploads.py)
+CHUNKED_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+# Каталог, из которого файлы можно импортировать в новость (news_site/ingest.py)
+UPLOAD_STAGING_DIR = BASE_DIR / 'data' / 'staging'
+
+# ⬇️ Буферизованная запись статистики просмотров (news_site/tracking.py)
+STATISTICS_TRACKING = {
+    'MAX_QUEUE_SIZE': int(os.getenv("STATISTICS_MAX_QUEUE_SIZE", "10000")),
+    'BATCH_SIZE': int(os.getenv("STATISTICS_BATCH_SIZE", "500")),
+    'FLUSH_INTERVAL': float(os.getenv("STATISTICS_FLUSH_INTERVAL", "5")),
+    'OVERFLOW_POLICY': 'drop_oldest',
+}
+
+# ⬇️ Хранение сырой статистики: строки старше срока уходят в архив
+# (news_site/archive.py, команда archive_statistics)
+STATISTICS_RETENTION_DAYS = int(os.getenv("STATISTICS_RETENTION_DAYS", "365"))
+STATISTICS_ARCHIVE_DIR = BASE_DIR / 'data' / 'archive'
+
 # ⬇️ ДОБАВЛЕНО: Настройки прав для файлов
 FILE_UPLOAD_PERMISSIONS = 0o644
 FILE_UPLOAD_DIRECTORY_PERMISSIONS = 0o755
@@ -72,6 +91,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'news_site.context_processors.ticker_quotes',
             ],
         },
     },
@@ -87,6 +107,21 @@ DATABASES = {
     }
 }
 
+# Общий для всех воркеров кэш (версии данных, см. news_site/versions.py,
+# и готовые страницы, см. news_site/pagecache.py)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'data' / 'cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    }
+}
+
+# Время жизни страницы в кэше, сек (0 - кэш страниц выключен)
+PAGE_CACHE_TIMEOUT = int(os.getenv("PAGE_CACHE_TIMEOUT", "600"))
+
 LANGUAGE_CODE = 'ru-ru'
 TIME_ZONE = 'Europe/Moscow'
 USE_I18N = True
@@ -96,15 +131,32 @@ USE_TZ = True
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [BASE_DIR / 'news_site' / 'static']
 STATIC_ROOT = BASE_DIR / 'data' / 'staticfiles'
+# ⬇️ collectstatic пишет имена с хешем содержимого и сжатые копии .gz
+# (news_site/storage.py); nginx отдает их через gzip_static и кэширует навсегда
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'news_site.storage.CompressedManifestStaticFilesStorage'},
+}
 
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'data' / 'media'
 
+# Отдача вложений новостей (news_site/downloads.py):
+# 'accel' - через nginx (X-Accel-Redirect), 'django' - FileResponse с Range,
+# 'redirect' - редирект на /media/
+DOWNLOAD_SERVE_MODE = os.getenv("DOWNLOAD_SERVE_MODE", "django" if DEBUG else "accel")
+# internal-локация nginx, указывающая на MEDIA_ROOT (см. nginx/nginx.conf)
+DOWNLOAD_ACCEL_PREFIX = '/protected-media/'
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # CKEditor settings
 CKEDITOR_UPLOAD_PATH = "news_files/ckeditor_uploads/"
+# Загрузки записываются в индекс страницы "Файлы CKEditor" (news_site/editor_files.py)
+CKEDITOR_STORAGE_BACKEND = "news_site.editor_files.EditorStorage"
+# ⬇️ Ширины уменьшенных копий картинок CKEditor для srcset (news_site/derivatives.py)
+CKEDITOR_DERIVATIVE_WIDTHS = (480, 960, 1600)
 CKEDITOR_CONFIGS = {
     'default': {
         'toolbar': 'Custom',
@@ -28,6 +28,8 @@ services:
       - ./backend/rbdnti/data/db:/app/rbdnti/data/db
       - ./backend/rbdnti/data/media:/app/rbdnti/data/media
       - ./backend/rbdnti/data/staticfiles:/app/rbdnti/data/staticfiles
+      - ./backend/rbdnti/data/archive:/app/rbdnti/data/archive
+      - ./backend/rbdnti/data/staging:/app/rbdnti/data/staging
     ports:
       - "8000:8000"
   nginx:
@@ -47,7 +49,7 @@ info "Generated $DEV_COMPOSE"
 }
 
 ensure_data_dirs(){
-  mkdir -p "$RBDNTI/data/db" "$RBDNTI/data/media" "$RBDNTI/data/staticfiles"
+  mkdir -p "$RBDNTI/data/db" "$RBDNTI/data/media" "$RBDNTI/data/staticfiles" "$RBDNTI/data/archive" "$RBDNTI/data/staging"
 }
 
 is_running(){
@@ -209,6 +211,8 @@ services:
       - ./data/db:/app/rbdnti/data/db
       - ./data/media:/app/rbdnti/data/media
       - ./data/staticfiles:/app/rbdnti/data/staticfiles
+      - ./data/archive:/app/rbdnti/data/archive
+      - ./data/staging:/app/rbdnti/data/staging
     ports:
       - "8000:8000"
   nginx:
@@ -235,8 +239,8 @@ echo "Loading images..."
 docker load -i web.tar
 docker load -i nginx.tar
 echo "Creating data dirs..."
-mkdir -p data/db data/media data/staticfiles
-chmod 755 data/db data/media data/staticfiles || true
+mkdir -p data/db data/media data/staticfiles data/archive data/staging
+chmod 755 data/db data/media data/staticfiles data/archive data/staging || true
 echo "Starting services..."
 docker compose up -d
 sleep 8